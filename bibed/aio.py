@@ -0,0 +1,230 @@
+
+import asyncio
+import logging
+import functools
+import threading
+import concurrent.futures
+
+from bibed.foundations import Singleton
+from bibed.parallel import executor
+from bibed.gtk import GLib
+
+try:
+    # PyGObject ≥ 3.50 runs asyncio inside the GLib main loop.
+    from gi.events import GLibEventLoopPolicy
+
+except ImportError:
+    GLibEventLoopPolicy = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BibedAsyncTask:
+    ''' A coroutine spawned with :meth:`BibedAsyncBridge.spawn`.
+
+        When the coroutine finishes, `on_done` gets its result and
+        `on_error` its exception, in the main loop. Cancellation is
+        not an error: no callback runs.
+    '''
+
+    def __init__(self, coro, future, owner=None, on_done=None, on_error=None):  # NOQA
+
+        self.name = coro.__qualname__
+        self.future = future
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.owner = owner
+        self.owner_handler = None
+
+        if owner is not None:
+            # Tie the coroutine to the window / dialog lifetime.
+            self.owner_handler = owner.connect(
+                'destroy', self.on_owner_destroy)
+
+        future.add_done_callback(self.on_future_done)
+
+    def __str__(self):
+
+        return 'BibedAsyncTask({}{})'.format(
+            self.name, ', cancelled' if self.cancelled() else '')
+
+    def cancel(self):
+
+        return self.future.cancel()
+
+    def cancelled(self):
+
+        return self.future.cancelled()
+
+    def done(self):
+
+        return self.future.done()
+
+    def on_owner_destroy(self, owner):
+
+        self.owner_handler = None
+
+        if self.cancel():
+            LOGGER.debug('{} cancelled with {}.'.format(self, owner))
+
+    def on_future_done(self, future):
+        ''' Run in the asyncio loop thread. '''
+
+        GLib.idle_add(self.__finish, future)
+
+    def __finish(self, future):
+
+        if self.owner_handler is not None:
+            self.owner.disconnect(self.owner_handler)
+            self.owner_handler = None
+
+        self.owner = None
+
+        if future.cancelled():
+            LOGGER.debug('{} cancelled.'.format(self))
+
+        elif future.exception() is not None:
+            exception = future.exception()
+
+            if self.on_error is None:
+                LOGGER.error('{} failed.'.format(self), exc_info=exception)
+
+            else:
+                self.on_error(exception)
+
+        elif self.on_done is not None:
+            self.on_done(future.result())
+
+        # Remove from idle callbacks.
+        return False
+
+
+class BibedAsyncBridge(metaclass=Singleton):
+    ''' Run asyncio coroutines alongside the GLib main loop.
+
+        With PyGObject ≥ 3.50, the asyncio loop *is* the GLib main
+        loop, and coroutines run in the main thread. Older versions
+        get a private asyncio loop in a daemon thread: coroutines
+        must then go through :func:`in_main_loop` to touch GTK
+        objects, stores included.
+    '''
+
+    def __init__(self):
+
+        self.loop = None
+        self.thread = None
+
+        # Not-done BibedAsyncTask, for shutdown.
+        self.tasks = set()
+
+    @property
+    def integrated(self):
+
+        return self.thread is None
+
+    def setup(self):
+
+        if self.loop is not None:
+            return
+
+        if GLibEventLoopPolicy is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(
+                target=self.loop.run_forever,
+                name='bibed-asyncio', daemon=True)
+            self.thread.start()
+
+        else:
+            policy = GLibEventLoopPolicy()
+            asyncio.set_event_loop_policy(policy)
+            self.loop = policy.get_event_loop()
+
+        LOGGER.debug('asyncio loop ready ({}).'.format(
+            'in GLib main loop' if self.integrated else 'in a thread'))
+
+    def spawn(self, coro, owner=None, on_done=None, on_error=None):
+        ''' Schedule `coro` and return a :class:`BibedAsyncTask`.
+
+            :param owner: a :class:`Gtk.Widget`. The coroutine is
+                cancelled when it gets destroyed.
+        '''
+
+        self.setup()
+
+        if self.integrated:
+            future = self.loop.create_task(coro)
+
+        else:
+            future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+        task = BibedAsyncTask(coro, future, owner, on_done, on_error)
+
+        self.tasks.add(task)
+        future.add_done_callback(lambda future: self.tasks.discard(task))
+
+        return task
+
+    def shutdown(self):
+        ''' Cancel pending coroutines. Writes are not coroutines but
+            executor functions; they are waited for by the executor. '''
+
+        if self.loop is None:
+            return
+
+        for task in list(self.tasks):
+            task.cancel()
+
+        if not self.integrated:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+
+        self.loop = None
+
+
+aio = BibedAsyncBridge()
+
+
+def spawn(coro, owner=None, on_done=None, on_error=None):
+
+    return aio.spawn(coro, owner=owner, on_done=on_done, on_error=on_error)
+
+
+# ————————————————————————————————————————————————————————————————————— Helpers
+
+
+async def run_in_executor(func, *args, **kwargs):
+    ''' Await `func(*args, **kwargs)`, run in the executor threads.
+
+        For blocking file I/O. Cancelling the awaiting coroutine does
+        not stop a function already running.
+    '''
+
+    return await asyncio.get_running_loop().run_in_executor(
+        executor.threads, functools.partial(func, *args, **kwargs))
+
+
+async def in_main_loop(func, *args, **kwargs):
+    ''' Await `func(*args, **kwargs)`, run in the GLib main loop. '''
+
+    if threading.current_thread() is threading.main_thread():
+        return func(*args, **kwargs)
+
+    future = concurrent.futures.Future()
+
+    def run_and_set():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(func(*args, **kwargs))
+
+            except Exception as exception:
+                future.set_exception(exception)
+
+        # Remove from idle callbacks.
+        return False
+
+    GLib.idle_add(run_and_set)
+
+    return await asyncio.wrap_future(future)
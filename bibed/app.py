@@ -1,5 +1,6 @@
 
 import os
+import asyncio
 import logging
 import time
 
@@ -15,16 +16,18 @@ from bibed.constants import (
     APP_VERSION,
     APP_MENU_XML,
     BibAttrs,
-    SEARCH_SPECIALS,
     BIBTEXPARSER_VERSION,
+    QUIT_DRAIN_TIMEOUT,
 )
 
-from bibed.decorators import wait_for_queued_events
+from bibed.scheduler import scheduler
 from bibed.foundations import Anything
 from bibed.system import set_program_name_global
 from bibed.system import touch_file
-from bibed.strings import to_lower_if_not_none, seconds_to_string
-from bibed.parallel import run_and_wait_on
+from bibed.strings import seconds_to_string
+from bibed.parallel import executor, run_and_wait_on
+from bibed.aio import aio, in_main_loop
+from bibed.query import BibedQueryPlan
 from bibed.locale import _, NO_
 
 # Import Gtk before preferences, to initialize GI.
@@ -118,6 +121,18 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
         # This must be done after the data store has loaded.
         self.files.load_system_files()
 
+        # Compiled search query and its results.
+        self.filter_plan = None
+        self.filter_result = None
+
+        self.setup_filter_models()
+
+        self.data.connect('bulk-load-start', self.on_data_bulk_load_start)
+        self.data.connect('bulk-load-end', self.on_data_bulk_load_end)
+
+    def setup_filter_models(self):
+        ''' (Re-)Create the filter and sorter models over the data store. '''
+
         # Keep the filter data sortable along the way.
         self.filter = self.data.filter_new()
         # self.filter = Gtk.TreeModelFilter(self.data)
@@ -126,82 +141,86 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
 
     # ——————————————————————————————————————————————————————— data store filter
 
-    def data_filter_method(self, model, iter, data):
+    def data_filter_prepare(self, filter_text, databases_ids):
+        ''' Compile the search query and run it on the search index.
 
-        # a local reference for faster access.
-        matched_databases = self.window.matched_databases
+            Must be called before refiltering, for
+            :meth:`data_filter_method` to use the new results.
+        '''
 
-        try:
-            filter_text = self.window.search.get_text()
+        filter_text = filter_text.strip()
 
-        except AttributeError:
-            # The window is not yet constructed
-            return True
+        if self.filter_plan is None or self.filter_plan.text != filter_text:
+            self.filter_plan = BibedQueryPlan(filter_text)
 
-        row = model[iter]
+            LOGGER.debug('Compiled search “{}” into {}.'.format(
+                         filter_text, self.filter_plan))
+
+        if self.filter_plan:
+            self.filter_result = self.filter_plan.execute(
+                self.data.index, databases_ids)
+
+        else:
+            self.filter_result = None
+
+    def data_filter_method(self, model, iter, data):
 
         try:
+            # a local reference for faster access.
+            matched_databases = self.window.matched_databases
+
             selected_databases_ids = \
                 self.window.get_selected_databases(only_ids=True)
 
-        except TypeError:
+        except AttributeError:
             # The window is not yet constructed.
             return True
 
-        else:
-            if not selected_databases_ids:
-                # No data should match when no file is selected.
-                return False
+        if not selected_databases_ids:
+            # No data should match when no file is selected.
+            return False
+
+        row_dbid = model.get_value(iter, BibAttrs.DBID)
+
+        if row_dbid not in selected_databases_ids:
+            # The current row is not part of displayed
+            # files. No need to go further.
+            return False
+
+        filter_result = self.filter_result
 
-            elif row[BibAttrs.DBID] not in selected_databases_ids:
-                # The current row is not part of displayed
-                # files. No need to go further.
+        if filter_result is not None:
+            if model.get_value(iter, BibAttrs.HANDLE) not in filter_result:
                 return False
 
-        if filter_text is None:
-            matched_databases.add(row[BibAttrs.DBID])
-            return True
+        matched_databases.add(row_dbid)
+        return True
 
-        filter_text = filter_text.strip().lower()
+    def on_data_bulk_load_start(self, data_store):
+        ''' Detach the view and drop filter models, for them not to
+            process every inserted row. '''
 
-        if not filter_text:
-            return True
+        if self.window is not None:
+            self.window.treeview.set_model(None)
 
-        words = filter_text.split()
+        self.filter = None
+        self.sorter_sort_column = self.sorter.get_sort_column_id()
+        self.sorter = None
 
-        specials = []
-        full_text = []
+    def on_data_bulk_load_end(self, data_store, detached):
 
-        for word in words:
-            if ':' in word:
-                specials.append([x.lower() for x in word.split(':')])
-            else:
-                full_text.append(word)
-
-        for key, val in specials:
-            for char, index, label in SEARCH_SPECIALS:
-                if key == char:
-                    if val not in row[index].lower():
-                        return False
-
-        # TODO: unaccented / delocalized search.
-
-        model_full_text_data = [
-            to_lower_if_not_none(row[BibAttrs.AUTHOR]),
-            to_lower_if_not_none(row[BibAttrs.TITLE]),
-            to_lower_if_not_none(row[BibAttrs.IN_OR_BY]),
-            to_lower_if_not_none(row[BibAttrs.SUBTITLE]),
-            to_lower_if_not_none(row[BibAttrs.COMMENT]),
-            to_lower_if_not_none(row[BibAttrs.ABSTRACT]),
-            to_lower_if_not_none(row[BibAttrs.KEYWORDS]),
-        ]
+        if detached:
+            self.setup_filter_models()
 
-        for word in full_text:
-            if word not in ' '.join(model_full_text_data):
-                return False
+            sort_column_id, sort_order = self.sorter_sort_column
 
-        matched_databases.add(row[BibAttrs.DBID])
-        return True
+            if sort_column_id is not None:
+                self.sorter.set_sort_column_id(sort_column_id, sort_order)
+
+        if self.window is not None:
+            # Re-attaches the sorter to the view if
+            # detached, and refilters once.
+            self.window.do_filter_data_store()
 
     # ———————————————————————————————————————————————————————————— do “actions”
 
@@ -211,6 +230,8 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
         # Comes from GtkCssAwareMixin.
         self.setup_resources_and_css()
 
+        aio.setup()
+
         self.setup_actions()
         self.setup_app_menu()
 
@@ -329,10 +350,12 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
         # because in some corner cases the live “re-ordering”
         # makes a file loaded two times.
 
-        with self.window.block_signals():
+        with self.window.block_signals(), self.data.bulk_load():
             # We need to block signals and let win.do_activate()
             # Update everything, else some on_*_changed() signals
             # are not fired. Don't know if it's a Gtk or pgi bug.
+            # All files are bulk-loaded at once, the view is refiltered
+            # only when the last one is loaded.
 
             for filename in memories.open_files.copy():
 
@@ -393,6 +416,9 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
         # not necessary anymore.
         del self.session
 
+        # Entries loaded at startup live long, spare them to collections.
+        self.data.gc_freeze()
+
     # ———————————————————————————————————————————— higher level file operations
 
     def create_file(self, filename):
@@ -404,8 +430,13 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
 
         self.open_file(filename)
 
-    def open_file(self, filename, select=True):
-        ''' Add a file to the application. '''
+    def open_file(self, filename, select=True, parsed=None):
+        ''' Add a file to the application.
+
+            :param parsed: the result of
+                :meth:`~bibed.store.BibedFileStore.parse_async` for
+                `filename`, or the exception it raised.
+        '''
 
         # assert lprint_function_name()
         # assert lprint(filename)
@@ -414,8 +445,11 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
         filename = os.path.realpath(os.path.abspath(filename))
 
         try:
+            if isinstance(parsed, Exception):
+                raise parsed
+
             # Note: via events, this will update the window title.
-            database = self.files.load(filename)
+            database = self.files.load(filename, parsed=parsed)
 
         except AlreadyLoadedException:
             self.do_notification(
@@ -437,6 +471,79 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
         # Needed for correct session reload.
         return database
 
+    async def open_files_async(self, filenames):
+        ''' Parse and index `filenames` in the worker process, then add
+            them to the application at once. Returns the databases.
+
+            The worker parses files one after the other, not in
+            parallel: this only keeps the main loop responsive. '''
+
+        filenames = [
+            os.path.realpath(os.path.abspath(filename))
+            for filename in filenames
+        ]
+
+        parsed = await asyncio.gather(*(
+            self.files.parse_async(filename)
+            for filename in filenames
+        ), return_exceptions=True)
+
+        return await in_main_loop(self.open_parsed_files, filenames, parsed)
+
+    def open_parsed_files(self, filenames, parsed):
+
+        databases = []
+
+        # Same problem as in do_activate(): when loading more than two
+        # files, only the two first fire a on_*changed() signal. Thus we
+        # block everything, and let the caller compute things after load.
+        with self.window.block_signals():
+            for filename, result in zip(filenames, parsed):
+                database = self.open_file(filename, select=False,
+                                          parsed=result)
+
+                if database is not None:
+                    databases.append(database)
+
+        return databases
+
+    async def reload_databases_async(self, message=None):
+        ''' Same as :meth:`reload_databases`, parsing and indexing files
+            in the worker process. '''
+
+        databases = await in_main_loop(
+            lambda: tuple(self.files.user_databases))
+
+        parsed = await asyncio.gather(*(
+            self.files.parse_async(database.filename, database.filetype)
+            for database in databases
+        ))
+
+        await in_main_loop(self.reload_parsed_databases,
+                           databases, parsed, message)
+
+    def reload_parsed_databases(self, databases, parsed, message=None):
+
+        with self.window.block_signals():
+            for database, result in zip(databases, parsed):
+                if not self.files.has(database.filename):
+                    # Closed while it was parsed.
+                    continue
+
+                self.files.reload(database, parsed=result)
+
+        if message:
+            self.window.do_status_change(message)
+
+    async def save_databases_async(self, databases):
+        ''' Write `databases` now, concurrently, bypassing
+            their write delay. '''
+
+        await asyncio.gather(*(
+            self.files.write_async(database)
+            for database in databases
+        ))
+
     def reload_databases(self, message=None):
 
         # assert lprint_function_name()
@@ -462,6 +569,10 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
 
         # assert lprint_function_name()
 
+        if database.write_pending:
+            # Do not lose changes made just before closing.
+            database.write_now()
+
         self.files.close(database,
                          save_before=save_before,
                          remember_close=remember_close)
@@ -563,6 +674,11 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
         # finish empty When last file has been closed.
         self.window.block_signals()
 
+        drain_start = time.monotonic()
+
+        # Before closing files, which cancels their pending writes.
+        scheduler.drain(QUIT_DRAIN_TIMEOUT)
+
         # This will close system files too.
         self.files.close_all(
 
@@ -573,7 +689,19 @@ class BibedApplication(Gtk.Application, GtkCssAwareMixin, BibedDaemonMixin):
             remember_close=False,
         )
 
-        wait_for_queued_events()
+        # Tasks scheduled while closing files.
+        scheduler.drain(max(
+            0, QUIT_DRAIN_TIMEOUT - (time.monotonic() - drain_start) * 1000))
+
+        aio.shutdown()
+
+        # Drained writes run in the executor, they
+        # get what remains of the drain delay.
+        executor.shutdown(timeout=max(
+            0, QUIT_DRAIN_TIMEOUT - (time.monotonic() - drain_start) * 1000))
+
+        # After the executor: writes serialize in the worker.
+        self.daemon_quit()
 
         self.quit()
 
@@ -0,0 +1,653 @@
+
+import os
+import json
+import zlib
+import hashlib
+import logging
+import datetime
+import threading
+
+try:
+    import fcntl
+
+except ImportError:
+    fcntl = None
+
+from bibed.system import bytes_digest
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Hidden folder next to libraries, holding their backups.
+BACKUP_DIR_NAME = '.bibed_save'
+
+# In BACKUP_DIR_NAME, locked while a process uses the folder.
+LOCK_FILE_NAME = 'lock'
+
+# In BACKUP_DIR_NAME, chunks references counts of all its snapshots.
+REFCOUNTS_FILE_NAME = 'chunks.json'
+
+# Expressed in bytes, the raw size of a chunk digest.
+CHUNK_DIGEST_SIZE = 20
+
+# Entries start at the beginning of a line.
+ENTRY_SEPARATOR = b'\n@'
+
+# Average number of entries per chunk. Files of one
+# entry each would waste most of their disk blocks.
+CHUNK_ENTRIES = 32
+
+# Expressed in bytes, the size past which a chunk ends anyway.
+CHUNK_MAX_SIZE = 65536
+
+# All stores of a folder share its chunks: they must not
+# collect garbage while another one adds a snapshot.
+DIRECTORIES_LOCKS = {}
+DIRECTORIES_LOCKS_LOCK = threading.Lock()
+
+
+class DirectoryLock:
+    ''' Lock a backup folder against other threads, and against other
+        processes (the worker, another Bibed) with an advisory lock on
+        its :data:`LOCK_FILE_NAME` file, where `fcntl` is available.
+
+        A folder that does not exist yet holds nothing to protect: only
+        the threads lock is taken.
+    '''
+
+    def __init__(self, directory):
+
+        self.filename = os.path.join(directory, LOCK_FILE_NAME)
+        self.lock = threading.Lock()
+        self.file = None
+
+    def __enter__(self):
+
+        self.lock.acquire()
+
+        if fcntl is None:
+            return self
+
+        try:
+            self.file = open(self.filename, 'a')
+
+        except FileNotFoundError:
+            return self
+
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+
+        except Exception:
+            self.release()
+            raise
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.release()
+
+    def release(self):
+
+        if self.file is not None:
+            # Closing releases the lock.
+            self.file.close()
+            self.file = None
+
+        self.lock.release()
+
+
+def directory_lock(directory):
+
+    with DIRECTORIES_LOCKS_LOCK:
+        try:
+            return DIRECTORIES_LOCKS[directory]
+
+        except KeyError:
+            lock = DIRECTORIES_LOCKS[directory] = DirectoryLock(directory)
+            return lock
+
+
+def split_entries(data):
+    ''' Split BibTeX `data` (bytes) at entries starts.
+        ``b''.join(split_entries(data)) == data``. '''
+
+    pieces = data.split(ENTRY_SEPARATOR)
+
+    entries = [piece + b'\n' for piece in pieces[:-1]]
+    entries.append(pieces[-1])
+
+    for index in range(1, len(entries)):
+        entries[index] = b'@' + entries[index]
+
+    return entries
+
+
+def split_chunks(data):
+    ''' Split BibTeX `data` (bytes) into content-defined chunks of
+        :data:`CHUNK_ENTRIES` entries on average.
+
+        A chunk ends after an entry whose checksum is a multiple of
+        :data:`CHUNK_ENTRIES`, or past :data:`CHUNK_MAX_SIZE`. Editing
+        an entry thus changes only its chunk, and inserting one does not
+        shift the others. ``b''.join(split_chunks(data)) == data``.
+    '''
+
+    chunk = []
+    size = 0
+
+    for entry in split_entries(data):
+        chunk.append(entry)
+        size += len(entry)
+
+        if size >= CHUNK_MAX_SIZE or zlib.crc32(entry) % CHUNK_ENTRIES == 0:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield b''.join(chunk)
+
+
+def chunk_digest(chunk):
+
+    return hashlib.blake2b(chunk, digest_size=CHUNK_DIGEST_SIZE).digest()
+
+
+def write_atomically(filename, data):
+
+    temporary = filename + '.new'
+
+    with open(temporary, 'wb') as file_:
+        file_.write(data)
+
+    os.replace(temporary, filename)
+
+
+def file_signature(filename):
+    ''' Return what changes when `filename` is replaced or rewritten,
+        for caches of files that other processes write. '''
+
+    try:
+        stat = os.stat(filename)
+
+    except FileNotFoundError:
+        return None
+
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class BibedBackupStore:
+    ''' Backups of one library file, kept in :data:`BACKUP_DIR_NAME`
+        next to it as deduplicated, compressed snapshots.
+
+        - `chunks/<xx>/<digest>`: zlib-compressed chunks of a few
+          entries (see :func:`split_chunks`), named by their digest and
+          shared by all snapshots of all libraries of the folder. A save
+          writes only chunks not already there.
+        - :data:`REFCOUNTS_FILE_NAME`: for each chunk, the number of
+          snapshots of the folder using it. A chunk is deleted when its
+          count drops to zero.
+        - `snapshots/<name>.<id>.snap`: one per snapshot, the zlib
+          compressed concatenation of its chunks raw digests.
+        - `<name>.json`: the index of the library snapshots, oldest
+          first, each a dict with `id`, `time` (ISO 8601), `size` and
+          `digest` (of the whole content) keys.
+
+        `<name>` is the library file basename. Saving and pruning read
+        the index, the reference counts and the pruned snapshots only.
+    '''
+
+    def __init__(self, filename):
+
+        self.filename = filename
+
+        dirname, self.name = os.path.split(filename)
+
+        self.directory = os.path.join(dirname, BACKUP_DIR_NAME)
+        self.chunks_directory = os.path.join(self.directory, 'chunks')
+        self.snapshots_directory = os.path.join(self.directory, 'snapshots')
+        self.index_filename = os.path.join(
+            self.directory, '{}.json'.format(self.name))
+        self.refcounts_filename = os.path.join(
+            self.directory, REFCOUNTS_FILE_NAME)
+
+        # Loaded on first use, and again when another
+        # process changed the file (see `file_signature()`).
+        self.snapshots = None
+        self.snapshots_signature = None
+        self.refcounts = None
+        self.refcounts_signature = None
+
+        self.lock = directory_lock(self.directory)
+
+    def __str__(self):
+
+        return 'BibedBackupStore({})'.format(self.filename)
+
+    def __len__(self):
+
+        with self.lock:
+            return len(self.get_snapshots())
+
+    def __iter__(self):
+        ''' Iterate snapshots, oldest first. '''
+
+        with self.lock:
+            snapshots = self.get_snapshots()[:]
+
+        return iter(snapshots)
+
+    # ——————————————————————————————————————————————————————————————— Paths
+
+    def chunk_path(self, digest):
+
+        hexdigest = digest.hex()
+
+        return os.path.join(self.chunks_directory, hexdigest[:2], hexdigest)
+
+    def snapshot_path(self, snapshot_id):
+
+        return os.path.join(
+            self.snapshots_directory,
+            '{}.{}.snap'.format(self.name, snapshot_id))
+
+    # ——————————————————————————————————————————————————————————————— Index
+
+    def get_snapshots(self):
+        ''' Called with `lock` held. '''
+
+        signature = file_signature(self.index_filename)
+
+        if self.snapshots is None or signature != self.snapshots_signature:
+            self.snapshots_signature = signature
+
+            try:
+                with open(self.index_filename, 'r') as index:
+                    self.snapshots = json.load(index)
+
+            except FileNotFoundError:
+                self.snapshots = []
+                self.migrate()
+
+            except ValueError:
+                LOGGER.exception('{}: unreadable index, starting '
+                                 'a new one.'.format(self))
+                self.snapshots = []
+
+        return self.snapshots
+
+    def save_index(self):
+        ''' Called with `lock` held. '''
+
+        write_atomically(self.index_filename,
+                         json.dumps(self.snapshots, indent=1).encode())
+
+        self.snapshots_signature = file_signature(self.index_filename)
+
+    # ——————————————————————————————————————————————————————————————— Refcounts
+
+    def get_refcounts(self):
+        ''' Return the `{chunk hex digest: snapshots count}` dict of the
+            folder. Called with `lock` held. '''
+
+        signature = file_signature(self.refcounts_filename)
+
+        if self.refcounts is None or signature != self.refcounts_signature:
+            self.refcounts_signature = signature
+
+            try:
+                with open(self.refcounts_filename, 'r') as refcounts:
+                    self.refcounts = json.load(refcounts)
+
+            except FileNotFoundError:
+                self.refcounts = self.count_references()
+
+            except ValueError:
+                LOGGER.exception('{}: unreadable reference counts, '
+                                 'counting again.'.format(self))
+                self.refcounts = self.count_references()
+
+        return self.refcounts
+
+    def save_refcounts(self):
+        ''' Called with `lock` held. '''
+
+        write_atomically(self.refcounts_filename,
+                         json.dumps(self.refcounts).encode())
+
+        self.refcounts_signature = file_signature(self.refcounts_filename)
+
+    def count_references(self):
+        ''' Count chunks references of all snapshot files of the folder.
+            Only needed when the reference counts file is lost. '''
+
+        refcounts = {}
+
+        try:
+            snapshot_files = os.listdir(self.snapshots_directory)
+
+        except FileNotFoundError:
+            return refcounts
+
+        for snapshot_file in snapshot_files:
+            if not snapshot_file.endswith('.snap'):
+                continue
+
+            try:
+                digests = self.read_snapshot_file(
+                    os.path.join(self.snapshots_directory, snapshot_file))
+
+            except (OSError, zlib.error):
+                continue
+
+            for digest in set(digests):
+                hexdigest = digest.hex()
+                refcounts[hexdigest] = refcounts.get(hexdigest, 0) + 1
+
+        LOGGER.info('{}: counted references of {} chunk(s).'.format(
+                    self, len(refcounts)))
+
+        return refcounts
+
+    # ————————————————————————————————————————————————————————————— Chunks
+
+    def read_snapshot_file(self, path):
+
+        with open(path, 'rb') as snapshot:
+            digests = zlib.decompress(snapshot.read())
+
+        return [
+            digests[start:start + CHUNK_DIGEST_SIZE]
+            for start in range(0, len(digests), CHUNK_DIGEST_SIZE)
+        ]
+
+    def read_chunks_digests(self, snapshot_id):
+
+        return self.read_snapshot_file(self.snapshot_path(snapshot_id))
+
+    def read_chunk(self, digest):
+
+        with open(self.chunk_path(digest), 'rb') as chunk:
+            return zlib.decompress(chunk.read())
+
+    def store(self, data, time):
+        ''' Store `data` as a new snapshot taken at `time` (a datetime),
+            and return it. Called with `lock` held; the reference counts
+            and then the index must be saved after. '''
+
+        snapshots = self.get_snapshots()
+        digest = bytes_digest(data)
+
+        if snapshots and snapshots[-1]['digest'] == digest:
+            LOGGER.debug('{}: content unchanged since last '
+                         'snapshot.'.format(self))
+            return snapshots[-1]
+
+        refcounts = self.get_refcounts()
+
+        digests = []
+        written = 0
+
+        for chunk in split_chunks(data):
+            chunk_digest_ = chunk_digest(chunk)
+            digests.append(chunk_digest_)
+
+            # Referenced chunks surely exist.
+            if chunk_digest_.hex() in refcounts:
+                continue
+
+            path = self.chunk_path(chunk_digest_)
+
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_atomically(path, zlib.compress(chunk))
+                written += 1
+
+        snapshot = {
+            'id': time.isoformat(sep='_'),
+            'time': time.isoformat(),
+            'size': len(data),
+            'digest': digest,
+        }
+
+        os.makedirs(self.snapshots_directory, exist_ok=True)
+        write_atomically(self.snapshot_path(snapshot['id']),
+                         zlib.compress(b''.join(digests)))
+
+        for chunk_digest_ in set(digests):
+            hexdigest = chunk_digest_.hex()
+            refcounts[hexdigest] = refcounts.get(hexdigest, 0) + 1
+
+        snapshots.append(snapshot)
+
+        LOGGER.debug('{}: snapshot {} stored, {} new chunk(s) of {}.'.format(
+                     self, snapshot['id'], written, len(digests)))
+
+        return snapshot
+
+    # ——————————————————————————————————————————————————————————— Snapshots
+
+    def backup(self, keep=None):
+        ''' Snapshot the library file. Blocking.
+
+            :param keep: number of snapshots to keep, oldest ones are
+                deleted. `None` keeps them all.
+            :returns: the snapshot dict, or `None` if it failed.
+        '''
+
+        time = datetime.datetime.now()
+
+        try:
+            # Before locking, for the lock file to be created.
+            os.makedirs(self.directory, exist_ok=True)
+
+        except OSError:
+            LOGGER.exception('Problem while backing up file before save.')
+            return None
+
+        with self.lock:
+            try:
+                with open(self.filename, 'rb') as library:
+                    data = library.read()
+
+                snapshot = self.store(data, time)
+
+                # Counts first: if interrupted, chunks
+                # are kept too long, never deleted early.
+                self.save_refcounts()
+                self.save_index()
+
+                if keep is not None:
+                    self.prune(keep)
+
+            except Exception:
+                LOGGER.exception('Problem while backing up file before save.')
+
+                # Reload from disk on next use.
+                self.snapshots = self.refcounts = None
+                return None
+
+        return snapshot
+
+    def read(self, snapshot_id):
+        ''' Return the content of a snapshot, as bytes. '''
+
+        with self.lock:
+            snapshot = self.get_snapshot(snapshot_id)
+
+            data = b''.join(
+                self.read_chunk(digest)
+                for digest in self.read_chunks_digests(snapshot_id)
+            )
+
+        if bytes_digest(data) != snapshot['digest']:
+            raise ValueError('Snapshot {} of {} is corrupted.'.format(
+                             snapshot_id, self.filename))
+
+        return data
+
+    def restore(self, snapshot_id=None, filename=None):
+        ''' Write a snapshot content to `filename`.
+
+            :param snapshot_id: defaults to the last snapshot.
+            :param filename: defaults to the library file.
+            :returns: the written filename.
+        '''
+
+        if snapshot_id is None:
+            with self.lock:
+                snapshot_id = self.get_snapshots()[-1]['id']
+
+        if filename is None:
+            filename = self.filename
+
+        write_atomically(filename, self.read(snapshot_id))
+
+        LOGGER.info('{}: restored snapshot {} to {}.'.format(
+                    self, snapshot_id, filename))
+
+        return filename
+
+    def get_snapshot(self, snapshot_id):
+        ''' Called with `lock` held. '''
+
+        for snapshot in self.get_snapshots():
+            if snapshot['id'] == snapshot_id:
+                return snapshot
+
+        raise KeyError(snapshot_id)
+
+    def prune(self, keep):
+        ''' Delete the oldest snapshots, to keep `keep` of them, and
+            the chunks no other snapshot uses. Called with `lock` held;
+            saves the index and the reference counts. '''
+
+        snapshots = self.get_snapshots()
+
+        if len(snapshots) <= keep:
+            return
+
+        pruned = snapshots[:len(snapshots) - keep]
+        del snapshots[:len(snapshots) - keep]
+
+        # Index first: if interrupted, chunks
+        # are kept too long, never deleted early.
+        self.save_index()
+
+        refcounts = self.get_refcounts()
+        unused = []
+
+        for snapshot in pruned:
+            try:
+                digests = self.read_chunks_digests(snapshot['id'])
+
+            except (OSError, zlib.error):
+                # Its chunks stay, until `gc()` and `count_references()`.
+                LOGGER.warning('{}: unreadable snapshot “{}”.'.format(
+                               self, snapshot['id']))
+                digests = []
+
+            for digest in set(digests):
+                hexdigest = digest.hex()
+                count = refcounts.get(hexdigest, 0) - 1
+
+                if count > 0:
+                    refcounts[hexdigest] = count
+
+                else:
+                    refcounts.pop(hexdigest, None)
+                    unused.append(digest)
+
+        self.save_refcounts()
+
+        for snapshot in pruned:
+            try:
+                os.unlink(self.snapshot_path(snapshot['id']))
+
+            except FileNotFoundError:
+                pass
+
+            LOGGER.info('{}: wiped old snapshot “{}”.'.format(
+                        self, snapshot['id']))
+
+        for digest in unused:
+            try:
+                os.unlink(self.chunk_path(digest))
+
+            except FileNotFoundError:
+                pass
+
+        LOGGER.debug('{}: {} chunk(s) collected.'.format(self, len(unused)))
+
+    def gc(self):
+        ''' Delete all chunks without references, eg. left by an
+            interrupted save. Walks the chunks folder. Blocking. '''
+
+        deleted = 0
+
+        with self.lock:
+            refcounts = self.get_refcounts()
+
+            for root, dirs, files in os.walk(self.chunks_directory):
+                for chunk_file in files:
+                    if chunk_file in refcounts:
+                        continue
+
+                    os.unlink(os.path.join(root, chunk_file))
+                    deleted += 1
+
+        LOGGER.info('{}: {} unused chunk(s) deleted.'.format(self, deleted))
+
+        return deleted
+
+    # ———————————————————————————————————————————————————————————— Migration
+
+    def migrate(self):
+        ''' Store legacy backups (`.<name>.save.<datetime>.bib` full
+            copies next to the library, `<name>` without extension) as
+            snapshots, and delete them. Called with `lock` held. '''
+
+        dirname = os.path.dirname(self.filename)
+
+        # Same as `bibed.strings.friendly_filename()`, which imports GTK.
+        prefix = '.{}.save.'.format(self.name.rsplit('.', 1)[0])
+
+        try:
+            legacy = sorted(
+                os.path.join(dirname, entry.name)
+                for entry in os.scandir(dirname)
+                if entry.name.startswith(prefix) and entry.is_file()
+            )
+
+        except OSError:
+            return
+
+        if not legacy:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        for path in legacy:
+            try:
+                with open(path, 'rb') as full_copy:
+                    data = full_copy.read()
+
+            except OSError:
+                continue
+
+            self.store(data, datetime.datetime.fromtimestamp(
+                       os.path.getmtime(path)))
+
+        self.save_refcounts()
+        self.save_index()
+
+        for path in legacy:
+            try:
+                os.unlink(path)
+
+            except OSError:
+                pass
+
+        LOGGER.info('{}: converted {} old backup(s) to snapshots.'.format(
+                    self, len(legacy)))
@@ -0,0 +1,81 @@
+
+import os
+import functools
+import logging
+
+import bibtexparser
+from bibtexparser.bibdatabase import BibDatabase as BibtexParserDatabase
+
+from bibed.system import FileState, bytes_digest
+
+
+LOGGER = logging.getLogger(__name__)
+
+# HEADS UP: this module must not import GTK, directly or not. It
+#           runs in the background worker process (see bibed.worker).
+
+# Files are read and written as bytes, for their
+# digest to be computed on exactly what is on disk.
+ENCODING = 'utf-8'
+
+bibtex_parser = functools.partial(
+    bibtexparser.bparser.BibTexParser,
+    ignore_nonstandard_types=False,
+    interpolate_strings=False,
+    common_strings=True,
+)
+
+
+def bibtex_writer():
+    writer = bibtexparser.bwriter.BibTexWriter()
+    writer.indent = '    '
+    return writer
+
+
+def read_file(filename):
+    ''' Return the text of `filename`, and its :class:`FileState`. '''
+
+    with open(filename, 'rb') as bibfile:
+        stat = os.fstat(bibfile.fileno())
+        data = bibfile.read()
+
+    return (data.decode(ENCODING),
+            FileState(len(data), stat.st_mtime_ns, bytes_digest(data)))
+
+
+def write_file(filename, text):
+    ''' Write `text` to `filename`, and return its new :class:`FileState`. '''
+
+    data = text.encode(ENCODING)
+
+    with open(filename, 'wb') as bibfile:
+        bibfile.write(data)
+        bibfile.flush()
+        stat = os.fstat(bibfile.fileno())
+
+    return FileState(len(data), stat.st_mtime_ns, bytes_digest(data))
+
+
+def parse_text(text):
+    ''' Parse BibTeX `text` into a `BibtexParserDatabase`. '''
+
+    try:
+        return bibtex_parser().parse(text)
+
+    except IndexError:
+        # empty file (probably just created)
+        return BibtexParserDatabase()
+
+
+def parse_file(filename):
+    ''' Parse `filename` into a `BibtexParserDatabase`. '''
+
+    text, file_state = read_file(filename)
+
+    return parse_text(text)
+
+
+def serialize(bibdb):
+    ''' Return the BibTeX text of `bibdb`. '''
+
+    return bibtex_writer().write(bibdb)
@@ -1,11 +1,17 @@
 
+import time
 import logging
-import threading
+import functools
 
-from bibed.constants import BibAttrs
-from bibed.parallel import run_in_background
-from bibed.strings import lowunaccent, bibtex_clean
-from bibed.gtk import Gtk
+from bibed.constants import (
+    BibAttrs,
+    COMPLETION_RESULTS_MAX,
+)
+from bibed.strings import seconds_to_string
+from bibed.vocabulary import normalize
+from bibed.daemon import daemon
+from bibed.worker import DaemonTasks
+from bibed.gtk import GLib, Gtk
 
 
 LOGGER = logging.getLogger(__name__)
@@ -86,112 +92,162 @@ class DeduplicateCompletion(Gtk.EntryCompletion):
 
 
 class DeferredCompletion(Gtk.EntryCompletion):
-    ''' Has to be subclassed to implement the store load method. '''
+    ''' Complete a field with values of a :class:`~bibed.vocabulary.BibedVocabulary`.
 
-    def __init__(self, field):
+        Matching values are searched once per key change in the vocabulary
+        search index, then pushed into a small result model. GTK
+        `match_func` thus accepts all rows of the result model, and
+        completion latency does not depend on the vocabulary size.
+
+        The vocabulary search index is built in the worker process when
+        the field gets focus for the first time, into plain Python
+        structures only. It is installed from the main loop.
+    '''
+
+    def __init__(self, field, vocabulary):
 
         super().__init__()
 
-        self.store = Gtk.ListStore(str)
+        self.vocabulary = vocabulary
         self.completion_key = ''
 
+        self.store = Gtk.ListStore(str)
+
         self.set_model(self.store)
         self.set_text_column(0)
         self.set_inline_completion(True)
         self.set_inline_selection(True)
         self.set_popup_set_width(True)
         self.set_minimum_key_length(MINIMUM_KEY_LENGTH)
-        self.set_match_func(self.match_func, self.store)
-
-        self.populating = False
-        self.populated = threading.Event()
+        self.set_match_func(self.match_func)
+        self.set_cell_data_func(self.get_cells()[0], self.cell_data_func)
 
-        field.connect('focus-in-event', self.on_field_focus)
+        # NOTE: connected before the field gets its completion, thus
+        # run before GTK refilters, with our results already in place.
         field.connect('changed', self.on_field_changed)
+        field.connect('focus-in-event', self.on_field_focus)
 
     def on_field_focus(self, field, *args):
 
-        if self.populating:
+        vocabulary = self.vocabulary
+
+        if vocabulary.search_index is not None or vocabulary.building:
             return
 
-        LOGGER.debug('{}: backgrounding populate_data_store().')
+        LOGGER.debug('{}: building search index of vocabulary {} '
+                     'in the worker process.'.format(self, vocabulary.column))
 
-        self.populating = True
+        future = daemon.submit(DaemonTasks.VOCABULARY,
+                               vocabulary.begin_search_index_build())
 
-        run_in_background(self.populate_data_store, self.populated)
+        future.add_done_callback(
+            functools.partial(self.on_search_index_built, time.time()))
 
-        self.set_cell_data_func(self.get_cells()[0], self.cell_data_func)
+    def on_search_index_built(self, time_start, future):
+        ''' Run in the daemon replies thread. Does not touch GTK. '''
+
+        try:
+            search_index = future.result()
+
+        except Exception:
+            LOGGER.exception('{}: could not build search index of '
+                             'vocabulary {}.'.format(
+                                 self, self.vocabulary.column))
+            self.vocabulary.abort_search_index_build()
+            return
+
+        GLib.idle_add(self.install_search_index,
+                      search_index, time.time() - time_start)
+
+    def install_search_index(self, search_index, build_duration):
+
+        self.vocabulary.end_search_index_build(search_index)
+
+        LOGGER.debug('{}: built search index of vocabulary {} in {} '
+                     '({} values).'.format(
+                         self, self.vocabulary.column,
+                         seconds_to_string(build_duration),
+                         len(search_index)))
+
+        if self.completion_key:
+            # Results were empty while building.
+            self.update_results(self.vocabulary.search(
+                self.completion_key, COMPLETION_RESULTS_MAX))
+            self.complete()
+
+        # Remove from idle callbacks.
+        return False
 
     def on_field_changed(self, entry, *args):
 
-        if len(entry.get_text()) >= MINIMUM_KEY_LENGTH:
-            self.completion_key = entry.get_text()
+        text = entry.get_text()
 
-        else:
+        if len(text) < MINIMUM_KEY_LENGTH:
             self.completion_key = ''
+            return
 
-    def match_func(self, widget, key, iter, store):
-        ''' Deduplicate matched values, and match them more fuzzily. '''
+        if text == self.completion_key:
+            return
 
-        self.populated.wait()
+        self.completion_key = text
 
-        # print(
-        #     'KEY', lowunaccent(key, normalized=True), type(key),
-        #     'MY', lowunaccent(self.completion_key), type(self.completion_key),
-        #     'IN', lowunaccent(store[iter][0])
-        # )
+        self.update_results(
+            self.vocabulary.search(text, COMPLETION_RESULTS_MAX))
 
-        if lowunaccent(key, normalized=True) in \
-                lowunaccent(bibtex_clean(store[iter][0])):
-            return True
+    def update_results(self, results):
 
-        return False
+        # A new model is cheaper than clearing and
+        # re-filling the current one, which signals
+        # the completion for every row.
+        store = Gtk.ListStore(str)
+
+        for value in results:
+            store.append((value, ))
+
+        self.store = store
+        self.set_model(store)
+
+    def match_func(self, completion, key, iter, *data):
+        ''' Result model rows are already matched. '''
+
+        return True
 
     def cell_data_func(self, layout, cell, model, iter, *data):
 
-        key = lowunaccent(self.completion_key, normalized=True)
+        key = normalize(self.completion_key)
         value = model.get_value(iter, 0)
 
-        start_index = lowunaccent(value, normalized=True).find(key)
+        normalized = normalize(value)
+        start_index = normalized.find(key)
+
+        if start_index < 0 or len(normalized) != len(value):
+            # Normalization changed the value length (eg. “æ” → “ae”),
+            # we cannot highlight the key at the right position.
+            cell.set_property('markup', GLib.markup_escape_text(value))
+            return
+
         end_index = start_index + len(key)
 
         cell.set_property(
             'markup',
             '{}<b><u>{}</u></b>{}'.format(
-                value[:start_index],
-                value[start_index:end_index],
-                value[end_index:],
+                GLib.markup_escape_text(value[:start_index]),
+                GLib.markup_escape_text(value[start_index:end_index]),
+                GLib.markup_escape_text(value[end_index:]),
             )
         )
 
 
 class DeduplicatedStoreColumnCompletion(DeferredCompletion):
+    ''' Complete with the distinct values of a data store column.
+
+        Values come from the data store vocabularies, thus opening an
+        editor dialog never rebuilds them.
+    '''
 
     def __init__(self, field, store, column):
 
-        super().__init__(field)
+        super().__init__(field, store.vocabularies[column])
 
         self.source_store = store
         self.source_column = column
-
-    def populate_data_store(self):
-
-        source_column = self.source_column
-        my_store = self.store
-
-        for row in self.source_store:
-
-            if row[source_column].strip() == '':
-                continue
-
-            discard_row = False
-
-            for my_row in my_store:
-                if row[source_column] == my_row[0]:
-                    discard_row = True
-                    break
-
-            if discard_row:
-                continue
-
-            my_store.append((row[source_column], ))
@@ -50,26 +50,54 @@ BibAttrs = Anything((
     ('READ', str, ),
     ('ABSTRACT_OR_COMMENT', str, ),
 
+    # specials.
+    ('COLOR', str, ),  # foreground color
+
+    # Sort keys (not displayed). See `BibedEntry.sort_*`.
+    ('SORT_AUTHOR', str, ),
+    ('SORT_TITLE', str, ),
+    ('SORT_IN_OR_BY', str, ),
+
+    # Icon names, bound to cell renderers. See `BibedEntry.icon_*`.
+    ('TYPE_ICON', str, ),
+    ('FILE_ICON', str, ),
+    ('URL_ICON', str, ),
+    ('QUALITY_ICON', str, ),
+    ('READ_ICON', str, ),
+    ('COMMENT_ICON', str, ),
+
+    # Index document ID of the entry. See `BibedDataStore.entries`.
+    ('HANDLE', int, ),
+
+    # Below are values not stored in the data store, because they are
+    # never displayed. They are kept in the search index and vocabularies.
+
     # Fields used for search / filter
-    ('SUBTITLE', str, ),
-    ('COMMENT', str, ),
-    ('KEYWORDS', str, ),
-    ('ABSTRACT', str, ),
+    ('SUBTITLE', None, ),
+    ('COMMENT', None, ),
+    ('KEYWORDS', None, ),
+    ('ABSTRACT', None, ),
 
     # Fields used for completions.
-    ('JOURNALTITLE', str, ),
-    ('EDITOR', str, ),
-    ('PUBLISHER', str, ),
-    ('SERIES', str, ),
-    ('TYPEFIELD', str, ),
-    ('HOWPUBLISHED', str, ),
-    ('ENTRYSUBTYPE', str, ),
-
-    # specials.
-    ('COLOR', str, ),  # foreground color
+    ('JOURNALTITLE', None, ),
+    ('EDITOR', None, ),
+    ('PUBLISHER', None, ),
+    ('SERIES', None, ),
+    ('TYPEFIELD', None, ),
+    ('HOWPUBLISHED', None, ),
+    ('ENTRYSUBTYPE', None, ),
 ))
 
 
+# Leading articles ignored when sorting titles, lowered and unaccented.
+SORT_IGNORED_ARTICLES = (
+    'the ', 'a ', 'an ',
+    'le ', 'la ', 'les ', "l'", 'un ', 'une ', 'des ',
+    'der ', 'die ', 'das ', 'ein ', 'eine ',
+    'el ', 'los ', 'las ', 'il ', 'lo ', 'gli ',
+)
+
+
 FileTypes = Anything()
 FileTypes.SPECIAL   = 0xff00000
 FileTypes.ALL       = 0x0100000
@@ -279,10 +307,47 @@ HELP_POPOVER_LABEL_MARGIN = 10
 # Expressed in number of keywords (which can eventually be multi-words)
 MAX_KEYWORDS_IN_TOOLTIPS = 20
 
+# Expressed in number of values per facet
+FACETS_TOP_COUNT = 15
+
+# Expressed in number of values proposed by an entry field completion
+COMPLETION_RESULTS_MAX = 50
+
 # expressed in number of characters
 TEXT_MAX_LENGHT_IN_TOOLTIPS = 384
 TEXT_LENGHT_FOR_CR_IN_TOOLTIPS = 96
 
+# Expressed in milliseconds. Writes happen DELAY after the last change,
+# but never later than MAX_LATENCY after the first unwritten change.
+DATABASE_WRITE_DELAY = 2000
+DATABASE_WRITE_MAX_LATENCY = 5000
+
+# Expressed in number of threads (and processes) of the background executor.
+EXECUTOR_MAX_WORKERS = 4
+
+# Expressed in milliseconds. Scheduled tasks (eg. writes) still
+# pending at quit are run at once, and must be done in this delay.
+QUIT_DRAIN_TIMEOUT = 10000
+
+# Expressed in number of rendered entry tooltips kept in memory
+TOOLTIPS_CACHE_SIZE = 512
+
+# Expressed in number of rows. Past it, views and filter models are
+# detached while a transaction inserts its rows, then rebuilt.
+BULK_DETACH_ROWS = 1000
+
+# Expressed in milliseconds. External changes of a file are checked this
+# long after the last event on it, merging bursts (eg. a git checkout).
+FILE_MONITOR_DELAY = 500
+
+# Expressed in number of worker process crashes. Past it, worker
+# tasks run in the GUI process (in the calling thread).
+DAEMON_MAX_RESTARTS = 3
+
+# Expressed in milliseconds. Time for the worker process to finish
+# its current task at quit, before being terminated.
+DAEMON_QUIT_TIMEOUT = 5000
+
 
 GENERIC_HELP_SYMBOL = (
     '<span color="grey"><sup><small>(?)</small></sup></span>'
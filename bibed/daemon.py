@@ -1,88 +1,343 @@
 
+import queue
+import asyncio
 import logging
+import itertools
+import threading
 import multiprocessing
-
-from bibed.store import BibedFileStore
+import concurrent.futures
+
+from bibed.constants import (
+    DAEMON_MAX_RESTARTS,
+    DAEMON_QUIT_TIMEOUT,
+)
+from bibed.exceptions import DaemonTaskError, DaemonCrashedError
+from bibed.foundations import Singleton
+from bibed.worker import (
+    TASKS,
+    DaemonRequest,
+    DaemonReplies,
+    background_process_run,
+)
+from bibed.gtk import GLib
 
 
 LOGGER = logging.getLogger(__name__)
 
 
-def background_process_run(queue_recv, queue_send):
-    ''' HEADS UP: queues are renamed from a daemon perspective. '''
+class BibedDaemonRequest:
+    ''' A task sent to the worker process, waiting for its reply. '''
 
-    background_app = BibedBackgroundProcess(queue_recv, queue_send)
+    def __init__(self, request_id, task, args, on_progress=None):
 
-    background_app.run()
+        self.request_id = request_id
+        self.task = task
+        self.args = args
+        self.on_progress = on_progress
 
+        self.future = concurrent.futures.Future()
 
-class BibedBackgroundProcess:
+        # Number of worker crashes while running this request.
+        self.crashes = 0
 
-    def __init__(self, queue_in, queue_out):
+    def __str__(self):
 
-        self.queue_in = queue_in
-        self.queue_out = queue_out
+        return 'BibedDaemonRequest(#{}, {})'.format(
+            self.request_id, self.task)
 
-        # No data store here, we just need to write to system files.
-        self.files = BibedFileStore()
-        self.files.load_system_files()
+    @property
+    def message(self):
 
-        # LOGGER.debug('Background process created.')
+        return DaemonRequest(self.request_id, self.task, self.args)
 
-    def run(self):
+    def set_result(self, result):
 
-        LOGGER.info('Background process started.')
+        try:
+            self.future.set_result(result)
 
-        task = self.queue_in.get()
+        except concurrent.futures.InvalidStateError:
+            # Cancelled by the caller.
+            pass
 
-        if task is None:
-            self.queue_in.task_done()
+    def set_exception(self, exception):
 
-        while task is not None:
-            self.process_task(task)
-            self.queue_in.task_done()
-            self.queue_in.get()
+        try:
+            self.future.set_exception(exception)
 
-        # Be sure the master process can stop.
-        self.queue_in.task_done()
-        self.queue_out.put(None)
+        except concurrent.futures.InvalidStateError:
+            pass
 
 
-class BibedDaemonMixin:
+class BibedDaemon(metaclass=Singleton):
+    ''' GUI side of the worker process (see :mod:`bibed.worker`), which
+        parses and serializes BibTeX out of the GUI process.
 
-    def daemon_setup(self):
+        The worker is started on first use. It runs one task at a time,
+        in request order. If it dies, it is restarted and pending
+        requests are sent again; a request that was running during two
+        crashes fails with :class:`DaemonCrashedError`. After
+        :data:`DAEMON_MAX_RESTARTS` crashes, or after :meth:`quit`, tasks
+        run in the calling thread instead.
+    '''
+
+    def __init__(self):
+
+        # Spawn, not fork: the GUI process has threads and GTK state.
+        self.context = multiprocessing.get_context('spawn')
+
+        self.process = None
+        self.queue_send = None
+        self.queue_recv = None
+        self.reader = None
 
-        self.__daemon_process = None
-        self.__daemon_queue_send = None
-        self.__daemon_queue_recv = None
+        # Protects everything below and the process start.
+        self.lock = threading.Lock()
 
-    def daemon_execute(self):
+        self.request_ids = itertools.count(1)
 
-        if self.__daemon_process is None:
-            self.daemon_launch()
+        # request_id → BibedDaemonRequest, sent and not yet replied.
+        self.requests = {}
 
-    def daemon_launch(self):
+        self.restarts = 0
+        self.quitting = False
 
-        # send from GUI to background processors
-        self.__daemon_queue_send = multiprocessing.Queue()
+    def __len__(self):
 
-        # receive from background processors in GUI
-        self.__daemon_queue_recv = multiprocessing.Queue()
+        return len(self.requests)
 
-        self.__daemon_process = multiprocessing.Process(
+    @property
+    def usable(self):
+
+        return not self.quitting and self.restarts <= DAEMON_MAX_RESTARTS
+
+    def start(self):
+        ''' Start the worker process. Called with `lock` held. '''
+
+        self.queue_send = self.context.Queue()
+        self.queue_recv = self.context.Queue()
+
+        self.process = self.context.Process(
             target=background_process_run,
-            args=(self.__daemon_queue_send, self.__daemon_queue_recv)
-        )
+            args=(self.queue_send, self.queue_recv),
+            name='bibed-worker', daemon=True)
 
-        self.__daemon_process.start()
+        self.process.start()
 
-        # Main loop interval get queue_recv.
+        self.reader = threading.Thread(
+            target=self.read_replies,
+            args=(self.process, self.queue_recv),
+            name='bibed-worker-reader', daemon=True)
 
-    def daemon_quit(self):
+        self.reader.start()
+
+        # Requests pending when the previous worker died.
+        for request in self.requests.values():
+            self.queue_send.put(request.message)
+
+        LOGGER.info('Background process launched (pid {}).'.format(
+                    self.process.pid))
+
+    # ——————————————————————————————————————————————————————————————— Tasks
+
+    def submit(self, task, *args, on_progress=None):
+        ''' Send `task` to the worker.
+
+            :param task: one of :data:`~bibed.worker.DaemonTasks`.
+            :param args: task arguments. They must be picklable.
+            :param on_progress: called in the main loop with a value
+                and a total, when the task reports progress.
+            :returns: a :class:`concurrent.futures.Future`.
+        '''
+
+        with self.lock:
+            if self.usable:
+                if self.process is None:
+                    self.start()
+
+                request = BibedDaemonRequest(
+                    next(self.request_ids), task, args, on_progress)
+
+                self.requests[request.request_id] = request
+                self.queue_send.put(request.message)
+
+                return request.future
+
+        return self.run_locally(task, args)
+
+    def call(self, task, *args, timeout=None):
+        ''' Run `task` in the worker, and wait for its result. Blocking:
+            better called from a background thread. '''
+
+        return self.submit(task, *args).result(timeout)
+
+    async def run(self, task, *args, on_progress=None):
+        ''' Coroutine version of :meth:`call`. '''
+
+        return await asyncio.wrap_future(
+            self.submit(task, *args, on_progress=on_progress))
+
+    def run_locally(self, task, args):
+
+        LOGGER.debug('Running {} task in the GUI process.'.format(task))
+
+        future = concurrent.futures.Future()
+
+        try:
+            future.set_result(TASKS[task](*args))
+
+        except Exception as exception:
+            future.set_exception(exception)
+
+        return future
+
+    # ————————————————————————————————————————————————————————————— Replies
+
+    def read_replies(self, process, queue_recv):
+        ''' Run in the reader thread, until `process` stops or dies. '''
+
+        while True:
+            try:
+                reply = queue_recv.get(timeout=1)
+
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+
+                self.on_process_died(process)
+                return
+
+            if reply is None:
+                # Clean stop, see quit().
+                return
+
+            self.on_reply(reply)
+
+    def on_reply(self, reply):
+
+        request = self.requests.get(reply.request_id, None)
+
+        if request is None:
+            # Replied by the previous worker, before it died.
+            return
+
+        if reply.kind == DaemonReplies.PROGRESS:
+            if request.on_progress is not None:
+                GLib.idle_add(self.__run_callback,
+                              request.on_progress, *reply.payload)
+            return
+
+        with self.lock:
+            self.requests.pop(reply.request_id, None)
+
+        if reply.kind == DaemonReplies.RESULT:
+            request.set_result(reply.payload)
+
+        else:
+            request.set_exception(DaemonTaskError(request.task,
+                                                  *reply.payload))
+
+    def on_process_died(self, process):
+
+        with self.lock:
+            if process is not self.process:
+                return
+
+            LOGGER.error('Background process died (exit code {}).'.format(
+                         process.exitcode))
+
+            self.process = None
+            self.restarts += 1
+
+            failed = []
+            orphans = []
+
+            if self.requests:
+                # The worker runs requests in order: the
+                # oldest one was running when it died.
+                culprit = self.requests[min(self.requests)]
+                culprit.crashes += 1
+
+                if culprit.crashes > 1:
+                    failed.append(self.requests.pop(culprit.request_id))
+
+            if self.quitting:
+                failed.extend(self.requests.values())
+                self.requests.clear()
+
+            elif not self.usable:
+                LOGGER.error('Background process crashed too many times, '
+                             'running tasks in the GUI process.')
+
+                orphans.extend(self.requests.values())
+                self.requests.clear()
+
+            elif self.requests:
+                self.start()
+
+        for request in failed:
+            request.set_exception(DaemonCrashedError(str(request)))
+
+        for request in orphans:
+            future = self.run_locally(request.task, request.args)
+
+            if future.exception() is None:
+                request.set_result(future.result())
+
+            else:
+                request.set_exception(future.exception())
+
+    def __run_callback(self, callback, *args):
+
+        callback(*args)
+
+        # Remove from idle callbacks.
+        return False
+
+    # ———————————————————————————————————————————————————————————————— Quit
+
+    def quit(self, timeout=DAEMON_QUIT_TIMEOUT):
+        ''' Let the worker finish pending tasks, and stop it.
+
+            :param timeout: in milliseconds. Past it, the worker
+                is terminated and pending tasks fail.
+        '''
+
+        with self.lock:
+            self.quitting = True
+            process = self.process
 
         # If the daemon process hasn't even
         # started, don't bother quitting it.
-        if self.__daemon_process is not None:
-            LOGGER.info('Joining background process …')
-            self.__daemon_queue_send.put(None)
-            self.__daemon_process.join()
+        if process is None:
+            return
+
+        LOGGER.info('Joining background process …')
+
+        self.queue_send.put(None)
+        process.join(timeout / 1000)
+
+        if process.is_alive():
+            LOGGER.warning('Background process still busy with {} '
+                           'task(s), terminating it.'.format(len(self)))
+            process.terminate()
+            process.join()
+
+        # Gets the final `None`, or detects the
+        # termination and fails pending requests.
+        self.reader.join()
+
+        self.process = None
+
+
+daemon = BibedDaemon()
+
+
+class BibedDaemonMixin:
+
+    def daemon_setup(self):
+
+        self.daemon = daemon
+
+    def daemon_quit(self):
+
+        self.daemon.quit()
@@ -1,15 +1,11 @@
 
-import os
-import shutil
-import datetime
 import random
-import functools
+import threading
 
 import logging
-import bibtexparser
 from bibtexparser.bibdatabase import BibDatabase as BibtexParserDatabase
 
-from bibed.exceptions import DuplicateKeyError
+from bibed.exceptions import BibedDaemonError, DuplicateKeyError
 
 from bibed.ltrace import (  # NOQA
     ldebug, lprint,
@@ -19,28 +15,23 @@ from bibed.ltrace import (  # NOQA
 
 from bibed.locale import _
 from bibed.decorators import run_at_most_every
-from bibed.constants import FileTypes
+from bibed.scheduler import LANE_IO, scheduler, task_key
+from bibed.parallel import executor
+from bibed.daemon import daemon
+from bibed.worker import DaemonTasks
+from bibed.constants import (
+    FileTypes,
+    DATABASE_WRITE_DELAY,
+    DATABASE_WRITE_MAX_LATENCY,
+)
 from bibed.strings import friendly_filename
+from bibed.bibtex import write_file
 from bibed.preferences import gpod
 from bibed.entry import BibedEntry
 from bibed.gtk import GObject
 
 LOGGER = logging.getLogger(__name__)
 
-bibtex_parser = functools.partial(
-    bibtexparser.bparser.BibTexParser,
-    ignore_nonstandard_types=False,
-    interpolate_strings=False,
-    common_strings=True,
-)
-
-
-def bibtex_writer():
-    writer = bibtexparser.bwriter.BibTexWriter()
-    writer.indent = '    '
-    return writer
-
-
 DATABASES_IDS = set()
 
 
@@ -118,12 +109,15 @@ class BibedDatabase(GObject.GObject):
         LOGGER.debug('{0}.move_entry({1}) to {2} done (add+delete).'.format(
                      source_database, entry, destination_database))
 
-    def __init__(self, filename, filetype):
+    def __init__(self, filename, filetype, bibdb=None):
         ''' Create a :class:`~bibed.database.BibedDatabase` instance.
 
             :param filename: a full pathname, as a string, for a `BibTeX` /
                 `BibLaTeX` database.
             :param fileype: the application file type, from `FileTypes` enum. This is used in tooltips and other descriptive fields, to decide if full pathname or folder is shown or not.
+            :param bibdb: the already parsed content of `filename`, from
+                the worker `PARSE` task (with its `file_state`). If `None`,
+                the calling thread waits for the worker to parse it.
             :param store: a :class:`~bibed.store.BibedFileStore` instance. its
                 `.data_store` attribute will be kept handy in the current
                 database attributes.
@@ -141,16 +135,24 @@ class BibedDatabase(GObject.GObject):
         self.filename = filename
         self.filetype = filetype
 
+        # Incremented at each write() call, and recorded when
+        # the corresponding snapshot is written to disk.
+        self.write_generation = 0
+        self.written_generation = 0
+        self.write_lock = threading.Lock()
+
+        # FileState of what we last read or wrote, to recognize our
+        # own writes and no-op changes in file monitor events.
+        self.file_state = None
+
         # TODO: detect BibTeX aliased fields and set
         #       self.use_aliased fields or convert them.
 
-        try:
-            with open(self.filename, 'r') as bibfile:
-                bibdb = bibtex_parser().parse_file(bibfile)
+        if bibdb is None:
+            # Synchronous load (eg. session restore, or system files).
+            bibdb = daemon.call(DaemonTasks.PARSE, self.filename)
 
-        except IndexError:
-            # empty file (probably just created)
-            bibdb = BibtexParserDatabase()
+        self.file_state = bibdb.file_state
 
         # Keep them for write.
         self.bibdb_attributes = {
@@ -250,6 +252,7 @@ class BibedDatabase(GObject.GObject):
         self.entries[entry.key] = entry
 
         BibedDatabase.data_store.add_entry(entry)
+        BibedDatabase.files_store.journal(self.delete_entry, entry)
 
         LOGGER.debug('{0}.add_entry({1}) done.'.format(self, entry))
 
@@ -274,6 +277,8 @@ class BibedDatabase(GObject.GObject):
         entry.database = None
         del self.entries[entry.key]
 
+        BibedDatabase.files_store.journal(self.add_entry, entry)
+
         # NOTE: do NOT delete the entry, in case it's a move operation.
         #       in case of a simple delete, the garbage collector should
         #       wipe it automatically anyway.
@@ -300,91 +305,125 @@ class BibedDatabase(GObject.GObject):
         LOGGER.debug('{0}.update_entry_key({1}) done.'.format(self, entry))
 
     def backup(self):
+        ''' Back the database file up, in the worker process. Blocking:
+            runs in the background executor, see :meth:`write_snapshot`. '''
 
         # assert lprint_function_name()
         # assert lprint(self.filename)
 
-        dirname = os.path.dirname(self.filename)
-        basename = os.path.basename(self.filename)
-        coolname = friendly_filename(basename)
-
-        # Using microseconds in backup filename should avoid collisions.
-        # Using time will also help for cleaning old backups.
-        new_filename = os.path.join(
-            dirname,
-            # HEADS UP: backup file starts with a dot, it's hidden.
-            '.{coolname}.save.{datetime}.bib'.format(
-                coolname=coolname,
-                datetime=datetime.datetime.now().isoformat(sep='_')
-            )
-        )
-
         try:
-            shutil.copyfile(self.filename, new_filename)
-            shutil.copystat(self.filename, new_filename)
+            daemon.call(DaemonTasks.BACKUP, self.filename,
+                        gpod('bib_backup_count'))
 
-        except Exception:
-            LOGGER.exception('Problem while backing up file before save.')
+        except BibedDaemonError:
+            # Like BibedBackupStore.backup() errors, it must not
+            # prevent the write that follows.
+            LOGGER.exception('{0}.backup() failed.'.format(self))
+            return
 
-        backup_count = gpod('bib_backup_count')
+        LOGGER.debug('{0}.backup() done.'.format(self))
 
-        if backup_count is not None:
+    def write(self):
+        ''' Write the database file, :data:`DATABASE_WRITE_DELAY` after
+            the last call of a burst. Inside a files store transaction,
+            the database is written once, at commit. '''
 
-            backup_start = '.{basename}.save.'.format(basename=coolname)
+        if BibedDatabase.files_store.defer_write(self):
+            LOGGER.debug('{0}.write(): deferred to commit.'.format(self))
+            return
 
-            backup_files = []
+        self.write_later()
 
-            for root, dirs, files in os.walk(dirname):
+    @run_at_most_every(DATABASE_WRITE_DELAY,
+                       max_latency=DATABASE_WRITE_MAX_LATENCY,
+                       lane=LANE_IO)
+    def write_later(self):
 
-                for walked_file in files:
-                    if walked_file.startswith(backup_start):
-                        backup_files.append(walked_file)
+        # assert lprint_function_name()
+        # assert lprint(self.filename)
 
-            if len(backup_files) > backup_count:
+        # Came due inside a transaction (eg. from a nested
+        # main loop): do not write its half-done changes.
+        if BibedDatabase.files_store.defer_write(self, pending=True):
+            LOGGER.debug('{0}.write(): pending write deferred to the '
+                         'end of transaction.'.format(self))
+            return
 
-                for file_to_wipe in sorted(backup_files,
-                                           reverse=True)[backup_count:]:
-                    full_path = os.path.join(dirname, file_to_wipe)
+        self.write_now()
 
-                    os.unlink(full_path)
+    def write_now(self):
+        ''' Write the database file without delay, in the background
+            executor. A pending :meth:`write_later` is cancelled. '''
 
-                    LOGGER.info(
-                        '{0}.backup(): wiped old backup file “{1}”.'.format(
-                            self, full_path))
+        self.cancel_write()
 
-        # TODO: make backups in .bibed_save/ ? (PREFERENCE ON/OFF)
-        # TODO: clean old backup files. (PREFERENCE [number])
-        LOGGER.debug('{0}.backup() done.'.format(self))
+        executor.submit(self.write_snapshot, *self.snapshot())
 
-    @run_at_most_every(2000)  # Save once per two seconds maximum
-    def write(self):
+    def cancel_write(self):
+        ''' Cancel the pending :meth:`write_later`, if any. '''
 
-        # assert lprint_function_name()
-        # assert lprint(self.filename)
+        scheduler.cancel(self.write_key())
+
+    def write_key(self):
+
+        return task_key(BibedDatabase.write_later.__wrapped__, (self, ))
+
+    @property
+    def write_pending(self):
+        ''' `True` if a :meth:`write_later` is waiting. '''
+
+        task = scheduler.tasks.get(self.write_key(), None)
+
+        return task is not None and task.pending
+
+    def snapshot(self):
+        ''' Return `(bibdb, generation, backup)` arguments for
+            :meth:`write_snapshot`. Must run in the main thread. '''
+
+        # Rebuild a BibtexParserDatabase on the fly just for write.
+        # Entries are copied here, in the main thread, because they
+        # can change while the background write runs.
+        bibdb = BibtexParserDatabase()
+        bibdb.comments = self.bibdb_attributes['comments']
+        bibdb.preambles = self.bibdb_attributes['preambles']
+        bibdb.strings = self.bibdb_attributes['strings']
+        bibdb.entries = [
+            dict(self.entries[key].bib_dict)
+            for key
+            in sorted(self.entries)
+        ]
+
+        self.write_generation += 1
+
+        return bibdb, self.write_generation, gpod('backup_before_save')
+
+    def write_snapshot(self, bibdb, generation, backup):
+        ''' Write `bibdb` to disk. Run in the background executor.
+
+            Writes can finish out of order: a snapshot older than the
+            last written one is dropped.
+        '''
 
         filename = self.filename
 
-        with BibedDatabase.files_store.no_watch(filename):
+        # Serialize writes of this database, for
+        # `file_state` to match the file content.
+        with self.write_lock:
 
-            if gpod('backup_before_save'):
+            if generation < self.written_generation:
+                LOGGER.debug('{0}.write(): snapshot {1} superseded by '
+                             '{2}.'.format(self, generation,
+                                           self.written_generation))
+                return
+
+            if backup:
                 self.backup()
 
-            # Rebuild a BibtexParserDatabase
-            # on the fly just for write.
-            bibdb = BibtexParserDatabase()
-            bibdb.comments = self.bibdb_attributes['comments']
-            bibdb.preambles = self.bibdb_attributes['preambles']
-            bibdb.strings = self.bibdb_attributes['strings']
-            bibdb.entries = [
-                self.entries[key].bib_dict
-                for key
-                in sorted(self.entries)
-            ]
-
-            with open(filename, 'w') as bibfile:
-                bibfile.write(bibtex_writer().write(bibdb))
-
-            del bibdb
+            # Serializing is CPU-bound: it runs in the worker process.
+            text = daemon.call(DaemonTasks.SERIALIZE, bibdb)
+
+            self.file_state = write_file(filename, text)
+            self.written_generation = generation
 
         if __debug__:
             LOGGER.debug('{0}.write(): written to disk.'.format(self))
@@ -1,31 +1,14 @@
 
-import time
 import functools
 import logging
 
-from bibed.gtk import GLib, Gtk
-from bibed.strings import seconds_to_string
+from bibed.scheduler import (
+    scheduler,
+    DEBOUNCE, THROTTLE, ONCE,
+    LANE_UI, LANE_IDLE,
+)
 
 LOGGER = logging.getLogger(__name__)
-FUNC_IDLE_CALLS = {}
-FUNC_MOST_CALLS = {}
-
-
-def build_signature(func, args, limit=None):
-    ''' Very simple signature generator, hard-assuming how I use the decorators. '''
-
-    if limit is None:
-        # with "2", we get self and first argument.
-        # In most of our uses cases this is sufficient.
-        limit = 2
-
-    return '{}{}'.format(
-        func.__name__,
-        ''.join(
-            str(id(arg))
-            for arg in args[:limit]
-        )
-    )
 
 
 def only_one_when_idle(func):
@@ -34,28 +17,19 @@ def only_one_when_idle(func):
     @functools.wraps(func)
     def wrapper(*args):
 
-        signature = build_signature(func, args)
-
-        if signature in FUNC_IDLE_CALLS:
-            # Already in idle queue
-            return
-
-        def run_and_remove():
-
-            func(*args)
-
-            GLib.source_remove(FUNC_IDLE_CALLS[signature])
-            del FUNC_IDLE_CALLS[signature]
-
-        FUNC_IDLE_CALLS[signature] = GLib.idle_add(run_and_remove)
+        scheduler.schedule(func, args, mode=ONCE, lane=LANE_IDLE)
 
     return wrapper
 
 
-def run_at_most_every(delay):
-    ''' Execute :param:`func` at most every :param:`delay`.
+def run_at_most_every(delay, max_latency=None, lane=LANE_UI):
+    ''' Execute :param:`func` :param:`delay` after the last call of a burst.
 
-        :param delay: integer, must comply to :func:`Glib.timeout_add`.
+        :param delay: integer, in milliseconds.
+        :param max_latency: integer, in milliseconds. If given, execution
+            will not be postponed more than that after the first call of
+            a burst, even if calls keep coming.
+        :param lane: scheduler lane, see :mod:`bibed.scheduler`.
     '''
 
     def decorator(func):
@@ -63,69 +37,26 @@ def run_at_most_every(delay):
         @functools.wraps(func)
         def wrapper(*args):
 
-            signature = build_signature(func, args)
-
-            if signature in FUNC_MOST_CALLS:
-                try:
-                    GLib.source_remove(FUNC_MOST_CALLS[signature])
-
-                except Exception:
-                    # Obsolete source. It's like it wasn't there.
-                    del FUNC_MOST_CALLS[signature]
-
-            def run_and_remove():
-
-                func(*args)
-
-                GLib.source_remove(FUNC_MOST_CALLS[signature])
-                del FUNC_MOST_CALLS[signature]
-
-                # Be sure the function will not be re-run.
-                return False
-
-            FUNC_MOST_CALLS[signature] = GLib.timeout_add(delay, run_and_remove)
+            scheduler.schedule(func, args, mode=DEBOUNCE, delay=delay,
+                               max_latency=max_latency, lane=lane)
 
         return wrapper
 
     return decorator
 
 
-def wait_for_queued_events(delay=None):
-
-    start = time.time()
-
-    if delay is None:
-        # defaults to 10 seconds (some methods
-        # can be delayed once every 5 secs).
-        delay = 10000
-
-    wait_cycle = 0
-    has_remaining = 0
-
-    if FUNC_IDLE_CALLS or FUNC_MOST_CALLS:
-        has_remaining = len(FUNC_IDLE_CALLS) + len(FUNC_MOST_CALLS)
-        LOGGER.info(
-            'Waiting at most {:.1f} seconds for {} remaining '
-            'events to run…'.format(delay / 1000, has_remaining))
+def throttled(delay, lane=LANE_UI):
+    ''' Execute :param:`func` as soon as possible, but not more than
+        once every :param:`delay` milliseconds. '''
 
-    while (FUNC_IDLE_CALLS or FUNC_MOST_CALLS) and wait_cycle != delay:
-
-        while Gtk.events_pending():
-            Gtk.main_iteration()
+    def decorator(func):
 
-        wait_cycle += 1
-        time.sleep(0.001)
+        @functools.wraps(func)
+        def wrapper(*args):
 
-    if FUNC_IDLE_CALLS:
-        LOGGER.warning('Idle calls still pending: {}'.format(
-            len(FUNC_IDLE_CALLS)
-        ))
+            scheduler.schedule(func, args, mode=THROTTLE, delay=delay,
+                               lane=lane)
 
-    elif FUNC_MOST_CALLS:
-        LOGGER.warning('Timeout calls still pending: {}'.format(
-            len(FUNC_MOST_CALLS)
-        ))
+        return wrapper
 
-    elif has_remaining:
-        LOGGER.info('Last {} remaining events ran in {} secs.'.format(
-            has_remaining, seconds_to_string(time.time() - start)))
+    return decorator
@@ -4,6 +4,7 @@ import re
 import uuid
 import logging
 import datetime
+import itertools
 
 import bibtexparser
 
@@ -14,21 +15,33 @@ from bibed.ltrace import (
 )
 
 from bibed.constants import (
-    BibAttrs, FileTypes,
+    BibAttrs,
     ENTRY_COLORS,
+    URL_PIXBUFS,
+    FILE_PIXBUFS,
+    TYPE_PIXBUFS,
+    COMMENT_PIXBUFS,
+    READ_STATUS_PIXBUFS,
+    QUALITY_STATUS_PIXBUFS,
     JABREF_READ_KEYWORDS,
     JABREF_QUALITY_KEYWORDS,
     MAX_KEYWORDS_IN_TOOLTIPS,
     MINIMUM_BIB_KEY_LENGTH,
+    SORT_IGNORED_ARTICLES,
     TEXT_MAX_LENGHT_IN_TOOLTIPS,
     TEXT_LENGHT_FOR_CR_IN_TOOLTIPS,
+    TOOLTIPS_CACHE_SIZE,
 )
 
 from bibed.strings import (
     asciize,
+    bibtex_split,
     friendly_filename,
     latex_to_pango_markup,
+    latex_to_text,
+    sort_text,
 )
+from bibed.foundations import LRUCache
 from bibed.locale import _
 from bibed.fields import FieldUtils as fu
 from bibed.actions import EntryActionStatusMixin
@@ -36,7 +49,6 @@ from bibed.completion import (
     DeduplicatedStoreColumnCompletion,
 )
 from bibed.preferences import defaults, preferences, gpod
-from bibed.exceptions import FileNotFoundError
 from bibed.gui.helpers import markup_bib_filename
 from bibed.gtk import GLib
 
@@ -141,6 +153,14 @@ class BibedEntry(EntryActionStatusMixin):
 
     # Will be set by app / css methods.
     COLORS = None
+    THEME = None
+
+    # Rendered `col_tooltip`, see `tooltip_key()`.
+    TOOLTIPS = LRUCache(TOOLTIPS_CACHE_SIZE)
+
+    # Revisions are unique among all entries, for a reused docid
+    # not to match the cached tooltip of a deleted entry.
+    REVISIONS = itertools.count(1)
 
     files_store = None
 
@@ -222,6 +242,14 @@ class BibedEntry(EntryActionStatusMixin):
         self.__internal_keywords = self.__internal_split_tokens(
             self.bib_dict.get('keywords', ''))
 
+        # Changed at each change, to invalidate memoized data store
+        # values. See :meth:`~bibed.store.BibedDataStore.entry_values`.
+        self.revision = next(self.REVISIONS)
+        self.store_values = None
+
+        # Set by the data store when the entry is indexed.
+        self.docid = None
+
     def __setitem__(self, item_name, value):
         ''' Translation Bibed ←→ bibtexparser. '''
 
@@ -232,6 +260,8 @@ class BibedEntry(EntryActionStatusMixin):
         value = value.strip()
         item_name = self.__internal_translate(item_name)
 
+        self.touch()
+
         if value is None or value == '':
             try:
                 del self.bib_dict[item_name]
@@ -370,6 +400,11 @@ class BibedEntry(EntryActionStatusMixin):
 
         return self.bib_dict.keys()
 
+    def touch(self):
+        ''' Mark the entry as changed. '''
+
+        self.revision = next(self.REVISIONS)
+
     def set_timestamp_and_owner(self):
 
         if gpod('bib_add_timestamp'):
@@ -405,6 +440,8 @@ class BibedEntry(EntryActionStatusMixin):
 
     def set_field(self, name, value):
 
+        self.touch()
+
         if value in (None, '', ):
             # remove field. Doing this here is
             # required by field mechanics in GUI.
@@ -469,6 +506,9 @@ class BibedEntry(EntryActionStatusMixin):
         # assert lprint_function_name()
         # assert lprint(is_trashed)
 
+        BibedEntry.files_store.journal(
+            self.set_trashed_informations, self.trashed_informations)
+
         if is_trashed:
             assert not self.is_trashed
 
@@ -484,6 +524,21 @@ class BibedEntry(EntryActionStatusMixin):
 
         self.__internal_set_verbb()
 
+    def set_trashed_informations(self, informations):
+        ''' Restore trash-related information, as returned by
+            :attr:`trashed_informations` (can be `None`). '''
+
+        if informations is None:
+            self.__internal_verbb.pop(self.TRASHED_FROM, None)
+            self.__internal_verbb.pop(self.TRASHED_DATE, None)
+
+        else:
+            (self.__internal_verbb[self.TRASHED_FROM],
+             self.__internal_verbb[self.TRASHED_DATE]) = informations
+
+        self.__internal_set_verbb()
+        self.touch()
+
     @property
     def type(self):
 
@@ -793,6 +848,82 @@ class BibedEntry(EntryActionStatusMixin):
 
         return self.year
 
+    # ———————————————————————————————————————————————————————————— icon columns
+
+    @property
+    def icon_type(self):
+
+        return TYPE_PIXBUFS.get(self.col_type, None)
+
+    @property
+    def icon_file(self):
+
+        if not self.get_field('file', ''):
+            return FILE_PIXBUFS[False]
+
+        return FILE_PIXBUFS.get(self.col_type, FILE_PIXBUFS['default'])
+
+    @property
+    def icon_url(self):
+
+        return URL_PIXBUFS[self.get_field('url', '') != '']
+
+    @property
+    def icon_quality(self):
+
+        return QUALITY_STATUS_PIXBUFS.get(self.col_quality, None)
+
+    @property
+    def icon_read_status(self):
+
+        return READ_STATUS_PIXBUFS.get(self.col_read_status, None)
+
+    @property
+    def icon_abstract_or_comment(self):
+
+        return COMMENT_PIXBUFS[self.col_abstract_or_comment]
+
+    # ———————————————————————————————————————————— sort columns (not displayed)
+
+    @property
+    def sort_author(self):
+        ''' Last names first, then first names, of authors or editors. '''
+
+        names = self.author or self.editor
+
+        if not names:
+            return ''
+
+        sortable_names = []
+
+        # Braced parts (eg. `{Barnes and Noble}`) are never split.
+        for name in bibtex_split(' '.join(names.split()), ' and '):
+            parts = bibtex_split(name.strip(), ',')
+
+            if len(parts) > 1:
+                # “von Last, First” or “von Last, Jr, First”.
+                last_name, first_name = parts[0], parts[-1]
+
+            else:
+                words = bibtex_split(parts[0], ' ')
+                last_name, first_name = words[-1], ' '.join(words[:-1])
+
+            sortable_names.append('{} {}'.format(
+                last_name.strip(), first_name.strip()).strip())
+
+        return sort_text(latex_to_text(' '.join(sortable_names)))
+
+    @property
+    def sort_title(self):
+
+        return sort_text(self.__clean_for_display('title'),
+                         SORT_IGNORED_ARTICLES)
+
+    @property
+    def sort_in_or_by(self):
+
+        return sort_text(self.col_in_or_by)
+
     # —————————————————————————————————————————— search columns (not displayed)
 
     @property
@@ -832,6 +963,29 @@ class BibedEntry(EntryActionStatusMixin):
 
     @property
     def col_tooltip(self):
+        ''' Tooltip markup, rendered once per :meth:`tooltip_key`. '''
+
+        key = self.tooltip_key()
+        tooltip = self.TOOLTIPS.get(key)
+
+        if tooltip is None:
+            tooltip = self.__render_tooltip()
+            self.TOOLTIPS[key] = tooltip
+
+        return tooltip
+
+    def tooltip_key(self):
+        ''' Everything the tooltip markup depends on. Open files matter
+            to trashed entries and to database names. '''
+
+        files_store = BibedEntry.files_store
+
+        return (
+            self.docid, self.revision, self.database.objectid, self.THEME,
+            None if files_store is None else files_store.generation,
+        )
+
+    def __render_tooltip(self):
 
         esc = self.__escape_for_tooltip
         is_trashed = self.is_trashed
@@ -912,22 +1066,7 @@ class BibedEntry(EntryActionStatusMixin):
         if is_trashed:
             tFrom, tDate = self.trashed_informations
 
-            missing = False
-
-            try:
-                tType = BibedEntry.files_store.get_filetype(tFrom)
-
-            except FileNotFoundError:
-                # Most probably a deleted database, but could be also (99%)
-                # that the current method is called while the origin BIB file
-                # is unloaded. This happens notably at application start.
-
-                if os.path.exists(tFrom):
-                    tType = FileTypes.USER
-
-                else:
-                    tType = FileTypes.NOTFOUND
-                    missing = True
+            tType, missing = BibedEntry.files_store.get_origin(tFrom)
 
             # TODO: what if trashed from QUEUE? FileTypes must be dynamic!
             tFrom = markup_bib_filename(
@@ -1030,6 +1169,8 @@ class BibedEntry(EntryActionStatusMixin):
 
     def update_store_row(self, fields=None):
 
+        self.touch()
+
         if self.database:
             LOGGER.debug('{0}.update_store_row({1})'.format(self, fields))
             # If we have no database, entry is not yet created.
@@ -1039,6 +1180,8 @@ class BibedEntry(EntryActionStatusMixin):
     def pivot_key(self):
         ''' Special method to update an entry key in the data store. '''
 
+        self.touch()
+
         self.database.data_store.update_entry(
             self, {BibAttrs.KEY: self.key}, old_keys=self.ids)
 
@@ -1052,7 +1195,10 @@ class BibedEntry(EntryActionStatusMixin):
 
         self.set_timestamp_and_owner()
 
-        self.update_store_row({BibAttrs.QUALITY: self.quality})
+        self.update_store_row({
+            BibAttrs.QUALITY: self.quality,
+            BibAttrs.QUALITY_ICON: self.icon_quality,
+        })
 
     def cycle_read_status(self):
 
@@ -1070,7 +1216,10 @@ class BibedEntry(EntryActionStatusMixin):
 
         self.set_timestamp_and_owner()
 
-        self.update_store_row({BibAttrs.READ: self.read_status})
+        self.update_store_row({
+            BibAttrs.READ: self.read_status,
+            BibAttrs.READ_ICON: self.icon_read_status,
+        })
 
     def delete(self, write=True):
 
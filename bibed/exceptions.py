@@ -17,6 +17,11 @@ class BibedStringException(BibedException):
     pass
 
 
+class TaskCancelledException(BibedException):
+    ''' Raised in a background task, when its future was cancelled. '''
+    pass
+
+
 class ActionError(BibedError):
     def __init__(self, action, *args, **kwargs):
         self.action = action
@@ -63,6 +68,32 @@ class BibKeyNotFoundError(BibedError):
     pass
 
 
+# ——————————————————————————————————————————————————————————— Daemon exceptions
+
+
+class BibedDaemonError(BibedError):
+    pass
+
+
+class DaemonTaskError(BibedDaemonError):
+    ''' A task failed in the worker process. Its exception cannot
+        always be pickled, thus we only get its type name, message
+        and formatted traceback. '''
+
+    def __init__(self, task, error_type, message, traceback):
+        self.task = task
+        self.error_type = error_type
+        self.traceback = traceback
+
+        super().__init__('{} task failed with {}: {}'.format(
+            task, error_type, message))
+
+
+class DaemonCrashedError(BibedDaemonError):
+    ''' The worker process died while running a task, too many times. '''
+    pass
+
+
 # ————————————————————————————————————————————————————————— Database exceptions
 
 
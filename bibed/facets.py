@@ -0,0 +1,122 @@
+
+import logging
+
+from bibed.index import bits_count
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Facet name → attribute of the search index holding its counters.
+FACETS = (
+    'databases',
+    'types',
+    'years',
+    'keywords',
+)
+
+
+class BibedFacets:
+    ''' Entries counts per database, type, year and keyword.
+
+        Counters are the docids sets of the search index secondary
+        indexes, which the data store maintains on every add, update
+        and delete. Thus global counts cost nothing more to maintain,
+        and counts restricted to a search result are computed with
+        bitsets intersections instead of iterating rows.
+
+        .. note:: this class does not depend on GTK.
+    '''
+
+    def __init__(self, index):
+
+        self.index = index
+
+    def __getitem__(self, facet):
+
+        if facet not in FACETS:
+            raise KeyError(facet)
+
+        return getattr(self.index, facet)
+
+    def scope(self, result=None, dbids=None):
+        ''' Return the docids bitset counts are restricted to, or `None`
+            when they cover the whole index.
+
+            :param result: a :class:`~bibed.query.BibedQueryResult`.
+            :param dbids: an iterable of databases IDs.
+        '''
+
+        bits = None if result is None else result.bits
+
+        if dbids is not None:
+            dbids_bits = self.index.all_bits(dbids)
+
+            bits = dbids_bits if bits is None else bits & dbids_bits
+
+        return bits
+
+    def counts(self, facet, result=None, dbids=None):
+        ''' Return `{value: count}` for `facet`.
+
+            :param result: a :class:`~bibed.query.BibedQueryResult`, to
+                restrict counts to the documents it matched.
+            :param dbids: databases IDs to restrict counts to.
+
+            Without `result` nor `dbids`, counts are global. Values with
+            no document in the scope are omitted.
+        '''
+
+        secondary = self[facet]
+        scope_bits = self.scope(result, dbids)
+
+        if scope_bits is None:
+            return secondary.counts()
+
+        counts = {}
+
+        if not scope_bits:
+            return counts
+
+        for value in secondary:
+            count = bits_count(secondary.bits(value) & scope_bits)
+
+            if count:
+                counts[value] = count
+
+        return counts
+
+    def top(self, facet, limit=None, result=None, dbids=None):
+        ''' Return `[(value, count), …]` for `facet`, most frequent first. '''
+
+        counts = sorted(
+            self.counts(facet, result, dbids).items(),
+            key=lambda item: (-item[1], str(item[0])),
+        )
+
+        if limit is None:
+            return counts
+
+        return counts[:limit]
+
+    def total(self, result=None, dbids=None):
+        ''' Return the number of documents in the scope. '''
+
+        scope_bits = self.scope(result, dbids)
+
+        if scope_bits is None:
+            return len(self.index)
+
+        return bits_count(scope_bits)
+
+    def stats(self, result=None, dbids=None):
+        ''' Return all facets counts, plus the total count, as a dict. '''
+
+        stats = {
+            facet: self.counts(facet, result, dbids)
+            for facet in FACETS
+        }
+
+        stats['total'] = self.total(result, dbids)
+
+        return stats
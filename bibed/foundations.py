@@ -1,6 +1,7 @@
 
 import os
 import logging
+import collections
 
 
 #
@@ -40,23 +41,78 @@ class Anything:
 
     def __init__(self, store_args_list=None):
         '''
-            :param store_args_list: an iterable of strings, of which any will be
-                set as attribute of self with incremental integer value.
-                This is useful to build named enums.
+            :param store_args_list: an iterable of `(name, type)` tuples,
+                of which any name will be set as attribute of self with
+                incremental integer value. This is useful to build named
+                enums. A `None` type marks a value which is not part of
+                the store args (kept Python-side only); these must come
+                after all others.
         '''
         if store_args_list:
             self.__store_args = []
+            self.__count = 0
 
             for index, arg in enumerate(store_args_list):
                 arg_name, arg_type = arg
                 setattr(self, arg_name, index)
-                self.__store_args.append(arg_type)
+                self.__count += 1
+
+                if arg_type is not None:
+                    assert len(self.__store_args) == index
+                    self.__store_args.append(arg_type)
+
+    @property
+    def values_count(self):
+        ''' Number of values, including those not in store args. '''
+        return self.__count
 
     @property
     def as_store_args(self):
         return self.__store_args[:]
 
 
+class LRUCache:
+    ''' A dict-like cache keeping at most `maxsize` items,
+        evicting the least recently used ones first. '''
+
+    def __init__(self, maxsize):
+
+        self.maxsize = maxsize
+        self.__data = collections.OrderedDict()
+
+    def __len__(self):
+
+        return len(self.__data)
+
+    def __contains__(self, key):
+
+        return key in self.__data
+
+    def get(self, key, default=None):
+
+        try:
+            self.__data.move_to_end(key)
+
+        except KeyError:
+            return default
+
+        return self.__data[key]
+
+    def __setitem__(self, key, value):
+
+        data = self.__data
+
+        data[key] = value
+        data.move_to_end(key)
+
+        while len(data) > self.maxsize:
+            data.popitem(last=False)
+
+    def clear(self):
+
+        self.__data.clear()
+
+
 class AttributeDict(object):
     """
     A class to convert a nested Dictionary into an object with key-values
@@ -142,6 +142,7 @@ class GtkCssAwareMixin:
             self.__css_theme_disabled = 'dark'
 
         BibedEntry.COLORS = ENTRY_COLORS[self.__css_theme]
+        BibedEntry.THEME = self.__css_theme
 
         # self.icon_theme.add_resource_path(BIBED_ICONS_DIR)
 
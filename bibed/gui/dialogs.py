@@ -141,27 +141,28 @@ class BibedMoveDialog(Gtk.MessageDialog):
 
         databases_to_write = set()
 
-        for entry in self.entries:
-            if entry.database == self.destination_database:
-                self.unchanged_count += 1
-                continue
+        with self.destination_database.files_store.transaction():
+            for entry in self.entries:
+                if entry.database == self.destination_database:
+                    self.unchanged_count += 1
+                    continue
 
-            # Source database is about to loose en entry,
-            # It needs a save() after the operation.
-            databases_to_write.add(entry.database)
+                # Source database is about to loose en entry,
+                # It needs a save() after the operation.
+                databases_to_write.add(entry.database)
 
-            self.destination_database.move_entry(
-                # We do not write at at each move, this will
-                # be done once and for all at end of operation.
-                entry, self.destination_database, write=False)
+                self.destination_database.move_entry(
+                    # We do not write at at each move, this will
+                    # be done once and for all at end of operation.
+                    entry, self.destination_database, write=False)
 
-            self.moved_count += 1
+                self.moved_count += 1
 
-        if self.moved_count:
-            databases_to_write.add(self.destination_database)
+            if self.moved_count:
+                databases_to_write.add(self.destination_database)
 
-        for database in databases_to_write:
-            database.write()
+            for database in databases_to_write:
+                database.write()
 
     def on_destination_toggled(self, button, destination, *args):
 
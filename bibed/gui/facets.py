@@ -0,0 +1,124 @@
+import logging
+
+from bibed.constants import (
+    BOXES_BORDER_WIDTH,
+    GRID_COLS_SPACING,
+    FACETS_TOP_COUNT,
+)
+
+from bibed.exceptions import NoDatabaseForDBIDError
+from bibed.strings import friendly_filename
+from bibed.gui.helpers import widget_properties
+from bibed.gtk import Gtk, GLib
+from bibed.locale import _
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BibedFacetsPopover(Gtk.Popover):
+    ''' Show top counts per database, type, year and keyword.
+
+        Counts are restricted to the current search result, if any.
+        They are recomputed each time the popover is shown.
+    '''
+
+    def __init__(self, relative_to, *args, **kwargs):
+
+        super().__init__()
+
+        self.window = kwargs.pop('window')
+        self.application = self.window.application
+        self.data = self.application.data
+
+        self.set_position(Gtk.PositionType.BOTTOM)
+        self.set_relative_to(relative_to)
+
+        self.grid = Gtk.Grid()
+        self.grid.set_column_spacing(GRID_COLS_SPACING)
+        self.grid.set_border_width(BOXES_BORDER_WIDTH)
+
+        self.labels = {}
+
+        for column, (facet, title) in enumerate((
+            ('databases', _('Databases')),
+            ('types', _('Types')),
+            ('years', _('Years')),
+            ('keywords', _('Keywords')),
+        )):
+            title_label = widget_properties(
+                Gtk.Label(),
+                halign=Gtk.Align.START,
+            )
+            title_label.set_markup('<b>{}</b>'.format(title))
+
+            label = widget_properties(
+                Gtk.Label(),
+                halign=Gtk.Align.START,
+                valign=Gtk.Align.START,
+            )
+
+            self.grid.attach(title_label, column, 0, 1, 1)
+            self.grid.attach(label, column, 1, 1, 1)
+
+            self.labels[facet] = label
+
+        self.total_label = widget_properties(
+            Gtk.Label(),
+            halign=Gtk.Align.START,
+        )
+
+        self.grid.attach(self.total_label, 0, 2, 4, 1)
+
+        self.add(self.grid)
+
+        self.connect('show', self.on_show)
+
+    def facet_value_markup(self, facet, value):
+
+        if facet == 'databases':
+            try:
+                database = self.application.files.get_database(dbid=value)
+
+            except NoDatabaseForDBIDError:
+                return _('<i>closed</i>')
+
+            return GLib.markup_escape_text(
+                friendly_filename(database.filename))
+
+        if value == '':
+            return _('<i>none</i>')
+
+        return GLib.markup_escape_text(str(value))
+
+    def update(self):
+
+        facets = self.data.facets
+        result = self.application.filter_result
+        dbids = self.data.facets_dbids(result)
+
+        for facet, label in self.labels.items():
+            label.set_markup('\n'.join(
+                '{value} <span color="grey">{count}</span>'.format(
+                    value=self.facet_value_markup(facet, value),
+                    count=count)
+                for value, count in facets.top(
+                    facet, FACETS_TOP_COUNT, result, dbids)
+            ))
+
+        total = facets.total(dbids=self.data.facets_dbids())
+
+        if result is None:
+            self.total_label.set_markup(
+                _('{total} entries').format(total=total))
+
+        else:
+            self.total_label.set_markup(
+                _('{count} entries matched by search, on {total}').format(
+                    count=facets.total(result), total=total))
+
+        self.grid.show_all()
+
+    def on_show(self, *args):
+
+        self.update()
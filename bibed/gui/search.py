@@ -11,6 +11,7 @@ from bibed.constants import (
 )
 
 from bibed.decorators import run_at_most_every
+from bibed.locale import _
 from bibed.gtk import Gtk, Gdk, Pango
 from bibed.gui.helpers import label_with_markup
 
@@ -61,6 +62,12 @@ class BibedSearchBar(Gtk.SearchBar):
         grid.attach(self.search, 1, 0, 1, 1)
         grid.attach(help_label_right, 2, 0, 1, 1)
 
+        self.search.set_tooltip_markup(_(
+            'Words must all match. Use <b>|</b> for alternatives, '
+            '<b>-word</b> to exclude, <b>"a phrase"</b>, <b>(groups)</b>, '
+            '<b>/regex/</b>, <b>y:2010..2015</b> or <b>y:>2015</b> for years.'
+        ))
+
         self.connect_entry(self.search)
 
         self.grid = grid
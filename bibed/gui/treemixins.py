@@ -3,12 +3,6 @@ from bibed.ltrace import lprint_function_name, lprint_caller_name
 
 from bibed.constants import (
     BibAttrs,
-    URL_PIXBUFS,
-    FILE_PIXBUFS,
-    TYPE_PIXBUFS,
-    COMMENT_PIXBUFS,
-    READ_STATUS_PIXBUFS,
-    QUALITY_STATUS_PIXBUFS,
     COL_KEY_WIDTH,
     COL_TYPE_WIDTH,
     COL_YEAR_WIDTH,
@@ -18,7 +12,7 @@ from bibed.constants import (
     # COL_SEPARATOR_WIDTH,
 )
 
-from bibed.decorators import run_at_most_every, only_one_when_idle
+from bibed.decorators import throttled
 from bibed.utils import (
     open_with_system_launcher,
     open_urls_in_web_browser,
@@ -28,7 +22,7 @@ from bibed.preferences import gpod
 from bibed.entry import BibedEntry
 from bibed.locale import _, C_, n_
 
-from bibed.gtk import Gtk, Gio, Pango
+from bibed.gtk import Gtk, Pango
 from bibed.gui.helpers import widgets_hide, widgets_show
 
 
@@ -38,31 +32,11 @@ class BibedEntryTreeViewMixin:
 
     SELECTION_MODE = Gtk.SelectionMode.MULTIPLE
 
-    def setup_pixbufs(self):
-
-        for attr_name, constant_dict in (
-            ('quality_status_pixbufs', QUALITY_STATUS_PIXBUFS),
-            ('read_status_pixbufs', READ_STATUS_PIXBUFS),
-            ('comment_pixbufs', COMMENT_PIXBUFS),
-            ('type_pixbufs', TYPE_PIXBUFS),
-            ('file_pixbufs', FILE_PIXBUFS),
-            ('url_pixbufs', URL_PIXBUFS),
-        ):
-            temp_dict = {}
-
-            for status, icon_name in constant_dict.items():
-                if icon_name:
-                    temp_dict[status] = Gio.ThemedIcon.new(icon_name)
-                else:
-                    temp_dict[status] = None
-
-            setattr(self, attr_name, temp_dict)
-
     def setup_treeview_columns(self):
 
         self.col_type = self.setup_pixbuf_column(
             'type', C_('treeview header', 'T'), BibAttrs.TYPE,
-            self.get_type_cell_column,
+            BibAttrs.TYPE_ICON,
             # tooltip=_('Entry type'),
         )
 
@@ -79,41 +53,45 @@ class BibedEntryTreeViewMixin:
 
         self.col_file = self.setup_pixbuf_column(
             'file', C_('treeview header', 'F'), BibAttrs.FILE,
-            self.get_file_cell_column, self.on_file_clicked,
+            BibAttrs.FILE_ICON, self.on_file_clicked,
             # tooltip=_('File (PDF)'),
         )
         self.col_url = self.setup_pixbuf_column(
             'url', C_('treeview header', 'U'), BibAttrs.URL,
-            self.get_url_cell_column, self.on_url_clicked,
+            BibAttrs.URL_ICON, self.on_url_clicked,
             # tooltip=_('URL of entry')
         )
         self.col_quality = self.setup_pixbuf_column(
             'quality', C_('treeview header', 'Q'), BibAttrs.QUALITY,
-            self.get_quality_cell_column, self.on_quality_clicked,
+            BibAttrs.QUALITY_ICON, self.on_quality_clicked,
             # tooltip=_('Verified qualify')
         )
         self.col_read_status = self.setup_pixbuf_column(
             'read_status', C_('treeview header', 'R'), BibAttrs.READ,
-            self.get_read_cell_column, self.on_read_clicked,
+            BibAttrs.READ_ICON, self.on_read_clicked,
             # tooltip=_('Read status')
         )
         self.col_abstract_or_comment = self.setup_pixbuf_column(
-            'abstract_or_comment', C_('treeview header', 'C'), BibAttrs.ABSTRACT_OR_COMMENT, self.get_comment_cell_column,
+            'abstract_or_comment', C_('treeview header', 'C'), BibAttrs.ABSTRACT_OR_COMMENT,
+            BibAttrs.COMMENT_ICON,
             # tooltip=_('Personal comment(s)')
         )
 
         self.col_author = self.setup_text_column(
             'author', _('Author(s)'), BibAttrs.AUTHOR,
+            sort_column=BibAttrs.SORT_AUTHOR,
             ellipsize=Pango.EllipsizeMode.END,
             attributes={'foreground': BibAttrs.COLOR},
         )
         self.col_title = self.setup_text_column(
-            'title', _('Title'), BibAttrs.TITLE, resizable=True,
+            'title', _('Title'), BibAttrs.TITLE,
+            sort_column=BibAttrs.SORT_TITLE, resizable=True,
             ellipsize=Pango.EllipsizeMode.MIDDLE,
             attributes={'foreground': BibAttrs.COLOR},
         )
         self.col_in_or_by = self.setup_text_column(
             'in_or_by', _('In, by or how'), BibAttrs.IN_OR_BY,
+            sort_column=BibAttrs.SORT_IN_OR_BY,
             ellipsize=Pango.EllipsizeMode.END,
             attributes={'foreground': BibAttrs.COLOR},
         )
@@ -123,7 +101,7 @@ class BibedEntryTreeViewMixin:
             attributes={'foreground': BibAttrs.COLOR},
         )
 
-    @run_at_most_every(125)
+    @throttled(125)
     def on_size_allocate(self, treeview, rectangle):
 
         self.set_columns_widths(rectangle.width)
@@ -208,51 +186,6 @@ class BibedEntryTreeViewMixin:
         self.col_in_or_by.set_fixed_width(col_in_or_by_width)
         self.col_year.set_fixed_width(col_year_width)
 
-    # ————————————————————————————————————————————————————————— Pixbufs columns
-
-    def get_type_cell_column(self, col, cell, model, iter, user_data):
-
-        cell.set_property(
-            'gicon', self.type_pixbufs[
-                model.get_value(iter, BibAttrs.TYPE)
-            ]
-        )
-
-    def get_read_cell_column(self, col, cell, model, iter, user_data):
-        cell.set_property(
-            'gicon', self.read_status_pixbufs[
-                model.get_value(iter, BibAttrs.READ)])
-
-    def get_quality_cell_column(self, col, cell, model, iter, user_data):
-        cell.set_property(
-            'gicon', self.quality_status_pixbufs[
-                model.get_value(iter, BibAttrs.QUALITY)])
-
-    def get_comment_cell_column(self, col, cell, model, iter, user_data):
-
-        cell.set_property(
-            'gicon', self.comment_pixbufs[
-                model.get_value(iter, BibAttrs.ABSTRACT_OR_COMMENT)
-            ]
-        )
-
-    def get_url_cell_column(self, col, cell, model, iter, user_data):
-        cell.set_property(
-            'gicon', self.url_pixbufs[
-                model.get_value(iter, BibAttrs.URL) != ''])
-
-    def get_file_cell_column(self, col, cell, model, iter, user_data):
-
-        entry_type = model.get_value(iter, BibAttrs.TYPE)
-        has_file = model.get_value(iter, BibAttrs.FILE) != ''
-
-        cell.set_property(
-            'gicon', self.file_pixbufs.get(
-                entry_type if has_file else False,
-                self.file_pixbufs['default']
-            )
-        )
-
     # ———————————————————————————————————————————————————————— Entry selection
 
     def get_entry_by_path(self, path, only_row=False):
@@ -266,21 +199,18 @@ class BibedEntryTreeViewMixin:
         rows    = []
         entries = []
 
-        key_index  = BibAttrs.KEY
-        dbid_index = BibAttrs.DBID
+        # Rows reference their entry by handle: no database lookup.
+        handle_index = BibAttrs.HANDLE
+        entries_table = self.application.data.entries
 
         for path in paths:
             treeiter = model.get_iter(path)
-            row      = model[treeiter]
 
             if only_rows:
-                rows.append(row)
+                rows.append(model[treeiter])
                 continue
 
-            bib_key = row[key_index]
-            dbid = row[dbid_index]
-
-            entry = self.files.get_entry_by_key(bib_key, dbid=dbid)
+            entry = entries_table[model.get_value(treeiter, handle_index)]
 
             if return_iter:
                 entries.append((entry, treeiter, ))
@@ -326,7 +256,7 @@ class BibedEntryTreeViewMixin:
             self.col_year,
         ):
             icon_size = Gtk.IconSize.DIALOG
-            icon_name = TYPE_PIXBUFS[entry.type]
+            icon_name = entry.icon_type
 
             markup = (
                 '<big>{typee}</big> '
@@ -346,8 +276,7 @@ class BibedEntryTreeViewMixin:
 
             if efile != '':
                 icon_size = Gtk.IconSize.DIALOG
-                icon_name = FILE_PIXBUFS.get(
-                    entry.type, FILE_PIXBUFS['default'])
+                icon_name = entry.icon_file
 
                 if entry.type in ('audio', 'music', ):
                     markup_base = _('Play {file}')
@@ -362,7 +291,7 @@ class BibedEntryTreeViewMixin:
             read_status = entry.col_read_status
 
             icon_size = Gtk.IconSize.DIALOG
-            icon_name = READ_STATUS_PIXBUFS[read_status]
+            icon_name = entry.icon_read_status
 
             if read_status == 'read':
                 markup = _('You read this entry')
@@ -379,7 +308,7 @@ class BibedEntryTreeViewMixin:
 
             if abs_or_com is not None:
                 icon_size = Gtk.IconSize.DIALOG
-                icon_name = COMMENT_PIXBUFS[abs_or_com]
+                icon_name = entry.icon_abstract_or_comment
 
                 if abs_or_com == 'both':
                     markup = _('Entry has an abstract and personal comment')
@@ -392,7 +321,7 @@ class BibedEntryTreeViewMixin:
 
         elif column == self.col_title:
             icon_size = Gtk.IconSize.from_name('BIBED_BIG')
-            icon_name = TYPE_PIXBUFS[entry.type]
+            icon_name = entry.icon_type
             markup = entry.col_tooltip
 
         if icon_size:
@@ -34,13 +34,6 @@ class BibedMainTreeView(Gtk.TreeView, BibedEntryTreeViewMixin):
 
         super().__init__(*args, **kwargs)
 
-        try:
-            # Subclasses implementations, not required.
-            self.setup_pixbufs()
-
-        except AttributeError:
-            pass
-
         # We get better search via global SearchEntry
         self.set_enable_search(False)
 
@@ -79,7 +72,7 @@ class BibedMainTreeView(Gtk.TreeView, BibedEntryTreeViewMixin):
         except AttributeError:
             pass
 
-    def setup_text_column(self, name, label, store_num, attributes=None, resizable=False, expand=False, min=None, max=None, xalign=None, ellipsize=None, tooltip=None):  # NOQA
+    def setup_text_column(self, name, label, store_num, attributes=None, resizable=False, expand=False, min=None, max=None, xalign=None, ellipsize=None, tooltip=None, sort_column=None):  # NOQA
 
         if ellipsize is None:
             ellipsize = Pango.EllipsizeMode.NONE
@@ -103,7 +96,9 @@ class BibedMainTreeView(Gtk.TreeView, BibedEntryTreeViewMixin):
         for attr_name, column_num in attributes.items():
             column.add_attribute(cellrender, attr_name, column_num)
 
-        column.set_sort_column_id(store_num)
+        # Markup columns sort on a precomputed plain-text key.
+        column.set_sort_column_id(
+            store_num if sort_column is None else sort_column)
 
         column.set_reorderable(True)
         column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
@@ -124,7 +119,7 @@ class BibedMainTreeView(Gtk.TreeView, BibedEntryTreeViewMixin):
 
         return column
 
-    def setup_pixbuf_column(self, name, label, store_num, renderer_method, signal_method=None, tooltip=None):
+    def setup_pixbuf_column(self, name, label, store_num, icon_column, signal_method=None, tooltip=None):
 
         if signal_method:
             renderer = CellRendererTogglePixbuf()
@@ -146,7 +141,9 @@ class BibedMainTreeView(Gtk.TreeView, BibedEntryTreeViewMixin):
         column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
         column.set_fixed_width(COL_PIXBUF_WIDTH)
 
-        column.set_cell_data_func(renderer, renderer_method)
+        # Icon names are precomputed in the store: no Python
+        # callback is involved when rendering cells.
+        column.add_attribute(renderer, 'icon-name', icon_column)
 
         if signal_method is not None:
             renderer.connect('clicked', signal_method)
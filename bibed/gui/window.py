@@ -21,6 +21,7 @@ from bibed.preferences import memories, gpod
 from bibed.user import get_user_home_directory
 from bibed.strings import friendly_filename
 from bibed.entry import BibedEntry
+from bibed.aio import spawn
 
 from bibed.gtk import Gio, GLib, Gtk, Gdk
 
@@ -39,6 +40,7 @@ from bibed.gui.helpers import (
 )
 from bibed.gui.preferences import BibedPreferencesDialog
 from bibed.gui.database import BibedDatabasePopover
+from bibed.gui.facets import BibedFacetsPopover
 from bibed.gui.treeview import BibedMainTreeView
 from bibed.gui.search import BibedSearchBar
 from bibed.gui.entry_type import BibedEntryTypeDialog
@@ -377,6 +379,26 @@ class BibedWindow(Gtk.ApplicationWindow):
 
         hb.pack_end(self.btn_search)
 
+        # —————————————————————————————————————————————————————————————— Facets
+
+        self.btn_facets = Gtk.Button()
+        self.btn_facets.set_tooltip_markup(
+            _('Show entries counts per database, type, year and keyword')
+        )
+        icon = Gio.ThemedIcon(name='view-list-symbolic')
+        image = Gtk.Image.new_from_gicon(icon, Gtk.IconSize.BUTTON)
+        self.btn_facets.add(image)
+
+        self.facets_popover = BibedFacetsPopover(
+            self.btn_facets, window=self)
+
+        # Same toggle behaviour as the databases popover.
+        self.btn_facets.connect('clicked',
+                                self.on_file_select_clicked,
+                                self.facets_popover)
+
+        hb.pack_end(self.btn_facets)
+
         # ————————————————————————————————————————————————————————— End buttons
 
         self.headerbar = hb
@@ -748,27 +770,27 @@ class BibedWindow(Gtk.ApplicationWindow):
 
         elif ctrl and keyval == Gdk.KEY_s:
 
-            if not gpod('bib_auto_save'):
-                LOGGER.info('Control-S pressed (no action yet).')
-
-            # TODO: save selected files.
+            spawn(self.application.save_databases_async(
+                  tuple(self.application.files.selected_databases)),
+                  owner=self)
 
         elif ctrl and keyval == Gdk.KEY_r:
 
             # keep memory, in case file order change during reload.
             selected_databases = tuple(self.application.files.selected_databases)
 
-            with self.block_signals():
-                # Don't let combo change and update “memories” while we
-                # just reload files to attain same conditions as now.
-                self.application.reload_databases(
-                    _('Reloaded all open databases at user request.')
-                )
+            def on_reloaded(result):
+                # restore memory / session
+                self.set_selected_databases(selected_databases)
 
-            # restore memory / session
-            self.set_selected_databases(selected_databases)
+                self.do_activate()
 
-            self.do_activate()
+            # Signals are blocked during reload: don't let combo change
+            # and update “memories” while we just reload files to attain
+            # same conditions as now.
+            spawn(self.application.reload_databases_async(
+                  _('Reloaded all open databases at user request.')),
+                  owner=self, on_done=on_reloaded)
 
         elif ctrl_shift and keyval == Gdk.KEY_R:
             # NOTE: the upper case 'R'
@@ -908,29 +930,24 @@ class BibedWindow(Gtk.ApplicationWindow):
         if response == Gtk.ResponseType.OK:
             # dialog.set_select_multiple(False)
             # self.application.open_file(dialog.get_filename())
-            filenames = dialog.get_filenames()
-            databases_to_select = []
 
-            # Same problem as in app.do_activate(): when loading more than two
-            # files, only the two first fire a on_*changed() signal. Thus we
-            # block everything, and compute things manually after load.
-            with self.block_signals():
-                for filename in filenames:
-                    databases_to_select.append(
-                        # Don't select individually, we will select
-                        # all newly opened databases grouped at once.
-                        self.application.open_file(filename, select=False)
-                    )
-
-            self.set_selected_databases(databases_to_select)
-
-            self.do_activate()
+            # Files are parsed in the background, and loaded with
+            # signals blocked. We select all newly opened databases
+            # grouped at once, after load.
+            spawn(self.application.open_files_async(dialog.get_filenames()),
+                  owner=self, on_done=self.on_files_opened)
 
         elif response == Gtk.ResponseType.CANCEL:
             pass
 
         dialog.destroy()
 
+    def on_files_opened(self, databases):
+
+        self.set_selected_databases(databases)
+
+        self.do_activate()
+
     def on_file_select_clicked(self, button, popover):
 
         if popover.is_visible():
@@ -1102,12 +1119,13 @@ class BibedWindow(Gtk.ApplicationWindow):
         def delete_callback(selected_entries):
             databases_to_write = set()
 
-            for entry in selected_entries:
-                databases_to_write.add(entry.database)
-                entry.delete(write=False)
+            with self.application.files.transaction():
+                for entry in selected_entries:
+                    databases_to_write.add(entry.database)
+                    entry.delete(write=False)
 
-            for database in databases_to_write:
-                database.write()
+                for database in databases_to_write:
+                    database.write()
 
             self.do_filter_data_store()
 
@@ -1286,6 +1304,11 @@ class BibedWindow(Gtk.ApplicationWindow):
         # assert lprint_caller_name(levels=2)
         # assert lprint_function_name()
 
+        if self.application.data.bulk_detached:
+            # Filter models are detached. Filtering
+            # will happen once, at end of bulk load.
+            return
+
         selected_filenames = tuple(
             x.filename for x in self.application.files.selected_databases
         )
@@ -1308,16 +1331,12 @@ class BibedWindow(Gtk.ApplicationWindow):
             if memories.search_text is not None:
                 del memories.search_text
 
-        def refilter():
-            self.matched_databases = set()
-            self.treeview.set_model(self.application.sorter)
-            self.application.filter.refilter()
+        self.matched_databases = set()
 
-        if (':' in search_text and len(search_text) > 3) \
-                or (':' not in search_text and len(search_text) > 1):
-            refilter()
+        self.application.data_filter_prepare(
+            search_text, self.get_selected_databases(only_ids=True))
 
-        else:
-            refilter()
+        self.treeview.set_model(self.application.sorter)
+        self.application.filter.refilter()
 
         self.update_title()
@@ -0,0 +1,676 @@
+import heapq
+import bisect
+import logging
+
+from bibed.constants import (
+    BibAttrs,
+    SEARCH_SPECIALS,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Columns whose content is searched by words without a special prefix.
+FULL_TEXT_COLUMNS = (
+    BibAttrs.AUTHOR,
+    BibAttrs.TITLE,
+    BibAttrs.IN_OR_BY,
+    BibAttrs.SUBTITLE,
+    BibAttrs.COMMENT,
+    BibAttrs.ABSTRACT,
+    BibAttrs.KEYWORDS,
+)
+
+# Columns reachable via `x:value` search specials.
+SPECIAL_COLUMNS = tuple(index for char, index, label in SEARCH_SPECIALS)
+
+# All columns read by the search index, see `indexed_values()`.
+INDEXED_COLUMNS = tuple(sorted(set(
+    FULL_TEXT_COLUMNS + SPECIAL_COLUMNS
+    + (BibAttrs.YEAR, BibAttrs.TYPE, BibAttrs.KEYWORDS)
+)))
+
+# Expressed in number of search terms.
+WORDS_CACHE_SIZE = 64
+
+# byte value → positions of its set bits, for bitsets decoding.
+BYTE_BITS = tuple(
+    tuple(bit for bit in range(8) if byte & (1 << bit))
+    for byte in range(256)
+)
+
+
+def indexed_values(values):
+    ''' Return the part of data store row `values` read by the search
+        index, as a dict. Unlike rows, which hold pixbufs, it can be
+        sent to the worker process. '''
+
+    return {
+        column: values[column]
+        for column in INDEXED_COLUMNS
+    }
+
+
+def to_search_text(value):
+    ''' Lower a store value for search, whatever its type. '''
+
+    if value is None:
+        return ''
+
+    if isinstance(value, int):
+        return str(value)
+
+    return value.lower()
+
+
+def to_keywords(value):
+    ''' Split the comma-separated keywords column. '''
+
+    if not value:
+        return ()
+
+    return tuple(
+        keyword.strip()
+        for keyword in value.split(',')
+        if keyword.strip()
+    )
+
+
+def to_year(value):
+    ''' Return `value` as an int year, or None for no / invalid year. '''
+
+    try:
+        year = int(value)
+
+    except (TypeError, ValueError):
+        return None
+
+    return year or None
+
+
+# ———————————————————————————————————————————————————————————————— Bitsets
+
+
+def docids_to_bits(docids):
+    ''' Convert an iterable of docids to an int bitset. '''
+
+    docids = tuple(docids)
+
+    if not docids:
+        return 0
+
+    buffer = bytearray((max(docids) >> 3) + 1)
+
+    for docid in docids:
+        buffer[docid >> 3] |= 1 << (docid & 7)
+
+    return int.from_bytes(buffer, 'little')
+
+
+def bits_to_docids(bits):
+    ''' Convert a (non-negative) int bitset to a set of docids. '''
+
+    docids = set()
+
+    if not bits:
+        return docids
+
+    buffer = bits.to_bytes((bits.bit_length() + 7) >> 3, 'little')
+    add = docids.add
+
+    for byte_index, byte in enumerate(buffer):
+        if byte:
+            base = byte_index << 3
+
+            for bit in BYTE_BITS[byte]:
+                add(base + bit)
+
+    return docids
+
+
+def bits_count(bits):
+    ''' Number of docids in a bitset. '''
+
+    return bin(bits).count('1')
+
+
+class BitsetIndex:
+    ''' Secondary index of a single-valued document attribute.
+
+        Keeps `value → set(docids)` and `docid → value`. The int bitset
+        of each value is built lazily and cached until the value docids
+        change, for set operations between indexes to run on machine
+        words instead of Python objects.
+    '''
+
+    def __init__(self):
+
+        # value → set(docids)
+        self.docids = {}
+
+        # docid → value
+        self.values = {}
+
+        # value → cached bitset.
+        self.__bits = {}
+
+    def __len__(self):
+
+        return len(self.docids)
+
+    def __iter__(self):
+
+        return iter(self.docids)
+
+    def add(self, docid, value):
+
+        self.values[docid] = value
+        self.add_value(docid, value)
+
+    def remove(self, docid):
+        ''' Remove `docid` from the index, and return its old value. '''
+
+        value = self.values.pop(docid)
+        self.remove_value(docid, value)
+
+        return value
+
+    def add_value(self, docid, value):
+
+        try:
+            self.docids[value].add(docid)
+
+        except KeyError:
+            self.docids[value] = {docid}
+            self.value_added(value)
+
+        self.__bits.pop(value, None)
+
+    def remove_value(self, docid, value):
+
+        docids = self.docids[value]
+        docids.discard(docid)
+
+        if not docids:
+            del self.docids[value]
+            self.value_removed(value)
+
+        self.__bits.pop(value, None)
+
+    def value_added(self, value):
+        ''' Hook for subclasses, called when `value` appears. '''
+
+        pass
+
+    def value_removed(self, value):
+        ''' Hook for subclasses, called when `value` disappears. '''
+
+        pass
+
+    def get(self, value):
+
+        return self.docids.get(value, set())
+
+    def count(self, value):
+
+        return len(self.docids.get(value, ()))
+
+    def counts(self):
+        ''' Return `{value: count}` for all indexed values. '''
+
+        return {
+            value: len(docids)
+            for value, docids in self.docids.items()
+        }
+
+    def bits(self, value):
+
+        try:
+            return self.__bits[value]
+
+        except KeyError:
+            pass
+
+        bits = docids_to_bits(self.docids.get(value, ()))
+
+        if value in self.docids:
+            self.__bits[value] = bits
+
+        return bits
+
+    def union(self, values):
+
+        result = set()
+
+        for value in values:
+            result |= self.docids.get(value, set())
+
+        return result
+
+    def union_bits(self, values):
+
+        result = 0
+
+        for value in values:
+            result |= self.bits(value)
+
+        return result
+
+
+class MultiBitsetIndex(BitsetIndex):
+    ''' A :class:`BitsetIndex` for multi-valued attributes (eg. keywords):
+        `values` holds a tuple of distinct values per docid. '''
+
+    def add(self, docid, values):
+
+        values = tuple(set(values))
+
+        self.values[docid] = values
+
+        for value in values:
+            self.add_value(docid, value)
+
+    def remove(self, docid):
+
+        values = self.values.pop(docid)
+
+        for value in values:
+            self.remove_value(docid, value)
+
+        return values
+
+
+class SortedBitsetIndex(BitsetIndex):
+    ''' A :class:`BitsetIndex` which keeps its distinct values sorted,
+        for range queries. Values must be comparable between them. '''
+
+    def __init__(self):
+
+        super().__init__()
+
+        self.sorted_values = []
+
+    def value_added(self, value):
+
+        bisect.insort(self.sorted_values, value)
+
+    def value_removed(self, value):
+
+        del self.sorted_values[
+            bisect.bisect_left(self.sorted_values, value)]
+
+    def range(self, low=None, high=None):
+        ''' Return distinct values between `low` and `high`, inclusive.
+            Any of them can be `None` for an unbounded range. '''
+
+        sorted_values = self.sorted_values
+
+        start = 0 if low is None else bisect.bisect_left(sorted_values, low)
+        end = (len(sorted_values) if high is None
+               else bisect.bisect_right(sorted_values, high))
+
+        return sorted_values[start:end]
+
+    def range_docids(self, low=None, high=None):
+
+        return self.union(self.range(low, high))
+
+    def range_bits(self, low=None, high=None):
+
+        return self.union_bits(self.range(low, high))
+
+
+# ——————————————————————————————————————————————————————————— Search index
+
+
+class BibedSearchIndex:
+    ''' In-memory index of the data store contents, used by search queries.
+
+        Every indexed entry gets a document ID (`docid`), a small integer
+        which is reused after entry removal to keep IDs dense. The index
+        keeps the lowered full-text and special columns of each document,
+        plus an inverted index of whitespace-delimited words.
+
+        Because words are whitespace-delimited, a search term without any
+        whitespace is contained in a document full-text if and only if it
+        is contained in one of the document words. Thus the inverted index
+        gives exact candidates for simple terms, by scanning the words
+        vocabulary instead of the documents.
+
+        Years, types, databases and keywords are kept in secondary indexes
+        (see :class:`BitsetIndex`), for range queries and combined
+        filters to run on bitsets without touching documents.
+
+        .. note:: this class does not depend on GTK, for it to be usable
+            in benchmarks and background processes.
+    '''
+
+    def __init__(self):
+
+        # (dbid, key) → docid
+        self.docids = {}
+
+        # docid → lowered full-text (all FULL_TEXT_COLUMNS joined).
+        self.texts = {}
+
+        # docid → {column: lowered value} for SPECIAL_COLUMNS.
+        self.columns = {}
+
+        # Typed secondary indexes. Documents
+        # without a year are not in `years`.
+        self.years = SortedBitsetIndex()
+        self.types = BitsetIndex()
+        self.databases = BitsetIndex()
+        self.keywords = MultiBitsetIndex()
+
+        # word → set(docids)
+        self.words = {}
+
+        # Incremented at each mutation. Query results
+        # use it to know if they are still accurate.
+        self.generation = 0
+
+        # docid → generation of last change.
+        self.revisions = {}
+
+        # term → list of matching words, valid for `words_cache_generation`.
+        self.words_cache = {}
+        self.words_cache_generation = 0
+
+        self.__free_docids = []
+        self.__next_docid = 0
+
+    def __len__(self):
+
+        return len(self.texts)
+
+    # ——————————————————————————————————————————————————————————— Mutations
+
+    def __allocate_docid(self):
+
+        if self.__free_docids:
+            return heapq.heappop(self.__free_docids)
+
+        docid = self.__next_docid
+        self.__next_docid += 1
+
+        return docid
+
+    def __index_words(self, docid, text):
+
+        words = self.words
+
+        for word in set(text.split()):
+            try:
+                words[word].add(docid)
+
+            except KeyError:
+                words[word] = {docid}
+
+    def __unindex_words(self, docid, text):
+
+        words = self.words
+
+        for word in set(text.split()):
+            docids = words[word]
+            docids.discard(docid)
+
+            if not docids:
+                del words[word]
+
+    def __unset_document(self, docid):
+
+        self.__unindex_words(docid, self.texts.pop(docid))
+
+        del self.columns[docid]
+
+        if docid in self.years.values:
+            self.years.remove(docid)
+
+        self.types.remove(docid)
+        self.keywords.remove(docid)
+
+    def __set_document(self, docid, values):
+
+        text = ' '.join(
+            to_search_text(values[column])
+            for column in FULL_TEXT_COLUMNS
+        )
+
+        self.texts[docid] = text
+        self.columns[docid] = {
+            column: to_search_text(values[column])
+            for column in SPECIAL_COLUMNS
+        }
+
+        year = to_year(values[BibAttrs.YEAR])
+
+        if year is not None:
+            self.years.add(docid, year)
+
+        self.types.add(docid, to_search_text(values[BibAttrs.TYPE]))
+        self.keywords.add(docid, to_keywords(values[BibAttrs.KEYWORDS]))
+
+        self.__index_words(docid, text)
+
+        self.generation += 1
+        self.revisions[docid] = self.generation
+
+    def add(self, dbid, key, values):
+        ''' Index a new document.
+
+            :param values: a data store row, as built
+                by :class:`~bibed.store.BibedDataStore`.
+            :returns: the document ID.
+        '''
+
+        docid = self.__allocate_docid()
+
+        self.docids[(dbid, key)] = docid
+        self.databases.add(docid, dbid)
+
+        self.__set_document(docid, values)
+
+        return docid
+
+    def update(self, dbid, key, values, old_keys=None):
+        ''' Re-index a document, eventually renamed from one of `old_keys`. '''
+
+        docid = None
+
+        for old_key in (old_keys or ()):
+            docid = self.docids.pop((dbid, old_key), None)
+
+            if docid is not None:
+                break
+
+        if docid is None:
+            docid = self.docids.get((dbid, key), None)
+
+        if docid is None:
+            LOGGER.warning('Cannot update unindexed entry {}@{}.'.format(
+                           key, dbid))
+            return self.add(dbid, key, values)
+
+        self.docids[(dbid, key)] = docid
+
+        self.__unset_document(docid)
+        self.__set_document(docid, values)
+
+        return docid
+
+    def remove(self, dbid, key):
+
+        docid = self.docids.pop((dbid, key), None)
+
+        if docid is None:
+            LOGGER.warning('Cannot remove unindexed entry {}@{}.'.format(
+                           key, dbid))
+            return None
+
+        self.__unset_document(docid)
+        self.databases.remove(docid)
+
+        del self.revisions[docid]
+
+        heapq.heappush(self.__free_docids, docid)
+
+        self.generation += 1
+
+        return docid
+
+    def merge(self, other):
+        ''' Add all documents of the `other` index, eg. built by the
+            worker `INDEX` task. Their docids change: get them with
+            :meth:`get_docid`. Faster than :meth:`add`, which splits
+            texts into words again. '''
+
+        self.generation += 1
+
+        generation = self.generation
+        mapping = {}
+
+        for (dbid, key), other_docid in sorted(
+                other.docids.items(), key=lambda item: item[1]):
+
+            docid = self.__allocate_docid()
+            mapping[other_docid] = docid
+
+            self.docids[(dbid, key)] = docid
+            self.databases.add(docid, dbid)
+
+            self.texts[docid] = other.texts[other_docid]
+            self.columns[docid] = other.columns[other_docid]
+
+            year = other.years.values.get(other_docid, None)
+
+            if year is not None:
+                self.years.add(docid, year)
+
+            self.types.add(docid, other.types.values[other_docid])
+            self.keywords.add(docid, other.keywords.values[other_docid])
+
+            self.revisions[docid] = generation
+
+        words = self.words
+
+        for word, other_docids in other.words.items():
+            docids = {mapping[other_docid] for other_docid in other_docids}
+
+            try:
+                words[word] |= docids
+
+            except KeyError:
+                words[word] = docids
+
+    def remove_database(self, dbid):
+        ''' Remove all documents of a database.
+
+            :returns: the list of removed docids.
+        '''
+
+        return [
+            self.remove(doc_dbid, key)
+            for (doc_dbid, key) in [
+                pair for pair in self.docids if pair[0] == dbid
+            ]
+        ]
+
+    # ————————————————————————————————————————————————————————————— Queries
+
+    def get_docid(self, dbid, key):
+
+        return self.docids.get((dbid, key), None)
+
+    def all_docids(self, dbids=None):
+
+        if dbids is None:
+            return set(self.texts)
+
+        return self.databases.union(dbids)
+
+    def all_bits(self, dbids=None):
+
+        if dbids is None:
+            return docids_to_bits(self.texts)
+
+        return self.databases.union_bits(dbids)
+
+    def types_matching(self, term):
+        ''' Return indexed types containing `term`, eg. `book` gives
+            `book`, `inbook` and `booklet`. '''
+
+        return [value for value in self.types if term in value]
+
+    def select_bits(self, dbids=None, types=None, low=None, high=None):
+        ''' Combined database ∧ type ∧ year filter, on bitsets.
+
+            :param dbids: iterable of database IDs, or `None` for all.
+            :param types: iterable of exact (lowered) entry types,
+                or `None` for all.
+            :param low: minimum year (inclusive), or `None`.
+            :param high: maximum year (inclusive), or `None`.
+        '''
+
+        bits = self.all_bits(dbids)
+
+        if types is not None:
+            bits &= self.types.union_bits(types)
+
+        if low is not None or high is not None:
+            bits &= self.years.range_bits(low, high)
+
+        return bits
+
+    def select(self, dbids=None, types=None, low=None, high=None):
+        ''' Same as :meth:`select_bits`, but returns a set of docids. '''
+
+        return bits_to_docids(self.select_bits(dbids, types, low, high))
+
+    def matching_words(self, term):
+        ''' Return the list of indexed words that contain `term`.
+
+            Results are cached until next mutation. When the user types
+            a search progressively, the words matching the previous term
+            are a superset of those matching the new one, so only them
+            are scanned.
+        '''
+
+        if self.words_cache_generation != self.generation \
+                or len(self.words_cache) > WORDS_CACHE_SIZE:
+            self.words_cache = {}
+            self.words_cache_generation = self.generation
+
+        try:
+            return self.words_cache[term]
+
+        except KeyError:
+            pass
+
+        vocabulary = None
+
+        for cached_term, cached_words in self.words_cache.items():
+            if cached_term in term and (
+                    vocabulary is None or len(cached_words) < len(vocabulary)):
+                vocabulary = cached_words
+
+        if vocabulary is None:
+            vocabulary = self.words
+
+        matched = [word for word in vocabulary if term in word]
+
+        self.words_cache[term] = matched
+
+        return matched
+
+    def docids_for_term(self, term):
+        ''' Return docids whose full-text contains `term` (without spaces). '''
+
+        words = self.words
+        result = set()
+
+        for word in self.matching_words(term):
+            result |= words[word]
+
+        return result
@@ -1,29 +1,220 @@
 
 import logging
-from threading import Thread, Event
+import threading
+import concurrent.futures
 
-from bibed.gtk import Gtk
+from bibed.constants import EXECUTOR_MAX_WORKERS
+from bibed.exceptions import TaskCancelledException
+from bibed.foundations import Singleton
+from bibed.gtk import GLib
 
 
 LOGGER = logging.getLogger(__name__)
 
 
-class BibedEventThread(Thread):
+class BibedFuture:
+    ''' The result of a function running in :class:`BibedExecutor`.
 
-    def __init__(self, event, *args, **kwargs):
+        Callbacks always run in the main loop, via :func:`GLib.idle_add`.
+        Cancellation is cooperative once the function started: it can
+        call :meth:`check_cancelled` to stop early. Either `on_done` or
+        `on_error` always runs, the latter with a
+        :class:`TaskCancelledException` if the task was cancelled.
+    '''
+
+    def __init__(self, func, on_done=None, on_error=None, on_progress=None):
+
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+
+        self.future = None
+        self.cancel_event = threading.Event()
+
+    def __str__(self):
+
+        return 'BibedFuture({}{})'.format(
+            self.func.__qualname__,
+            ', cancelled' if self.cancelled else '')
+
+    # ———————————————————————————————————————————————————— Caller side
+
+    def cancel(self):
+        ''' Cancel the task. If not yet started, it will not run. '''
+
+        self.cancel_event.set()
+
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+
+        # The executor cancels not-started futures at shutdown.
+        return self.cancel_event.is_set() or (
+            self.future is not None and self.future.cancelled())
+
+    def done(self):
+
+        return self.future is not None and self.future.done()
+
+    def result(self, timeout=None):
+        ''' Block until the result is available. Do not call from
+            the main loop, use `on_done` instead. '''
+
+        return self.future.result(timeout)
+
+    def exception(self, timeout=None):
 
-        super().__init__(*args, **kwargs)
+        return self.future.exception(timeout)
 
-        self.event = event
+    # ——————————————————————————————————————————————————— Function side
 
-    def run(self):
+    def check_cancelled(self):
+        ''' Raise :class:`TaskCancelledException` if cancelled. '''
 
-        super().run()
+        if self.cancel_event.is_set():
+            raise TaskCancelledException(self.func.__qualname__)
 
-        if self.event is not None:
-            self.event.set()
+    def progress(self, value, total=None):
+        ''' Report progress, from the running function. '''
 
-        LOGGER.debug('BibedEventThread: finished.')
+        if self.on_progress is not None:
+            GLib.idle_add(self.__run_callback, self.on_progress,
+                          self, value, total)
+
+    # ———————————————————————————————————————————————————————— Internals
+
+    def set_future(self, future):
+
+        self.future = future
+
+        future.add_done_callback(self.on_future_done)
+
+    def on_future_done(self, future):
+        ''' Run in the worker (or right away, if cancelled). '''
+
+        if self.cancelled:
+            # Whatever the function did, its result is not wanted.
+            exception = TaskCancelledException(self.func.__qualname__)
+
+        else:
+            exception = future.exception()
+
+        if exception is None:
+            if self.on_done is not None:
+                GLib.idle_add(self.__run_callback, self.on_done,
+                              future.result())
+
+        elif isinstance(exception, TaskCancelledException):
+            LOGGER.debug('{} cancelled.'.format(self))
+
+            if self.on_error is not None:
+                GLib.idle_add(self.__run_callback, self.on_error, exception)
+
+        elif self.on_error is not None:
+            GLib.idle_add(self.__run_callback, self.on_error, exception)
+
+        else:
+            LOGGER.error('{} failed.'.format(self), exc_info=exception)
+
+    def __run_callback(self, callback, *args):
+
+        callback(*args)
+
+        # Remove from idle callbacks.
+        return False
+
+
+class BibedExecutor(metaclass=Singleton):
+    ''' One bounded pool of threads for all background work (writing,
+        backups, imports, index builds…). CPU-bound tasks rather run
+        in the worker process, see :mod:`bibed.daemon`.
+    '''
+
+    def __init__(self, max_workers=EXECUTOR_MAX_WORKERS):
+
+        self.max_workers = max_workers
+
+        self.threads = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='bibed')
+
+        # Not-done futures, for introspection and shutdown. Futures
+        # remove themselves from worker threads, hence the lock.
+        self.futures = set()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+
+        return len(self.futures)
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_progress=None, with_future=False, **kwargs):  # NOQA
+        ''' Run `func(*args, **kwargs)` in the pool.
+
+            :param on_done: called in the main loop with the result.
+            :param on_error: called in the main loop with the exception,
+                or a :class:`TaskCancelledException` if cancelled.
+                Without it, exceptions are logged.
+            :param on_progress: called in the main loop with the future,
+                a value and a total, when the function reports progress.
+            :param with_future: give the :class:`BibedFuture` to `func`
+                as `future` keyword argument, for it to report progress
+                or check cancellation.
+            :returns: a :class:`BibedFuture`.
+        '''
+
+        bibed_future = BibedFuture(func, on_done, on_error, on_progress)
+
+        if with_future:
+            kwargs['future'] = bibed_future
+
+        future = self.threads.submit(func, *args, **kwargs)
+
+        with self.lock:
+            self.futures.add(future)
+
+        future.add_done_callback(self.on_future_done)
+
+        bibed_future.set_future(future)
+
+        return bibed_future
+
+    def on_future_done(self, future):
+
+        with self.lock:
+            self.futures.discard(future)
+
+    def shutdown(self, timeout=None):
+        ''' Wait for submitted functions, then cancel not-started ones.
+
+            :param timeout: in milliseconds. `None` waits until all are
+                done. Functions still running after it are not waited
+                for, but the interpreter joins their threads at exit.
+        '''
+
+        LOGGER.debug('Shutting down executor ({} pending).'.format(
+                     len(self)))
+
+        with self.lock:
+            futures = list(self.futures)
+
+        not_done = concurrent.futures.wait(
+            futures,
+            timeout=None if timeout is None else timeout / 1000).not_done
+
+        if not_done:
+            LOGGER.warning('{} background task(s) not done at shutdown '
+                           'deadline.'.format(len(not_done)))
+
+        for future in not_done:
+            # Only not-started ones get cancelled.
+            future.cancel()
+
+        self.threads.shutdown(wait=False)
+
+
+executor = BibedExecutor()
 
 
 # ————————————————————————————————————————————————————————————————————— Helpers
@@ -31,27 +222,43 @@ class BibedEventThread(Thread):
 
 
 def run_and_wait_on(func, *args, **kwargs):
+    ''' Run `func` in the executor, and iterate the main loop until it
+        is done, without blocking the GUI nor spinning the CPU. '''
+
+    loop = GLib.MainLoop()
 
-    event = Event()
-    # start thread on func with event
+    def quit_loop(*args):
+        loop.quit()
 
-    thread = BibedEventThread(event, target=func, args=args, kwargs=kwargs)
-    thread.start()
+    future = executor.submit(func, *args,
+                             on_done=quit_loop, on_error=quit_loop,
+                             **kwargs)
 
-    while not event.is_set():
-        while Gtk.events_pending():
-            Gtk.main_iteration()
+    if not future.done():
+        loop.run()
 
-    thread.join()
+    if future.cancelled:
+        raise TaskCancelledException(func.__qualname__)
+
+    exception = future.exception()
+
+    if exception is not None:
+        raise exception
 
 
 def run_in_background(func, event, *args, **kwargs):
-    ''' Start a daemon thread and forget it. It should run a finite function.
+    ''' Run a finite function in the executor, and forget it.
 
         :param event: a :class:`~threading.Event` instance. Can be ``none``.
-            If given, the event will be set when the daemon thread exits.
+            If given, the event will be set when the function returns.
     '''
 
-    thread = BibedEventThread(event, target=func, args=args, kwargs=kwargs)
-    thread.daemon = True
-    thread.start()
+    def run_and_set():
+        try:
+            func(*args, **kwargs)
+
+        finally:
+            if event is not None:
+                event.set()
+
+    return executor.submit(run_and_set)
@@ -0,0 +1,928 @@
+import re
+import logging
+
+from bibed.constants import (
+    BibAttrs,
+    SEARCH_SPECIALS,
+)
+from bibed.index import (
+    FULL_TEXT_COLUMNS,
+    docids_to_bits,
+    bits_to_docids,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Search specials, as `{char: column}`, eg. `{'t': BibAttrs.TITLE}`.
+SPECIALS = {
+    char.lower(): index for char, index, label in SEARCH_SPECIALS
+}
+
+OPERATOR_OR  = 'OR'
+OPERATOR_NOT = 'NOT'
+OPERATOR_AND = 'AND'
+
+YEAR_RANGE_SEPARATOR = '..'
+
+# Year comparisons, eg. `y:>2015`. Longest first, for parsing.
+YEAR_COMPARISONS = ('>=', '<=', '>', '<', '=')
+
+# Tokens types.
+TK_LPAREN  = 'lparen'
+TK_RPAREN  = 'rparen'
+TK_OR      = 'or'
+TK_NOT     = 'not'
+TK_TERM    = 'term'
+TK_SPECIAL = 'special'
+TK_REGEX   = 'regex'
+
+# Relative costs of per-document verification, used to order predicates.
+COST_SUBSTRING = 1
+COST_RANGE     = 1
+COST_REGEX     = 3
+
+
+# ————————————————————————————————————————————————————————————— Query nodes
+
+
+class QueryNode:
+    ''' Base class of compiled query predicates.
+
+        `indexable` nodes can compute a candidates set from the search
+        index. When they are also `exact`, the candidates are exactly
+        the matching documents, and no verification is needed.
+
+        `bitset` nodes are exact and can compute their matches as an int
+        bitset from the typed indexes (years, types, databases), which
+        is much faster to combine than sets.
+    '''
+
+    indexable = False
+    exact = False
+    bitset = False
+    cost = COST_SUBSTRING
+
+    def candidates(self, index):
+        return None
+
+    def bits(self, index):
+        raise NotImplementedError
+
+    def match(self, index, docid):
+        ''' Evaluate the predicate on one document. '''
+
+        raise NotImplementedError
+
+    def verify(self, index, docid):
+        ''' Check what the candidates set did not already guarantee. '''
+
+        return self.match(index, docid)
+
+
+class TermNode(QueryNode):
+    ''' A search term, without any whitespace. '''
+
+    indexable = True
+    exact = True
+
+    def __init__(self, term):
+        self.term = term
+
+    def __str__(self):
+        return 'term({})'.format(self.term)
+
+    def candidates(self, index):
+        return index.docids_for_term(self.term)
+
+    def match(self, index, docid):
+        return self.term in index.texts[docid]
+
+    def verify(self, index, docid):
+        return True
+
+
+class PhraseNode(QueryNode):
+    ''' A quoted search phrase. Candidates come from its words. '''
+
+    indexable = True
+
+    def __init__(self, phrase):
+        self.phrase = phrase
+        self.words = phrase.split()
+
+    def __str__(self):
+        return 'phrase("{}")'.format(self.phrase)
+
+    def candidates(self, index):
+        return intersect(index.docids_for_term(word) for word in self.words)
+
+    def match(self, index, docid):
+        return self.phrase in index.texts[docid]
+
+
+class SpecialNode(QueryNode):
+    ''' A `x:value` special search, on one column only. '''
+
+    def __init__(self, column, value):
+        self.column = column
+        self.value = value
+
+        # When the column is part of the full-text, the
+        # words index gives us a superset of candidates.
+        self.indexable = column in FULL_TEXT_COLUMNS and bool(value.split())
+
+    def __str__(self):
+        return 'special({}:{})'.format(self.column, self.value)
+
+    def candidates(self, index):
+        return intersect(
+            index.docids_for_term(word) for word in self.value.split())
+
+    def match(self, index, docid):
+        return self.value in index.columns[docid][self.column]
+
+
+class TypeNode(SpecialNode):
+    ''' `p:value`: matches types containing `value`, from the types index. '''
+
+    indexable = True
+    exact = True
+    bitset = True
+
+    def __init__(self, value):
+        super().__init__(BibAttrs.TYPE, value)
+
+        # Reset after SpecialNode.__init__().
+        self.indexable = True
+
+    def __str__(self):
+        return 'type({})'.format(self.value)
+
+    def candidates(self, index):
+        return index.types.union(index.types_matching(self.value))
+
+    def bits(self, index):
+        return index.types.union_bits(index.types_matching(self.value))
+
+    def verify(self, index, docid):
+        return True
+
+
+class YearRangeNode(QueryNode):
+    ''' `y:2010..2015`, `y:2010..`, `y:..2015`, `y:>2015`, `y:<=2015` or
+        `y:2015`, resolved with the sorted years index. Bounds are
+        inclusive. '''
+
+    indexable = True
+    exact = True
+    bitset = True
+    cost = COST_RANGE
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def __str__(self):
+        return 'years({}..{})'.format(
+            '' if self.low is None else self.low,
+            '' if self.high is None else self.high)
+
+    def candidates(self, index):
+        return index.years.range_docids(self.low, self.high)
+
+    def bits(self, index):
+        return index.years.range_bits(self.low, self.high)
+
+    def verify(self, index, docid):
+        return True
+
+    def match(self, index, docid):
+
+        year = index.years.values.get(docid, None)
+
+        if year is None:
+            return False
+
+        if self.low is not None and year < self.low:
+            return False
+
+        if self.high is not None and year > self.high:
+            return False
+
+        return True
+
+
+class RegexNode(QueryNode):
+    ''' `t:/pattern/` on a column, or `/pattern/` on the full-text. '''
+
+    cost = COST_REGEX
+
+    def __init__(self, column, regex):
+        self.column = column
+        self.regex = regex
+
+    def __str__(self):
+        return 'regex({}/{}/)'.format(
+            '' if self.column is None else '{}:'.format(self.column),
+            self.regex.pattern)
+
+    def match(self, index, docid):
+
+        if self.column is None:
+            return self.regex.search(index.texts[docid]) is not None
+
+        return self.regex.search(
+            index.columns[docid][self.column]) is not None
+
+
+class NotNode(QueryNode):
+
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost + COST_SUBSTRING
+
+    def __str__(self):
+        return 'not({})'.format(self.child)
+
+    def match(self, index, docid):
+        return not self.child.match(index, docid)
+
+
+class AndNode(QueryNode):
+    ''' All children must match.
+
+        Bitset children are combined first, then candidates sets of
+        other indexable children are intersected, smallest first.
+        Remaining children are verified on the survivors only,
+        cheapest first.
+    '''
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda child: child.cost)
+
+        self.indexable = any(child.indexable for child in children)
+        self.exact = all(
+            child.indexable and child.exact for child in children)
+        self.bitset = all(child.bitset for child in children)
+
+        self.bitset_children = [
+            child for child in self.children if child.bitset
+        ]
+
+        self.to_verify = [
+            child for child in self.children
+            if not (child.indexable and child.exact)
+        ]
+
+    def __str__(self):
+        return 'and({})'.format(', '.join(str(c) for c in self.children))
+
+    def candidates(self, index):
+
+        sets = [
+            child.candidates(index)
+            for child in self.children
+            if child.indexable and not child.bitset
+        ]
+
+        if self.bitset_children:
+            sets.append(bits_to_docids(self.bits_of(
+                index, self.bitset_children)))
+
+        return intersect(sets)
+
+    def bits(self, index):
+
+        return self.bits_of(index, self.children)
+
+    def bits_of(self, index, children):
+
+        result = None
+
+        for child in children:
+            if result is None:
+                result = child.bits(index)
+
+            else:
+                result &= child.bits(index)
+
+            if not result:
+                break
+
+        return result
+
+    def match(self, index, docid):
+
+        for child in self.children:
+            if not child.match(index, docid):
+                return False
+
+        return True
+
+    def verify(self, index, docid):
+
+        for child in self.to_verify:
+            if child.indexable:
+                if not child.verify(index, docid):
+                    return False
+
+            elif not child.match(index, docid):
+                return False
+
+        return True
+
+
+class OrNode(QueryNode):
+    ''' Any child must match. Indexable only if all children are. '''
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda child: child.cost)
+
+        self.indexable = all(child.indexable for child in children)
+        self.exact = all(child.exact for child in children)
+        self.bitset = all(child.bitset for child in children)
+        self.cost = max(child.cost for child in children)
+
+    def __str__(self):
+        return 'or({})'.format(', '.join(str(c) for c in self.children))
+
+    def candidates(self, index):
+
+        result = set()
+
+        for child in self.children:
+            result |= child.candidates(index)
+
+        return result
+
+    def bits(self, index):
+
+        result = 0
+
+        for child in self.children:
+            result |= child.bits(index)
+
+        return result
+
+    def match(self, index, docid):
+
+        for child in self.children:
+            if child.match(index, docid):
+                return True
+
+        return False
+
+
+def intersect(sets):
+    ''' Intersect an iterable of sets, smallest first. '''
+
+    sets = sorted(sets, key=len)
+
+    if not sets:
+        return None
+
+    result = sets[0]
+
+    for other in sets[1:]:
+        if not result:
+            break
+
+        result = result & other
+
+    return result
+
+
+# ——————————————————————————————————————————————————————————— Query parsing
+
+
+def read_until(text, position, stop_char):
+    ''' Read `text` from `position` until an unescaped `stop_char`.
+
+        :returns: a tuple `(value, next_position)`. An unterminated value
+            runs until the end of text, because users are still typing.
+    '''
+
+    length = len(text)
+    start = position
+
+    while position < length:
+        if text[position] == stop_char and text[position - 1] != '\\':
+            return text[start:position], position + 1
+
+        position += 1
+
+    return text[start:], position
+
+
+def read_word(text, position):
+
+    length = len(text)
+    start = position
+
+    while position < length:
+        char = text[position]
+
+        if char.isspace() or char in '()|':
+            break
+
+        position += 1
+
+    return text[start:position], position
+
+
+def tokenize(text):
+    ''' Split a search query into a list of tokens, as tuples. '''
+
+    tokens = []
+    position = 0
+    length = len(text)
+
+    while position < length:
+        char = text[position]
+
+        if char.isspace():
+            position += 1
+
+        elif char == '(':
+            tokens.append((TK_LPAREN, ))
+            position += 1
+
+        elif char == ')':
+            tokens.append((TK_RPAREN, ))
+            position += 1
+
+        elif char == '|':
+            tokens.append((TK_OR, ))
+            position += 1
+
+        elif char == '-' and position + 1 < length \
+                and not text[position + 1].isspace():
+            tokens.append((TK_NOT, ))
+            position += 1
+
+        elif char == '"':
+            value, position = read_until(text, position + 1, '"')
+            tokens.append((TK_TERM, value))
+
+        elif char == '/':
+            value, position = read_until(text, position + 1, '/')
+            tokens.append((TK_REGEX, None, value))
+
+        else:
+            word, next_position = read_word(text, position)
+
+            prefix, colon, value = word.partition(':')
+            column = SPECIALS.get(prefix.lower(), None)
+
+            if colon and column is not None:
+                value_position = position + len(prefix) + 1
+
+                if value == '':
+                    # Special is being typed, or without
+                    # value. Either way, it's not a filter.
+                    position = next_position
+                    continue
+
+                if value.startswith('"'):
+                    value, position = read_until(
+                        text, value_position + 1, '"')
+                    tokens.append((TK_SPECIAL, column, value))
+
+                elif value.startswith('/'):
+                    value, position = read_until(
+                        text, value_position + 1, '/')
+                    tokens.append((TK_REGEX, column, value))
+
+                else:
+                    tokens.append((TK_SPECIAL, column, value))
+                    position = next_position
+
+                continue
+
+            position = next_position
+
+            if word == OPERATOR_OR:
+                tokens.append((TK_OR, ))
+
+            elif word == OPERATOR_NOT:
+                tokens.append((TK_NOT, ))
+
+            elif word == OPERATOR_AND:
+                # AND is implicit, but accept it explicitly too.
+                continue
+
+            else:
+                tokens.append((TK_TERM, word))
+
+    return tokens
+
+
+def parse_year(value):
+
+    value = value.strip()
+
+    if not value:
+        return None
+
+    try:
+        return int(value)
+
+    except ValueError:
+        return None
+
+
+def build_year(value):
+    ''' Build a :class:`YearRangeNode` from a `y:` value.
+
+        Returns `None` if `value` is not a year expression, for it to be
+        searched as text (eg. `y:20` while typing `y:2015`).
+    '''
+
+    if YEAR_RANGE_SEPARATOR in value:
+        low, _, high = value.partition(YEAR_RANGE_SEPARATOR)
+
+        low = parse_year(low)
+        high = parse_year(high)
+
+        if low is None and high is None:
+            return None
+
+        return YearRangeNode(low, high)
+
+    for comparison in YEAR_COMPARISONS:
+        if value.startswith(comparison):
+            year = parse_year(value[len(comparison):])
+
+            if year is None:
+                return None
+
+            if comparison == '>=':
+                return YearRangeNode(year, None)
+
+            elif comparison == '<=':
+                return YearRangeNode(None, year)
+
+            elif comparison == '>':
+                return YearRangeNode(year + 1, None)
+
+            elif comparison == '<':
+                return YearRangeNode(None, year - 1)
+
+            return YearRangeNode(year, year)
+
+    value = value.strip()
+
+    if len(value) == 4 and value.isdigit():
+        year = int(value)
+        return YearRangeNode(year, year)
+
+    return None
+
+
+def build_special(column, value):
+
+    value = value.lower()
+
+    if column == BibAttrs.YEAR:
+        node = build_year(value)
+
+        if node is not None:
+            return node
+
+        if value.startswith(YEAR_COMPARISONS) \
+                or YEAR_RANGE_SEPARATOR in value:
+            # Incomplete expression, eg. `y:>` or `y:..`.
+            return None
+
+    if not value.strip():
+        return None
+
+    if column == BibAttrs.TYPE:
+        return TypeNode(value.strip())
+
+    return SpecialNode(column, value)
+
+
+def build_regex(column, pattern):
+
+    if not pattern:
+        return None
+
+    try:
+        regex = re.compile(pattern, re.IGNORECASE)
+
+    except re.error:
+        # Most probably an incomplete pattern, while the user is
+        # typing. Fall back to plain text search, it's better
+        # to display something than nothing.
+        if column is None:
+            return build_term(pattern)
+
+        return build_special(column, pattern)
+
+    return RegexNode(column, regex)
+
+
+def build_term(value):
+
+    value = value.lower()
+    words = value.split()
+
+    if not words:
+        return None
+
+    if len(words) == 1 and words[0] == value:
+        return TermNode(value)
+
+    return PhraseNode(value)
+
+
+class QueryParser:
+    ''' Recursive descent parser of search queries.
+
+        Grammar, with implicit AND::
+
+            query  := and_expr ( ('OR' | '|') and_expr )*
+            and    := unary+
+            unary  := ('NOT' | '-') unary | atom
+            atom   := '(' query ')' | "phrase" | x:value | x:/regex/ | word
+
+        The parser never fails: search is run while the user types, thus
+        incomplete constructs are either ignored or interpreted as text.
+    '''
+
+    def __init__(self, text):
+
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self):
+
+        try:
+            return self.tokens[self.position]
+
+        except IndexError:
+            return None
+
+    def consume(self):
+
+        token = self.peek()
+        self.position += 1
+
+        return token
+
+    def parse(self):
+
+        node = self.parse_or(top_level=True)
+
+        return node
+
+    def parse_or(self, top_level=False):
+
+        children = []
+
+        while True:
+            node = self.parse_and()
+
+            if node is not None:
+                children.append(node)
+
+            token = self.peek()
+
+            if token is None:
+                break
+
+            elif token[0] == TK_OR:
+                self.consume()
+
+            elif token[0] == TK_RPAREN:
+                if not top_level:
+                    break
+
+                # Unbalanced parenthesis, ignore it.
+                self.consume()
+
+        return combine(OrNode, children)
+
+    def parse_and(self):
+
+        children = []
+
+        while True:
+            token = self.peek()
+
+            if token is None or token[0] in (TK_OR, TK_RPAREN):
+                break
+
+            node = self.parse_unary()
+
+            if node is not None:
+                children.append(node)
+
+        return combine(AndNode, children)
+
+    def parse_unary(self):
+
+        token = self.peek()
+
+        if token[0] == TK_NOT:
+            self.consume()
+
+            token = self.peek()
+
+            if token is None or token[0] in (TK_OR, TK_RPAREN):
+                return None
+
+            child = self.parse_unary()
+
+            if child is None:
+                return None
+
+            return NotNode(child)
+
+        return self.parse_atom()
+
+    def parse_atom(self):
+
+        token = self.consume()
+        token_type = token[0]
+
+        if token_type == TK_LPAREN:
+            node = self.parse_or()
+
+            token = self.peek()
+
+            if token is not None and token[0] == TK_RPAREN:
+                self.consume()
+
+            return node
+
+        elif token_type == TK_TERM:
+            return build_term(token[1])
+
+        elif token_type == TK_SPECIAL:
+            return build_special(token[1], token[2])
+
+        elif token_type == TK_REGEX:
+            return build_regex(token[1], token[2])
+
+        # Operators at the wrong place (eg. “OR OR”). Ignore them.
+        return None
+
+
+def combine(node_class, children):
+
+    if not children:
+        return None
+
+    if len(children) == 1:
+        return children[0]
+
+    return node_class(children)
+
+
+# ——————————————————————————————————————————————————————— Plan and results
+
+
+class BibedQueryResult:
+    ''' The documents matched by a query plan at a given index generation.
+
+        Documents changed after the plan execution (eg. an entry edited
+        while a search is active) are evaluated individually, for the
+        tree model filter to stay accurate without re-running the plan.
+    '''
+
+    def __init__(self, plan, index, docids, dbids=None):
+
+        self.plan = plan
+        self.index = index
+        self.docids = docids
+        self.dbids = None if dbids is None else frozenset(dbids)
+        self.generation = index.generation
+
+        self.__bits = None
+        self.__bits_generation = None
+
+    def __len__(self):
+
+        return len(self.docids)
+
+    @property
+    def bits(self):
+        ''' The matched docids as an int bitset.
+
+            Cached until the index changes; documents added, edited or
+            removed since the plan execution are then evaluated like
+            :meth:`__contains__` does, without re-running the plan.
+        '''
+
+        index = self.index
+
+        if self.__bits_generation == index.generation:
+            return self.__bits
+
+        generation = self.generation
+        revisions = index.revisions
+
+        # Removed documents have no revision anymore.
+        docids = {
+            docid for docid in self.docids
+            if revisions.get(docid, generation + 1) <= generation
+        }
+
+        if index.generation != generation:
+            dbids = self.dbids
+            databases = index.databases.values
+            match = self.plan.match
+
+            docids.update(
+                docid for docid, revision in revisions.items()
+                if revision > generation
+                and (dbids is None or databases[docid] in dbids)
+                and match(index, docid)
+            )
+
+        self.__bits = docids_to_bits(docids)
+        self.__bits_generation = index.generation
+
+        return self.__bits
+
+    def __contains__(self, docid):
+
+        index = self.index
+
+        if index.revisions.get(docid, 0) > self.generation:
+            return self.plan.match(index, docid)
+
+        return docid in self.docids
+
+
+class BibedQueryPlan:
+    ''' A compiled search query.
+
+        Execution first gathers candidates from the search index for
+        selective predicates (words, phrases, full-text specials), then
+        verifies the remaining predicates on these survivors only.
+    '''
+
+    def __init__(self, text):
+
+        self.text = text
+        self.root = QueryParser(text).parse()
+
+    def __str__(self):
+
+        return 'BibedQueryPlan({})'.format(self.root)
+
+    def __bool__(self):
+
+        return self.root is not None
+
+    def match(self, index, docid):
+
+        if self.root is None:
+            return True
+
+        return self.root.match(index, docid)
+
+    def execute(self, index, dbids=None):
+        ''' Run the plan on `index`, eventually restricted to `dbids`.
+
+            :returns: a :class:`BibedQueryResult`.
+        '''
+
+        root = self.root
+
+        if root is None:
+            return BibedQueryResult(
+                self, index, index.all_docids(dbids), dbids)
+
+        if root.bitset:
+            # Database ∧ type ∧ year filters, without any set.
+            return BibedQueryResult(self, index, bits_to_docids(
+                root.bits(index) & index.all_bits(dbids)), dbids)
+
+        scope = index.all_docids(dbids)
+
+        if root.indexable:
+            # Set intersection iterates over the smallest one.
+            survivors = root.candidates(index) & scope
+
+            if not root.exact:
+                verify = root.verify
+
+                survivors = {
+                    docid for docid in survivors
+                    if verify(index, docid)
+                }
+
+        else:
+            match = root.match
+
+            survivors = {
+                docid for docid in scope
+                if match(index, docid)
+            }
+
+        return BibedQueryResult(self, index, survivors, dbids)
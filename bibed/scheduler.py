@@ -0,0 +1,388 @@
+
+import time
+import weakref
+import logging
+
+from bibed.foundations import Singleton
+from bibed.gtk import GLib
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Scheduling modes.
+DEBOUNCE = 'debounce'
+THROTTLE = 'throttle'
+ONCE = 'once'
+
+# Priority lanes: UI tasks run before redraws, idle and I/O
+# tasks; the two others run when the main loop is idle.
+LANE_UI = 'ui'
+LANE_IDLE = 'idle'
+LANE_IO = 'io'
+
+LANES_PRIORITIES = {
+    LANE_UI: GLib.PRIORITY_DEFAULT,
+    LANE_IDLE: GLib.PRIORITY_DEFAULT_IDLE,
+    LANE_IO: GLib.PRIORITY_DEFAULT_IDLE,
+}
+
+# Drain order: UI tasks can schedule I/O ones (eg. saving memories).
+LANES_ORDER = (LANE_UI, LANE_IDLE, LANE_IO)
+
+
+class IdentityRef(weakref.ref):
+    ''' A weak reference compared by identity of its referent.
+
+        Plain weak references compare like their referents do, and
+        some of ours compare by value (eg. databases by filename): a
+        reloaded database would then share the tasks of the old one.
+    '''
+
+    def __init__(self, obj, callback=None):
+
+        super().__init__(obj, callback)
+
+        self.hash = id(obj)
+
+    def __hash__(self):
+
+        return self.hash
+
+    def __eq__(self, other):
+
+        if not isinstance(other, IdentityRef):
+            return NotImplemented
+
+        if self is other:
+            return True
+
+        obj = self()
+
+        # Dead references equal only themselves.
+        return obj is not None and obj is other()
+
+    def __ne__(self, other):
+
+        equal = self.__eq__(other)
+
+        if equal is NotImplemented:
+            return equal
+
+        return not equal
+
+
+def task_key(func, args, limit=2):
+    ''' Return a stable key for calls of `func` with `args`.
+
+        Only the `limit` first arguments count (eg. `self` and the first
+        argument of a method). They are weakly referenced when possible
+        and compared by identity, thus keys do not keep objects alive,
+        and cannot collide with keys of other objects equal to them, or
+        of new objects reusing the `id()` of dead ones.
+    '''
+
+    key = [func]
+
+    for arg in args[:limit]:
+        try:
+            key.append(IdentityRef(arg))
+
+        except TypeError:
+            # int, str, tuple… are compared by value.
+            key.append(arg)
+
+    return tuple(key)
+
+
+class BibedScheduledTask:
+    ''' A call waiting in :class:`BibedScheduler`, coalescing all calls
+        with the same key until it runs. '''
+
+    def __init__(self, key, func, mode, delay, max_latency, lane):
+
+        self.key = key
+        self.func = func
+        self.mode = mode
+        self.delay = delay
+        self.max_latency = max_latency
+        self.lane = lane
+
+        # Arguments of the last call, strongly
+        # referenced until the task runs.
+        self.args = None
+        self.kwargs = None
+
+        # Number of calls coalesced into the next run.
+        self.calls = 0
+
+        # Monotonic times, in seconds.
+        self.first_call = None
+        self.due = None
+        self.last_run = None
+
+        self.source_id = None
+
+        # weakref.finalize() of key objects, see `BibedScheduler.forget()`.
+        self.finalizers = []
+
+    def __str__(self):
+
+        return '{}({}, {}, {} call(s){})'.format(
+            self.func.__qualname__, self.mode, self.lane, self.calls,
+            '' if self.due is None
+            else ', due in {:.3f}s'.format(self.due - time.monotonic()))
+
+    @property
+    def pending(self):
+
+        return self.source_id is not None
+
+    def describe(self):
+        ''' Return a dict describing the task, for introspection. '''
+
+        now = time.monotonic()
+
+        return {
+            'name': self.func.__qualname__,
+            'mode': self.mode,
+            'lane': self.lane,
+            'calls': self.calls,
+            'waiting': None if self.first_call is None
+            else now - self.first_call,
+            'due_in': None if self.due is None else self.due - now,
+        }
+
+
+class BibedScheduler(metaclass=Singleton):
+    ''' Run coalesced calls from the GLib main loop.
+
+        - *debounce*: run `delay` milliseconds after the last call. With
+          `max_latency`, run at most `max_latency` milliseconds after the
+          first pending call, even if calls keep coming.
+        - *throttle*: run at most once every `delay` milliseconds, as soon
+          as possible, with the arguments of the last call.
+        - *once*: run `delay` milliseconds after the first call, with its
+          arguments. Calls made while the task is pending are dropped.
+
+        Except in *once* mode, the task runs with the arguments of the
+        last call. Tasks are keyed with :func:`task_key`.
+    '''
+
+    def __init__(self):
+
+        # key → BibedScheduledTask, pending or not (throttled
+        # tasks are kept to remember when they last ran).
+        self.tasks = {}
+
+    def __len__(self):
+
+        return len(self.pending())
+
+    def pending(self, lane=None):
+        ''' Return pending tasks, soonest due first. '''
+
+        return sorted(
+            (
+                task for task in self.tasks.values()
+                if task.pending and (lane is None or task.lane == lane)
+            ),
+            key=lambda task: task.due,
+        )
+
+    def describe(self):
+
+        return [task.describe() for task in self.pending()]
+
+    def schedule(self, func, args=(), kwargs=None, mode=DEBOUNCE, delay=0, max_latency=None, lane=LANE_UI, key=None):  # NOQA
+        ''' Schedule a call of `func`, merged with pending calls of the
+            same key. Returns the :class:`BibedScheduledTask`. '''
+
+        if key is None:
+            key = task_key(func, args)
+
+        try:
+            task = self.tasks[key]
+
+        except KeyError:
+            task = BibedScheduledTask(
+                key, func, mode, delay, max_latency, lane)
+            self.tasks[key] = task
+
+            for part in key:
+                if isinstance(part, IdentityRef):
+                    # Forget the task when one of its objects dies.
+                    task.finalizers.append(
+                        weakref.finalize(part(), self.forget, key))
+
+        task.calls += 1
+
+        if mode == ONCE and task.pending:
+            # Already queued, with the arguments of the first call.
+            return task
+
+        now = time.monotonic()
+
+        task.args = args
+        task.kwargs = kwargs or {}
+
+        if task.first_call is None:
+            task.first_call = now
+
+        if mode == THROTTLE:
+            if task.pending:
+                # Will run with the new arguments.
+                return task
+
+            due = now if task.last_run is None \
+                else max(now, task.last_run + delay / 1000)
+
+        else:
+            due = now + delay / 1000
+
+            if max_latency is not None:
+                due = min(due, task.first_call + max_latency / 1000)
+
+        self.__set_due(task, due)
+
+        return task
+
+    def __set_due(self, task, due):
+
+        if task.source_id is not None:
+            if due == task.due:
+                return
+
+            GLib.source_remove(task.source_id)
+
+        task.due = due
+
+        priority = LANES_PRIORITIES[task.lane]
+        delay = max(0, int((due - time.monotonic()) * 1000))
+
+        if delay:
+            task.source_id = GLib.timeout_add(
+                delay, self.on_task_due, task, priority=priority)
+
+        else:
+            task.source_id = GLib.idle_add(
+                self.on_task_due, task, priority=priority)
+
+    def on_task_due(self, task):
+
+        # The source is destroyed when we return False.
+        task.source_id = None
+
+        self.run(task)
+
+        return False
+
+    def run(self, task):
+        ''' Run `task` now, if pending. '''
+
+        if task.source_id is not None:
+            GLib.source_remove(task.source_id)
+            task.source_id = None
+
+        if task.args is None:
+            return
+
+        args, kwargs = task.args, task.kwargs
+
+        # Reset before running, for the task to be able to reschedule.
+        task.args = task.kwargs = None
+        task.calls = 0
+        task.first_call = task.due = None
+        task.last_run = time.monotonic()
+
+        if task.mode != THROTTLE:
+            self.remove(task)
+
+        task.func(*args, **kwargs)
+
+    def remove(self, task):
+
+        if self.tasks.get(task.key, None) is task:
+            del self.tasks[task.key]
+
+        for finalizer in task.finalizers:
+            finalizer.detach()
+
+    def cancel(self, key):
+
+        task = self.tasks.get(key, None)
+
+        if task is None:
+            return
+
+        if task.source_id is not None:
+            GLib.source_remove(task.source_id)
+            task.source_id = None
+
+        self.remove(task)
+
+    def forget(self, key):
+        ''' Cancel a task whose objects died. '''
+
+        LOGGER.debug('Forgetting task {}.'.format(key[0].__qualname__))
+
+        self.cancel(key)
+
+    # ——————————————————————————————————————————————————————————————— Drain
+
+    def runnable(self):
+        ''' Return the pending task to run first when draining, or
+            `None`. Lanes come in :data:`LANES_ORDER`, then tasks
+            soonest due first. '''
+
+        for lane in LANES_ORDER:
+            for task in self.pending(lane):
+                return task
+
+        return None
+
+    def drain(self, timeout):
+        ''' Run all pending tasks now, without waiting for their delays.
+
+            Tasks scheduled by drained tasks are drained too. Nothing
+            runs after `timeout`: tasks still pending are reported.
+            Exceptions of tasks are logged, and do not stop the drain.
+
+            :param timeout: in milliseconds.
+            :returns: the list of tasks which missed the deadline.
+        '''
+
+        start = time.monotonic()
+        deadline = start + timeout / 1000
+        drained = 0
+
+        task = self.runnable()
+
+        if task is not None:
+            LOGGER.info('Draining {} scheduled task(s), {:.1f}s '
+                        'at most…'.format(len(self), timeout / 1000))
+
+        while task is not None and time.monotonic() < deadline:
+            try:
+                self.run(task)
+
+            except Exception:
+                LOGGER.exception('Task {} failed while draining.'.format(
+                                 task.func.__qualname__))
+
+            drained += 1
+            task = self.runnable()
+
+        missed = self.pending()
+
+        if missed:
+            LOGGER.warning('{} task(s) missed the drain deadline: {}'.format(
+                len(missed), ', '.join(str(task) for task in missed)))
+
+        elif drained:
+            LOGGER.info('Drained {} task(s) in {:.3f}s.'.format(
+                        drained, time.monotonic() - start))
+
+        return missed
+
+
+scheduler = BibedScheduler()
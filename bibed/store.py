@@ -1,9 +1,7 @@
+import gc
 import os
 import time
 import logging
-import pyinotify
-
-from threading import RLock
 
 from bibed.exceptions import (
     AlreadyLoadedException,
@@ -25,67 +23,69 @@ from bibed.constants import (
     BIBED_SYSTEM_IMPORTED_NAME,
     BIBED_SYSTEM_QUEUE_NAME,
     BIBED_SYSTEM_TRASH_NAME,
+    BULK_DETACH_ROWS,
+    FILE_MONITOR_DELAY,
 )
 
-from bibed.system import touch_file
+from bibed.system import touch_file, file_digest
 from bibed.user import get_bibed_user_dir
 from bibed.preferences import memories
 from bibed.database import BibedDatabase
 from bibed.entry import BibedEntry
+from bibed.index import BibedSearchIndex, indexed_values
+from bibed.facets import BibedFacets
+from bibed.vocabulary import BibedVocabularies
+from bibed.decorators import run_at_most_every
+from bibed.scheduler import LANE_IO
+from bibed.aio import spawn, run_in_executor, in_main_loop
+from bibed.daemon import daemon
+from bibed.worker import DaemonTasks
 
-from bibed.gtk import Gio, GLib, Gtk
+from bibed.gtk import Gio, GLib, GObject, Gtk
 
 
 LOGGER = logging.getLogger(__name__)
 
 
-class PyinotifyEventHandler(pyinotify.ProcessEvent):
+class BibedDataStoreBulkLoadContextManager:
+    ''' Put the data store in bulk-load mode. Can be nested. '''
 
-    app = None
+    def __init__(self, store, gc_pause, detach):
+        self.store = store
+        self.gc_pause = gc_pause
+        self.detach = detach
 
-    def process_IN_MODIFY(self, event):
+    def __enter__(self):
 
-        if __debug__:
-            LOGGER.debug('Modify event start ({}).'.format(event.pathname))
+        self.store.bulk_load_begin(self.gc_pause, self.detach)
 
-        PyinotifyEventHandler.app.on_file_modify(event)
+        return self.store
 
-        if __debug__:
-            LOGGER.debug('Modify event end ({}).'.format(event.pathname))
+    def __exit__(self, exc_type, exc_val, exc_tb):
 
-        return True
+        self.store.bulk_load_end()
 
 
-class BibedFileStoreNoWatchContextManager:
-    ''' A simple context manager to temporarily disable inotify watches. '''
+class BibedFileStoreTransactionContextManager:
+    ''' Group entries and databases mutations. Can be nested: the
+        outermost context commits, or rolls back on error. '''
 
-    def __init__(self, store, filename):
+    def __init__(self, store):
         self.store = store
-        self.filename = filename
-        self.reenable_inotify = True
 
     def __enter__(self):
 
-        # assert lprint_caller_name()
-
-        try:
-            self.store.inotify_remove_watch(self.filename)
-
-        except KeyError:
-            # When called from store.close_database(),
-            # the inotify watch has already been removed.
-            self.reenable_inotify = False
+        self.store.transaction_begin()
 
-        self.store.file_write_lock.acquire()
+        return self.store
 
     def __exit__(self, exc_type, exc_val, exc_tb):
 
-        # assert lprint_caller_name()
-
-        self.store.file_write_lock.release()
+        if exc_type is None:
+            self.store.transaction_commit()
 
-        if self.reenable_inotify:
-            self.store.inotify_add_watch(self.filename)
+        else:
+            self.store.transaction_rollback()
 
 
 class BibedFileStore(Gio.ListStore):
@@ -109,31 +109,33 @@ class BibedFileStore(Gio.ListStore):
         # Will be fille by data_store.__init__()
         self.data_store = None
 
-        # Global lock to avoid concurrent writes,
-        # which are destructive on flat files.
-        self.file_write_lock = RLock()
-
         # Stores the GLib.idle_add() source.
         self.save_trigger_source = None
 
-        self.setup_inotify()
-
-    def lock(self, blocking=True):
+        # Incremented when files are opened or closed, for
+        # caches depending on them to know they are stale.
+        self.generation = 0
 
-        # assert lprint_function_name()
-        # assert lprint(blocking)
+        # filename → (filetype, missing), see `get_origin()`.
+        self.origins = {}
 
-        self.file_write_lock.acquire(blocking=blocking)
+        self.connect('items-changed', self.on_items_changed)
 
-    def unlock(self):
+        # Transactions: nesting depth, databases to write at commit,
+        # those among them with a write pending since before the
+        # transaction, and `(callable, args)` to undo changes in
+        # case of rollback.
+        self.transaction_depth = 0
+        self.transaction_writes = None
+        self.transaction_pending_writes = None
+        self.transaction_journal = None
 
-        # assert lprint_function_name()
+        self.setup_monitors()
 
-        try:
-            self.file_write_lock.release()
+    def on_items_changed(self, store, position, removed, added):
 
-        except Exception as e:
-            LOGGER.exception(e)
+        self.generation += 1
+        self.origins.clear()
 
     # ———————————————————————————————————————————————————————————— System files
 
@@ -166,17 +168,18 @@ class BibedFileStore(Gio.ListStore):
         trash_database = self.get_database(filetype=FileTypes.TRASH)
         databases_to_write = set((trash_database, ))
 
-        for entry in entries:
-            entry.set_trashed()
+        with self.transaction():
+            for entry in entries:
+                entry.set_trashed()
 
-            # Note the database BEFORE the move(), because
-            # after move(), its the trash database.
-            databases_to_write.add(entry.database)
+                # Note the database BEFORE the move(), because
+                # after move(), its the trash database.
+                databases_to_write.add(entry.database)
 
-            entry.database.move_entry(entry, trash_database)
+                entry.database.move_entry(entry, trash_database, write=False)
 
-        for database in databases_to_write:
-            database.write()
+            for database in databases_to_write:
+                database.write()
 
     def untrash_entries(self, entries):
 
@@ -186,117 +189,296 @@ class BibedFileStore(Gio.ListStore):
         databases_to_write = set((trash_database, ))
         databases_to_unload = set()
 
-        for entry in entries:
-            trashed_from, trashed_date = entry.trashed_informations
+        with self.transaction():
+            for entry in entries:
+                trashed_from, trashed_date = entry.trashed_informations
 
-            # wipe trash-related informations.
-            entry.set_trashed(False)
+                # wipe trash-related informations.
+                entry.set_trashed(False)
 
-            try:
-                database = self.get_database(filename=trashed_from)
+                try:
+                    database = self.get_database(filename=trashed_from)
 
-            except NoDatabaseForFilenameError:
-                # Database is not loaded.
+                except NoDatabaseForFilenameError:
+                    # Database is not loaded.
 
-                # Load without remembering, without affecting GUI.
-                self.load(filename=trashed_from,
-                          filetype=FileTypes.TRANSIENT)
+                    # Load without remembering, without affecting GUI.
+                    self.load(filename=trashed_from,
+                              filetype=FileTypes.TRANSIENT)
 
-                database = self.get_database(filename=trashed_from)
+                    database = self.get_database(filename=trashed_from)
 
-                databases_to_unload.add(database)
+                    databases_to_unload.add(database)
 
-            trash_database.move_entry(entry, database)
+                trash_database.move_entry(entry, database, write=False)
 
-            databases_to_write.add(database)
+                databases_to_write.add(database)
 
-        for database in databases_to_write:
-            database.write()
+            for database in databases_to_write:
+                database.write()
 
+        # Only after commit, which writes them.
         for database in databases_to_unload:
             self.close(database.filename)
 
-    # ————————————————————————————————————————————————————————————————— Inotify
+    # ———————————————————————————————————————————————————————————— Transactions
 
-    def setup_inotify(self):
+    @property
+    def in_transaction(self):
 
-        # assert lprint_function_name()
+        return self.transaction_depth > 0
+
+    def transaction(self):
+        ''' Return a context manager to mutate many entries at once.
+
+            Inside it, the data store is in bulk-load mode (views are
+            refiltered once at the end, and detached only for many new
+            rows), and :meth:`BibedDatabase.write` calls are deferred,
+            for each touched database to be written only once, at commit.
+
+            If an exception occurs, recorded changes (see
+            :meth:`journal`) are undone in reverse order, writes
+            requested inside the transaction are dropped, and the
+            exception is propagated.
+        '''
+
+        return BibedFileStoreTransactionContextManager(self)
+
+    def transaction_begin(self):
+
+        self.transaction_depth += 1
+
+        if self.transaction_depth > 1:
+            return
+
+        self.transaction_writes = set()
+        self.transaction_pending_writes = set()
+        self.transaction_journal = []
+
+        if self.data_store is not None:
+            self.data_store.bulk_load_begin(gc_pause=False, detach=False)
+
+    def transaction_commit(self):
+
+        self.transaction_depth -= 1
+
+        if self.transaction_depth > 0:
+            return
 
-        PyinotifyEventHandler.app = self
+        databases_to_write = self.transaction_writes
 
-        self.wm = pyinotify.WatchManager()
-        self.notifier = pyinotify.ThreadedNotifier(
-            self.wm, PyinotifyEventHandler())
-        self.notifier.start()
+        self.transaction_writes = None
+        self.transaction_pending_writes = None
+        self.transaction_journal = None
 
-        self.wdd = {}
+        if self.data_store is not None:
+            self.data_store.bulk_load_end()
 
-    def inotify_add_watch(self, filename):
+        for database in databases_to_write:
+            database.write_now()
+
+    def transaction_rollback(self):
+
+        self.transaction_depth -= 1
+
+        if self.transaction_depth > 0:
+            return
+
+        journal = self.transaction_journal
+
+        # Writes requested before the transaction are still due,
+        # those requested inside it are dropped with its changes.
+        databases_to_write = self.transaction_pending_writes
+
+        # Undo operations must not record themselves.
+        self.transaction_writes = None
+        self.transaction_pending_writes = None
+        self.transaction_journal = None
+
+        LOGGER.warning('Rolling back {} change(s).'.format(len(journal)))
+
+        try:
+            for undo, args in reversed(journal):
+                undo(*args)
+
+        finally:
+            if self.data_store is not None:
+                self.data_store.bulk_load_end()
+
+        for database in databases_to_write:
+            database.write_now()
+
+    def journal(self, undo, *args):
+        ''' Record how to undo a change, if inside a transaction. '''
+
+        if self.transaction_journal is not None:
+            self.transaction_journal.append((undo, args))
+
+    def defer_write(self, database, pending=False):
+        ''' Return `True` if `database` will be written at commit.
+
+            :param pending: the write was requested before the
+                transaction, and must happen even on rollback.
+        '''
+
+        if self.transaction_writes is None:
+            return False
+
+        self.transaction_writes.add(database)
+
+        if pending:
+            self.transaction_pending_writes.add(database)
+
+        return True
+
+    # ——————————————————————————————————————————————————————————— File monitors
+
+    def setup_monitors(self):
+
+        # assert lprint_function_name()
+
+        # dirname → Gio.FileMonitor. One per directory, because
+        # editors and git replace files by renaming another one.
+        self.monitors = {}
+
+        # dirname → set of watched filenames in it.
+        self.watched = {}
+
+    def monitor_add(self, filename):
 
         # assert lprint_function_name()
         # assert lprint(filename)
 
-        self.wdd.update(self.wm.add_watch(filename, pyinotify.IN_MODIFY))
+        dirname = os.path.dirname(filename)
+
+        if dirname not in self.monitors:
+            monitor = Gio.File.new_for_path(dirname).monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect('changed', self.on_monitor_changed)
+
+            self.monitors[dirname] = monitor
+            self.watched[dirname] = set()
 
-    def inotify_remove_watch(self, filename, delete=False):
+        self.watched[dirname].add(filename)
+
+    def monitor_remove(self, filename):
 
-        # assert lprint_caller_name(levels=2)
         # assert lprint_function_name()
         # assert lprint(filename)
 
+        dirname = os.path.dirname(filename)
+
         try:
-            self.wm.rm_watch(self.wdd[filename])
+            self.watched[dirname].remove(filename)
 
         except KeyError:
-            # Happens at close() when save() is called after the
-            # inotify remove. I don't want to invert there, this
-            # would produce resource-consuming off/on/off cycle.
-            pass
+            return
 
-        if delete:
-            del self.wdd[filename]
+        if not self.watched[dirname]:
+            self.monitors.pop(dirname).cancel()
+            del self.watched[dirname]
 
-    def on_file_modify(self, event):
-        ''' Acquire lock and launch delayed updater. '''
+    def monitor_remove_all(self):
 
-        # assert lprint_function_name()
-        # assert lprint(event)
+        for monitor in self.monitors.values():
+            monitor.cancel()
+
+        self.monitors.clear()
+        self.watched.clear()
+
+    def on_monitor_changed(self, monitor, file, other_file, event_type):
 
-        if self.file_write_lock.acquire(blocking=False) is False:
-            # This occurs mainly if many inotify events come at once.
-            # In rare cases we could be writing while an external change occurs.
-            # This would be too bad. But having one lock per file is too much.
+        if event_type in (Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+                          Gio.FileMonitorEvent.CREATED,
+                          Gio.FileMonitorEvent.MOVED_IN):
+            # CHANGED events come once per written
+            # chunk, CHANGES_DONE_HINT once at close.
+            changed_file = file
+
+        elif event_type == Gio.FileMonitorEvent.RENAMED:
+            # Atomic save: a temporary file renamed over ours.
+            changed_file = other_file
+
+        else:
             return
 
-        LOGGER.debug('Programming reload of {0} when idle.'.format(
-                     event.pathname))
+        filename = changed_file.get_path()
 
-        GLib.idle_add(self.on_file_modify_callback, event)
+        if filename not in self.watched.get(os.path.dirname(filename), ()):
+            return
 
-    def on_file_modify_callback(self, event):
-        ''' Reload file with a dedicated message. '''
+        LOGGER.debug('Event {} on {}.'.format(
+                     event_type.value_nick, filename))
 
-        # assert lprint_function_name()
+        self.on_file_changed(filename)
 
-        filename = event.pathname
+    @run_at_most_every(FILE_MONITOR_DELAY, lane=LANE_IO)
+    def on_file_changed(self, filename):
 
-        # assert lprint(filename)
+        spawn(self.check_file_async(filename))
 
-        time.sleep(1)
+    async def check_file_async(self, filename):
+        ''' Reload `filename` if its content is not what we last read
+            or wrote. '''
 
-        self.reload(
-            filename,
-            '“{}” reloaded because of external change.'.format(
-                filename))
+        try:
+            database = await in_main_loop(self.get_database,
+                                          filename=filename)
 
-        # Remove the callback from IDLE list.
-        return False
+        except NoDatabaseForFilenameError:
+            # Closed meanwhile.
+            return
 
-    def no_watch(self, filename):
+        changed = await run_in_executor(self.file_changed, database)
 
-        # assert lprint_function_name()
+        if changed is None:
+            LOGGER.warning('{} disappeared from disk, or is not readable '
+                           'anymore.'.format(filename))
+            return
+
+        if not changed:
+            LOGGER.debug('{} did not change.'.format(filename))
+            return
+
+        LOGGER.info('“{}” reloaded because of external change.'.format(
+                    filename))
+
+        await self.reload_async(database)
+
+    def file_changed(self, database):
+        ''' Tell if the file of `database` changed since we last read or
+            wrote it, or `None` if it is missing (or unreadable).
+            Blocking.
+
+            Size and modification time come first; the file is hashed
+            only if the size is the same but the time is not. Thus our
+            own writes cost a `stat()`, and touches a hash.
+        '''
+
+        # Events during a write are handled after it.
+        with database.write_lock:
+            known = database.file_state
+
+            try:
+                stat = os.stat(database.filename)
+
+            except OSError:
+                # Not the builtin FileNotFoundError, which we shadow.
+                return None
+
+            if known is None or stat.st_size != known.size:
+                return True
+
+            if stat.st_mtime_ns == known.mtime_ns:
+                return False
 
-        return BibedFileStoreNoWatchContextManager(self, filename)
+            if file_digest(database.filename) != known.digest:
+                return True
+
+            # Touched only. Keep next checks cheap.
+            database.file_state = known._replace(mtime_ns=stat.st_mtime_ns)
+
+            return False
 
     # ————————————————————————————————————————————————————————————————— Queries
 
@@ -411,6 +593,35 @@ class BibedFileStore(Gio.ListStore):
 
         raise FileNotFoundError
 
+    def get_origin(self, filename):
+        ''' Return `(filetype, missing)` for a file entries were trashed
+            from. Results are cached until files are opened or closed,
+            because the file can be unloaded, or even deleted. '''
+
+        try:
+            return self.origins[filename]
+
+        except KeyError:
+            pass
+
+        try:
+            origin = (self.get_filetype(filename), False)
+
+        except FileNotFoundError:
+            # Most probably a deleted database, but could be also (99%)
+            # that the file is not loaded. This happens notably at
+            # application start.
+
+            if os.path.exists(filename):
+                origin = (FileTypes.USER, False)
+
+            else:
+                origin = (FileTypes.NOTFOUND, True)
+
+        self.origins[filename] = origin
+
+        return origin
+
     def sync_selection(self, selected_databases):
 
         # assert lprint('SYNC SELECTION', [x.filename for x in selected_databases])
@@ -481,7 +692,13 @@ class BibedFileStore(Gio.ListStore):
 
     # ————————————————————————————————————————————————————————— File operations
 
-    def load(self, filename, filetype=None):
+    def load(self, filename, filetype=None, bibdb=None, parsed=None):
+        ''' Load `filename` into the application.
+
+            :param bibdb: the already parsed content of `filename`.
+            :param parsed: or the `(database, search_index)` result of
+                :meth:`parse_async`, search index included.
+        '''
 
         # assert lprint_function_name()
         # assert lprint(filename, filetype)
@@ -489,25 +706,36 @@ class BibedFileStore(Gio.ListStore):
         if self.has(filename):
             raise AlreadyLoadedException
 
-        if filetype is None:
-            filetype = FileTypes.USER
+        if parsed is None:
+            if filetype is None:
+                filetype = FileTypes.USER
+
+            database = BibedDatabase(filename, filetype, bibdb)
+            search_index = None
 
-        inotify = True
+        else:
+            database, search_index = parsed
+            filetype = database.filetype
+
+        monitor = True
         impact_data_store = True
 
         # Transient files don't get to the datastore.
         if filetype == FileTypes.TRANSIENT:
             impact_data_store = False
-            inotify = False
-
-        database = BibedDatabase(filename, filetype)
+            monitor = False
 
         if impact_data_store and self.data_store is not None:
-            for entry in database.values():
-                self.data_store.append(entry)
+            with self.data_store.bulk_load():
+                if search_index is not None:
+                    self.data_store.index.merge(search_index)
 
-        if inotify:
-            self.inotify_add_watch(filename)
+                for entry in database.values():
+                    self.data_store.append(
+                        entry, indexed=search_index is not None)
+
+        if monitor:
+            self.monitor_add(filename)
 
         if filetype == FileTypes.USER:
             self.num_user += 1
@@ -557,7 +785,7 @@ class BibedFileStore(Gio.ListStore):
         database_to_remove = None
         index_to_remove = None
         impact_data_store = True
-        inotify = True
+        monitor = True
 
         for index, database in enumerate(self):
 
@@ -570,19 +798,23 @@ class BibedFileStore(Gio.ListStore):
 
                 elif database.filetype == FileTypes.TRANSIENT:
                     impact_data_store = False
-                    inotify = False
+                    monitor = False
 
                 database_to_remove = database
                 index_to_remove = index
                 break
 
-        if inotify:
-            self.inotify_remove_watch(database_to_remove.filename, delete=True)
+        if monitor:
+            self.monitor_remove(database_to_remove.filename)
 
         if save_before:
             # self.clear_save_callback()
             self.save(database_to_remove)
 
+        else:
+            # Else it could overwrite the file later, eg. after a reload.
+            database_to_remove.cancel_write()
+
         assert database_to_remove is not None
 
         self.remove(index_to_remove)
@@ -611,36 +843,94 @@ class BibedFileStore(Gio.ListStore):
                 remember_close=remember_close
             )
 
-        try:
-            self.notifier.stop()
-
-        except Exception:
-            pass
+        self.monitor_remove_all()
 
-    def reload(self, database):
+    def reload(self, database, bibdb=None, parsed=None):
 
         # assert lprint_function_name()
 
-        # TODO: use a context manager to be sure we unlock.
-        #       reloading could fail if file content is unparsable.
-
-        # We try to re-lock to avoid conflict if reloading
-        # manually while an inotify reload occurs.
-        self.lock(blocking=False)
-
         filename = database.filename
 
         # self.window.treeview.set_editable(False)
-        self.close(database,
-                   save_before=False,
-                   remember_close=False)
+        with self.data_store.bulk_load():
+            self.close(database,
+                       save_before=False,
+                       remember_close=False)
 
-        result = self.load(filename)
-
-        self.unlock()
+            result = self.load(filename, bibdb=bibdb, parsed=parsed)
 
         return result
 
+    # ———————————————————————————————————————————————————————————— Coroutines
+    # See bibed.aio: parsing runs in the worker process, file
+    # I/O in the executor, store mutations in the main loop.
+
+    async def parse_async(self, filename, filetype=None):
+        ''' Parse `filename` and index its entries in the worker process.
+
+            :returns: a `(database, search_index)` tuple for the `parsed`
+                argument of :meth:`load` and :meth:`reload`.
+        '''
+
+        if filetype is None:
+            filetype = FileTypes.USER
+
+        bibdb = await daemon.run(DaemonTasks.PARSE, filename)
+
+        database = await in_main_loop(
+            BibedDatabase, filename, filetype, bibdb)
+
+        if filetype == FileTypes.TRANSIENT or self.data_store is None:
+            return database, None
+
+        documents = await in_main_loop(
+            self.data_store.index_documents, database)
+
+        search_index = await daemon.run(DaemonTasks.INDEX, documents)
+
+        return database, search_index
+
+    async def load_async(self, filename, filetype=None):
+
+        if await in_main_loop(self.has, filename):
+            raise AlreadyLoadedException
+
+        parsed = await self.parse_async(filename, filetype)
+
+        return await in_main_loop(self.load, filename, parsed=parsed)
+
+    async def reload_async(self, database):
+
+        # Parse before closing: the database stays
+        # usable if the file content is unparsable.
+        parsed = await self.parse_async(database.filename, database.filetype)
+
+        def reload():
+            if not self.has(database.filename):
+                # Closed while it was parsed.
+                return None
+
+            return self.reload(database, parsed=parsed)
+
+        return await in_main_loop(reload)
+
+    async def write_async(self, database):
+        ''' Write `database` now, bypassing the write delay. '''
+
+        def snapshot():
+            # A pending delayed write would write the same content again.
+            database.cancel_write()
+
+            return database.snapshot()
+
+        snapshot = await in_main_loop(snapshot)
+
+        await run_in_executor(database.write_snapshot, *snapshot)
+
+    async def backup_async(self, database):
+
+        await run_in_executor(database.backup)
+
     def clear_data(self, database=None):
         ''' Clear the data store from one or more file contents. '''
 
@@ -667,18 +957,63 @@ class BibedDataStore(Gtk.ListStore):
     # TODO: convert BibedEntry to a GObject subclass and simplify all of this.
     #
 
+    # Emitted when views and filter models must detach, and when leaving
+    # (outermost) bulk-load mode, with `True` if they were detached, for
+    # listeners to rebuild them, else to refilter.
+    __gsignals__ = {
+        'bulk-load-start': (GObject.SignalFlags.RUN_FIRST, None, ()),
+        'bulk-load-end': (GObject.SignalFlags.RUN_FIRST, None, (bool, )),
+    }
+
     def __init__(self, *args, **kwargs):
 
         super().__init__(
             *BibAttrs.as_store_args
         )
 
+        # Values past this count are not stored in GTK, only in our
+        # Python-side index and vocabularies. See `BibAttrs`.
+        self.columns_count = len(BibAttrs.as_store_args)
+
         self.files_store = kwargs.pop('files_store', None)
 
         assert self.files_store is not None
 
         self.files_store.data_store = self
 
+        # Search index of our rows, used by the filter.
+        self.index = BibedSearchIndex()
+
+        # Counts per database, type, year and keyword.
+        self.facets = BibedFacets(self.index)
+
+        # Completion values, shared by all editor dialogs.
+        self.vocabularies = BibedVocabularies()
+
+        # docid → entry. Rows reference their entry by
+        # docid, in the `BibAttrs.HANDLE` column.
+        self.entries = {}
+
+        # docid → Gtk.TreeIter (list store iters persist).
+        self.iters = {}
+
+        # docid → {column: value}, changes waiting for the next frame,
+        # and the GLib source that will flush them.
+        self.changes = {}
+        self.changes_source = None
+
+        # Bulk load: nesting depth, rows waiting to be inserted
+        # (as `{docid: row}`), and if we disabled the garbage collector.
+        self.bulk_depth = 0
+        self.bulk_rows = {}
+        self.bulk_gc_paused = False
+
+        # If `bulk-load-start` was emitted.
+        self.bulk_detached = False
+
+        # See gc_freeze().
+        self.gc_frozen = False
+
         BibedDatabase.data_store = self
         BibedDatabase.files_store = self.files_store
         BibedEntry.files_store = self.files_store
@@ -686,8 +1021,231 @@ class BibedDataStore(Gtk.ListStore):
     def __str__(self):
         return 'BibedDataStore'
 
+    def get_stats(self, result=None):
+        ''' Return entries counts per facet (see :class:`BibedFacets`).
+
+            :param result: restrict counts to a search result, eg.
+                :attr:`BibedApplication.filter_result`. Without it,
+                counts cover the selected user databases only.
+        '''
+
+        return self.facets.stats(result, self.facets_dbids(result))
+
+    def facets_dbids(self, result=None):
+        ''' Return the databases IDs facets counts are restricted to.
+
+            Search results are already restricted to the databases they
+            were run on; otherwise, trash, queue and unselected files
+            must not be counted.
+        '''
+
+        if result is not None:
+            return None
+
+        return [
+            database.objectid
+            for database in self.files_store.selected_user_databases
+        ]
+
+    # ——————————————————————————————————————————————————————————— Bulk load
+
+    @property
+    def bulk_loading(self):
+
+        return self.bulk_depth > 0
+
+    def bulk_load(self, gc_pause=True, detach=True):
+        ''' Return a context manager to insert many entries at once.
+
+            Listeners of the `bulk-load-start` signal detach views and
+            filter models, which thus do not process every inserted row.
+            Rows are inserted in one batch at the end, then
+            `bulk-load-end` is emitted for listeners to refilter once.
+
+            :param gc_pause: disable the garbage collector during the
+                load (only honored by the outermost context).
+            :param detach: if `False` (eg. for transactions touching a
+                few entries), views keep their models, scroll position
+                and selection. They are still detached if more than
+                :data:`BULK_DETACH_ROWS` rows wait for insertion.
+        '''
+
+        return BibedDataStoreBulkLoadContextManager(self, gc_pause, detach)
+
+    def bulk_load_begin(self, gc_pause=True, detach=True):
+
+        self.bulk_depth += 1
+
+        if detach:
+            self.bulk_detach()
+
+        if self.bulk_depth > 1:
+            return
+
+        self.bulk_time_start = time.time()
+
+        if gc_pause and gc.isenabled():
+            gc.disable()
+            self.bulk_gc_paused = True
+
+    def bulk_detach(self):
+
+        if self.bulk_detached:
+            return
+
+        self.bulk_detached = True
+        self.emit('bulk-load-start')
+
+    def bulk_load_end(self):
+
+        self.bulk_depth -= 1
+
+        if self.bulk_depth > 0:
+            return
+
+        rows_count = len(self.bulk_rows)
+
+        if rows_count > BULK_DETACH_ROWS:
+            self.bulk_detach()
+
+        try:
+            self.bulk_flush()
+
+        finally:
+            if self.bulk_gc_paused:
+                gc.enable()
+                self.bulk_gc_paused = False
+
+            LOGGER.debug('Bulk-loaded {} rows in {:.3f}s.'.format(
+                         rows_count, time.time() - self.bulk_time_start))
+
+            detached = self.bulk_detached
+            self.bulk_detached = False
+
+            self.emit('bulk-load-end', detached)
+
+    def gc_freeze(self):
+        ''' Move objects loaded so far to the permanent generation, for
+            next collections not to scan them again. Done once, after
+            startup: entries and databases hold reference cycles, thus
+            later closed or reloaded ones must stay collectable. '''
+
+        if self.gc_frozen:
+            return
+
+        self.gc_frozen = True
+
+        try:
+            gc.freeze()
+
+        except AttributeError:
+            # Python < 3.7
+            pass
+
+    def bulk_flush(self):
+        ''' Insert rows pending from bulk-load mode. Updates and deletes
+            of pending rows are applied to them, without flushing. '''
+
+        if not self.bulk_rows:
+            return
+
+        rows = self.bulk_rows
+        self.bulk_rows = {}
+
+        columns = list(range(self.columns_count))
+        insert = self.insert_with_valuesv
+        iters = self.iters
+
+        for docid, values in rows.items():
+            iters[docid] = insert(-1, columns, values)
+
+    # ——————————————————————————————————————————————————————— Row changes
+
+    def queue_changes(self, docid, changes):
+        ''' Record `{column: value}` changes of a row, to be applied
+            before the next frame is drawn.
+
+            Rows thus get one `set()` call (and one `row-changed` signal)
+            per frame with their changed columns only, whatever the
+            number of updates in between.
+        '''
+
+        if not changes:
+            return
+
+        try:
+            self.changes[docid].update(changes)
+
+        except KeyError:
+            self.changes[docid] = dict(changes)
+
+        if self.changes_source is None:
+            # Higher than GDK redraw priority, to
+            # be flushed before the frame is drawn.
+            self.changes_source = GLib.idle_add(
+                self.on_changes_idle, priority=GLib.PRIORITY_HIGH_IDLE)
+
+    def on_changes_idle(self):
+
+        self.changes_source = None
+        self.apply_changes()
+
+        return False
+
+    def apply_changes(self):
+
+        changes = self.changes
+        self.changes = {}
+
+        iters = self.iters
+        set_row = self.set
+
+        for docid, row_changes in changes.items():
+            if row_changes:
+                set_row(iters[docid],
+                        list(row_changes.keys()),
+                        list(row_changes.values()))
+
+    # ——————————————————————————————————————————————————— Entries and rows
+
+    def entry_values(self, entry):
+        ''' Return all `BibAttrs` values of `entry`. Only the first
+            :attr:`columns_count` ones go to the Gtk.ListStore row.
+
+            Values are memoized on the entry, and computed again only
+            after the entry changed (see :meth:`BibedEntry.touch`) or
+            moved to another database. Thus the row, the search index
+            and the vocabularies share one computation per change.
+        '''
+
+        stamp = (entry.revision, entry.database)
+        memoized = entry.store_values
+
+        if memoized is not None and memoized[0] == stamp:
+            return memoized[1]
+
+        values = self.__entry_to_store(entry)
+
+        entry.store_values = (stamp, values)
+
+        return values
+
+    def row_values(self, values, docid):
+        ''' Return the Gtk.ListStore part of `values`, with `docid`
+            as handle. '''
+
+        handle = BibAttrs.HANDLE
+
+        return (values[:handle] + (docid, )
+                + values[handle + 1:self.columns_count])
+
+    def get_entry_by_handle(self, handle):
+
+        return self.entries[handle]
+
     def __entry_to_store(self, entry):
-        ''' Convert a BIB entry, to fields for a Gtk.ListStore. '''
+        ''' Convert a BIB entry, to fields for a Gtk.ListStore and
+            for our search index and vocabularies. '''
 
         return (
             entry.database.objectid,
@@ -707,6 +1265,27 @@ class BibedDataStore(Gtk.ListStore):
             entry.col_read_status,
             entry.col_abstract_or_comment,
 
+            # context.
+            entry.context_color,
+
+            # sort keys.
+            entry.sort_author,
+            entry.sort_title,
+            entry.sort_in_or_by,
+
+            # icon names.
+            entry.icon_type,
+            entry.icon_file,
+            entry.icon_url,
+            entry.icon_quality,
+            entry.icon_read_status,
+            entry.icon_abstract_or_comment,
+
+            # handle, set when the row is built (see `row_values()`).
+            -1,
+
+            # Not stored in the Gtk.ListStore.
+
             # search-only fields.
             entry.col_subtitle,
             entry.col_comment,
@@ -721,14 +1300,48 @@ class BibedDataStore(Gtk.ListStore):
             entry.comp_type,
             entry.comp_howpublished,
             entry.comp_entrysubtype,
-
-            # context.
-            entry.context_color,
         )
 
-    def append(self, entry):
+    def index_documents(self, database):
+        ''' Return `(dbid, key, values)` of `database` entries, for
+            the worker `INDEX` task. '''
 
-        return super().append(self.__entry_to_store(entry))
+        dbid = database.objectid
+
+        return [
+            (dbid, entry.key, indexed_values(self.entry_values(entry)))
+            for entry in database.values()
+        ]
+
+    def append(self, entry, indexed=False):
+        ''' Add a row for `entry`.
+
+            :param indexed: `True` if the search index already has the
+                entry, merged from the worker `INDEX` task.
+        '''
+
+        values = self.entry_values(entry)
+
+        if indexed:
+            docid = self.index.get_docid(entry.database.objectid, entry.key)
+
+        else:
+            docid = self.index.add(entry.database.objectid, entry.key, values)
+
+        self.vocabularies.add(docid, values)
+
+        self.entries[docid] = entry
+        entry.docid = docid
+
+        if self.bulk_depth:
+            self.bulk_rows[docid] = self.row_values(values, docid)
+            return None
+
+        iter = super().append(self.row_values(values, docid))
+
+        self.iters[docid] = iter
+
+        return iter
 
     def add_entry(self, entry):
 
@@ -736,6 +1349,11 @@ class BibedDataStore(Gtk.ListStore):
 
         iter = self.append(entry)
 
+        if iter is None:
+            LOGGER.debug('Row for entry {} waits for bulk insert.'.format(
+                         entry.key))
+            return
+
         index = self.get_path(iter)
 
         LOGGER.debug('Row {} created with entry {}.'.format(index, entry.key))
@@ -744,58 +1362,83 @@ class BibedDataStore(Gtk.ListStore):
 
         # assert lprint_function_name()
 
-        key_col = BibAttrs.KEY
+        entry_values = self.entry_values(entry)
 
-        # NOTE: even if old_keys is an array, only ONE will be matched,
-        #       because it's the one that have just been renamed.
-        keys_to_update = [entry.key] if old_keys is None else old_keys
-        index = None
+        docid = self.index.update(entry.database.objectid, entry.key,
+                                  entry_values, old_keys=old_keys)
 
-        for index, row in enumerate(self):
-            if row[key_col] in keys_to_update:
-                if fields:
-                    for key, value in fields.items():
-                        row[key] = value
-                else:
-                    for index, value in enumerate(self.__entry_to_store(entry)):
-                        row[index] = value
+        self.vocabularies.update(docid, entry_values)
 
-                break
+        self.entries[docid] = entry
+        entry.docid = docid
+
+        row_values = self.row_values(entry_values, docid)
+
+        if docid in self.bulk_rows:
+            # Not inserted yet, no need for partial updates.
+            self.bulk_rows[docid] = row_values
+
+        elif docid not in self.iters:
+            # The entry was not indexed, index.update() just added
+            # it: it has no row yet.
+            if self.bulk_depth:
+                self.bulk_rows[docid] = row_values
+
+            else:
+                self.iters[docid] = super().append(row_values)
+
+        elif fields:
+            self.queue_changes(docid, fields)
+
+        else:
+            current_values = self.get(self.iters[docid],
+                                      *range(self.columns_count))
+
+            # Replaces pending changes, which are now part of row_values.
+            self.changes[docid] = {}
+
+            self.queue_changes(docid, {
+                column: value
+                for column, (current_value, value) in enumerate(
+                    zip(current_values, row_values))
+                if current_value != value
+            })
 
         LOGGER.debug('Row {} updated (entry {}{}).'.format(
-                     index, entry.key,
+                     docid, entry.key,
                      ', fields={}'.format(fields) if fields else ''))
 
+    def remove_row(self, docid):
+        ''' Remove the row of `docid`, pending or not. '''
+
+        self.changes.pop(docid, None)
+
+        if self.bulk_rows.pop(docid, None) is None:
+            self.remove(self.iters.pop(docid))
+
+        del self.entries[docid]
+
     def delete_entry(self, entry):
 
         # assert lprint_function_name()
 
-        key_to_delete = entry.key
-        key_col = BibAttrs.KEY
-        index = None
+        docid = self.index.remove(entry.database.objectid, entry.key)
 
-        for index, row in enumerate(self):
-            if row[key_col] == key_to_delete:
-                self.remove(row.iter)
-                break
+        if docid is None:
+            return
+
+        self.vocabularies.remove(docid)
+        self.remove_row(docid)
 
         LOGGER.debug('Row {} deleted (was entry {}).'.format(
-                     index, entry.key))
+                     docid, entry.key))
 
     def clear_data(self, database):
 
         # assert lprint_function_name()
 
-        db_col = BibAttrs.DBID
-        db_id = database.objectid
-
-        iters_to_remove = []
-
-        for row in self:
-            if row[db_col] == db_id:
-                iters_to_remove.append(row.iter)
-
-        for iter in iters_to_remove:
-            self.remove(iter)
+        for docid in self.index.remove_database(database.objectid):
+            self.vocabularies.remove(docid)
+            self.remove_row(docid)
 
         LOGGER.debug('Cleared data for {}.'.format(database))
@@ -1,15 +1,18 @@
 
 import os
 import re
+import html
+import unicodedata
 from datetime import timedelta
 
 from bibed.exceptions import BibedStringException
-from bibed.gtk import GLib
 
 def utf8_normalise_translation_map(translation_map):
 
+    # Same as GLib.utf8_normalize() with NormalizeMode.DEFAULT, without
+    # importing GTK: the worker process builds vocabularies indexes.
     return tuple(
-        (GLib.utf8_normalize(to_trans, -1, GLib.NormalizeMode.DEFAULT), to_what, )
+        (unicodedata.normalize('NFD', to_trans), to_what, )
         for to_trans, to_what in translation_map
     )
 
@@ -188,11 +191,89 @@ def to_lower_if_not_none(data):
     return data.lower()
 
 
+MARKUP_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def remove_markup(string_):
+    ''' Remove Pango markup tags and entities from `string_`. '''
+
+    return html.unescape(MARKUP_TAG_RE.sub('', string_))
+
+
+def sort_text(string_, ignored_prefixes=None):
+    ''' Normalize a display string for sorting.
+
+        Markup is removed, text is lowered and unaccented, and one of
+        `ignored_prefixes` (eg. leading articles) is stripped. Meant to
+        be compared with the locale collation, eg. by Gtk.TreeModelSort.
+    '''
+
+    string_ = lowunaccent(remove_markup(string_)).strip()
+
+    if ignored_prefixes:
+        for prefix in ignored_prefixes:
+            if string_.startswith(prefix):
+                return string_[len(prefix):].lstrip()
+
+    return string_
+
+
 def bibtex_clean(string_):
 
     return string_.replace(' and ', ' ').replace(' {and} ', ' ')
 
 
+def bibtex_split(string_, separator):
+    ''' Split `string_` at `separator` (compared lowered), outside
+        braces only: ``{Barnes and Noble}`` is one name. '''
+
+    parts = []
+    depth = 0
+    start = 0
+    index = 0
+    lowered = string_.lower()
+
+    while index < len(string_):
+        char = string_[index]
+
+        if char == '{':
+            depth += 1
+
+        elif char == '}':
+            depth = max(0, depth - 1)
+
+        elif depth == 0 and lowered.startswith(separator, index):
+            parts.append(string_[start:index])
+            index += len(separator)
+            start = index
+            continue
+
+        index += 1
+
+    parts.append(string_[start:])
+
+    return parts
+
+
+# Accents are dropped anyway by lowunaccent(), only letters are kept.
+LATEX_ACCENT_RE = re.compile(r'\\[`\'^"~=.]|\\[uvHckbdrt](?![a-zA-Z])\s*')
+LATEX_COMMAND_RE = re.compile(r'\\([a-zA-Z]+)\s*')
+LATEX_LETTERS = {
+    'aa': 'a', 'AA': 'A', 'ae': 'ae', 'AE': 'AE', 'oe': 'oe', 'OE': 'OE',
+    'o': 'o', 'O': 'O', 'l': 'l', 'L': 'L', 'ss': 'ss', 'i': 'i', 'j': 'j',
+}
+
+
+def latex_to_text(string_):
+    ''' Strip LaTeX accents, commands and braces from `string_`. '''
+
+    string_ = LATEX_ACCENT_RE.sub('', string_)
+    string_ = LATEX_COMMAND_RE.sub(
+        lambda match: LATEX_LETTERS.get(match.group(1), ''), string_)
+
+    return string_.replace('{', '').replace('}', '')
+
+
 # —————————————————————————————————————————————— LaTeX to Pango Markup and back
 
 LATEX_EXPR = r'[^}]+'
@@ -1,7 +1,9 @@
 
 import sys
 import os
+import hashlib
 import logging
+import collections
 import ctypes
 import ctypes.util
 
@@ -87,6 +89,33 @@ def set_process_title(title):
             sys.sdterr.write("Setting the process title failed.")
 
 
+# What we know of a file content, from our last read or write of it.
+FileState = collections.namedtuple(
+    'FileState', ('size', 'mtime_ns', 'digest'))
+
+
+def bytes_digest(data):
+
+    return hashlib.blake2b(data).hexdigest()
+
+
+def file_digest(filename):
+    ''' Return the hex digest of `filename` content, or `None` if
+        the file does not exist. Usable in background threads. '''
+
+    digest = hashlib.blake2b()
+
+    try:
+        with open(filename, 'rb') as file_:
+            for chunk in iter(lambda: file_.read(65536), b''):
+                digest.update(chunk)
+
+    except FileNotFoundError:
+        return None
+
+    return digest.hexdigest()
+
+
 def touch_file(filename):
     ''' Create a file (containing a newline) if missing. '''
 
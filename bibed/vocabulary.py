@@ -0,0 +1,371 @@
+
+import bisect
+import logging
+import threading
+import collections
+
+from bibed.constants import BibAttrs
+from bibed.strings import lowunaccent, bibtex_clean
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Data store columns whose values are proposed as completions.
+COMPLETION_COLUMNS = (
+    BibAttrs.AUTHOR,
+    BibAttrs.JOURNALTITLE,
+    BibAttrs.EDITOR,
+    BibAttrs.PUBLISHER,
+    BibAttrs.SERIES,
+    BibAttrs.TYPEFIELD,
+    BibAttrs.HOWPUBLISHED,
+    BibAttrs.ENTRYSUBTYPE,
+)
+
+# Size of substrings indexed for infix search. Must
+# not be greater than the completion minimum key length.
+NGRAM_SIZE = 2
+
+
+def normalize(text):
+    ''' Lower and unaccent `text`, whatever its unicode normalization. '''
+
+    return lowunaccent(lowunaccent(bibtex_clean(text)), normalized=True)
+
+
+def ngrams(text):
+
+    return {
+        text[index:index + NGRAM_SIZE]
+        for index in range(len(text) - NGRAM_SIZE + 1)
+    }
+
+
+class VocabularySearchIndex:
+    ''' Normalized values of a vocabulary, indexed for completion.
+
+        Prefix matches come from a sorted array of normalized values,
+        infix matches from an n-grams index. Thus search costs depend
+        on the number of matches, not on the vocabulary size.
+    '''
+
+    def __init__(self, values=()):
+
+        # value → normalized value
+        self.normalized = {}
+
+        # Sorted (normalized value, value) tuples.
+        self.sorted = []
+
+        # n-gram → set(values)
+        self.ngrams = {}
+
+        for value in values:
+            self.add(value)
+
+    def __len__(self):
+
+        return len(self.normalized)
+
+    def add(self, value):
+
+        if value in self.normalized:
+            return
+
+        normalized = normalize(value)
+
+        self.normalized[value] = normalized
+
+        bisect.insort(self.sorted, (normalized, value))
+
+        for ngram in ngrams(normalized):
+            try:
+                self.ngrams[ngram].add(value)
+
+            except KeyError:
+                self.ngrams[ngram] = {value}
+
+    def remove(self, value):
+
+        normalized = self.normalized.pop(value, None)
+
+        if normalized is None:
+            return
+
+        del self.sorted[bisect.bisect_left(self.sorted, (normalized, value))]
+
+        for ngram in ngrams(normalized):
+            values = self.ngrams[ngram]
+            values.discard(value)
+
+            if not values:
+                del self.ngrams[ngram]
+
+    def prefixed(self, key):
+        ''' Return values whose normalized form starts with `key`. '''
+
+        result = []
+        sorted_values = self.sorted
+
+        for index in range(bisect.bisect_left(sorted_values, (key, )),
+                           len(sorted_values)):
+            normalized, value = sorted_values[index]
+
+            if not normalized.startswith(key):
+                break
+
+            result.append(value)
+
+        return result
+
+    def infixed(self, key):
+        ''' Return values whose normalized form contains `key`. '''
+
+        if len(key) < NGRAM_SIZE:
+            return [
+                value for value, normalized in self.normalized.items()
+                if key in normalized
+            ]
+
+        candidates = None
+
+        for ngram in sorted(ngrams(key),
+                            key=lambda ngram: len(self.ngrams.get(
+                                ngram, ()))):
+            values = self.ngrams.get(ngram, None)
+
+            if values is None:
+                return []
+
+            if candidates is None:
+                candidates = set(values)
+
+            else:
+                candidates &= values
+
+            if not candidates:
+                return []
+
+        normalized = self.normalized
+
+        return [
+            value for value in candidates
+            if key in normalized[value]
+        ]
+
+
+class BibedVocabulary:
+    ''' Deduplicated and counted values of one data store column.
+
+        Kept up to date by :class:`~bibed.store.BibedDataStore` on every
+        entry add, update and delete, and shared by all editor dialogs.
+
+        The search index is built from a snapshot of the values, usually
+        in the worker process (see :meth:`begin_search_index_build`).
+        Changes happening meanwhile are recorded, and replayed when the
+        index is installed. Mutations can come from loading threads,
+        thus they are serialized by a lock.
+
+        .. note:: this class does not depend on GTK.
+    '''
+
+    def __init__(self, column):
+
+        self.column = column
+
+        self.lock = threading.RLock()
+
+        # value → number of documents having it.
+        self.counts = collections.Counter()
+
+        # docid → value
+        self.values = {}
+
+        # Installed after first build, then kept up to date.
+        self.search_index = None
+
+        # While the search index is being built, a list of
+        # `(added, value)` changes to replay on installation.
+        self.pending = None
+
+    def __len__(self):
+
+        return len(self.counts)
+
+    def __iter__(self):
+
+        return iter(self.counts)
+
+    def __contains__(self, value):
+
+        return value in self.counts
+
+    @property
+    def building(self):
+
+        return self.pending is not None
+
+    def value_changed(self, value, added):
+
+        if self.search_index is not None:
+            if added:
+                self.search_index.add(value)
+
+            else:
+                self.search_index.remove(value)
+
+        elif self.pending is not None:
+            self.pending.append((added, value))
+
+    def add(self, docid, value):
+
+        if value is None or not value.strip():
+            return
+
+        with self.lock:
+            self.values[docid] = value
+
+            counts = self.counts
+
+            counts[value] += 1
+
+            if counts[value] == 1:
+                self.value_changed(value, True)
+
+    def remove(self, docid):
+
+        with self.lock:
+            value = self.values.pop(docid, None)
+
+            if value is None:
+                return
+
+            counts = self.counts
+
+            counts[value] -= 1
+
+            if not counts[value]:
+                del counts[value]
+
+                self.value_changed(value, False)
+
+    def update(self, docid, value):
+
+        with self.lock:
+            if self.values.get(docid, None) == value:
+                return
+
+            self.remove(docid)
+            self.add(docid, value)
+
+    def most_common(self, count=None):
+
+        with self.lock:
+            return self.counts.most_common(count)
+
+    # ———————————————————————————————————————————————————————— Search index
+
+    def begin_search_index_build(self):
+        ''' Start recording changes, and return a snapshot of values.
+
+            Build a :class:`VocabularySearchIndex` from the snapshot (in any
+            thread or process), then give it to :meth:`end_search_index_build`.
+        '''
+
+        with self.lock:
+            self.pending = []
+
+            return tuple(self.counts)
+
+    def end_search_index_build(self, search_index):
+        ''' Replay changes recorded during the build, and install
+            `search_index`. '''
+
+        with self.lock:
+            for added, value in self.pending:
+                if added:
+                    search_index.add(value)
+
+                else:
+                    search_index.remove(value)
+
+            self.pending = None
+            self.search_index = search_index
+
+    def abort_search_index_build(self):
+        ''' Stop recording changes, after a failed build. The next
+            :meth:`search` builds the index synchronously. '''
+
+        with self.lock:
+            self.pending = None
+
+    def search(self, key, limit=None):
+        ''' Return values matching `key`, best first.
+
+            Values starting with `key` come first, then values containing
+            it. Inside each group, most frequent values come first.
+
+            While the search index is being built, nothing matches. If
+            no build was started, the index is built synchronously.
+        '''
+
+        if self.search_index is None:
+            if self.building:
+                return []
+
+            self.end_search_index_build(
+                VocabularySearchIndex(self.begin_search_index_build()))
+
+        key = normalize(key)
+
+        if not key:
+            return []
+
+        with self.lock:
+            counts = self.counts
+            search_index = self.search_index
+
+            prefixed = set(search_index.prefixed(key))
+
+            result = sorted(
+                search_index.infixed(key),
+                key=lambda value: (
+                    value not in prefixed, -counts[value], value),
+            )
+
+        if limit is None:
+            return result
+
+        return result[:limit]
+
+
+class BibedVocabularies:
+    ''' All completion vocabularies, indexed by data store column. '''
+
+    def __init__(self, columns=COMPLETION_COLUMNS):
+
+        self.vocabularies = {
+            column: BibedVocabulary(column)
+            for column in columns
+        }
+
+    def __getitem__(self, column):
+
+        return self.vocabularies[column]
+
+    def add(self, docid, values):
+        ''' Add a document, from its data store row `values`. '''
+
+        for column, vocabulary in self.vocabularies.items():
+            vocabulary.add(docid, values[column])
+
+    def update(self, docid, values):
+
+        for column, vocabulary in self.vocabularies.items():
+            vocabulary.update(docid, values[column])
+
+    def remove(self, docid):
+
+        for vocabulary in self.vocabularies.values():
+            vocabulary.remove(docid)
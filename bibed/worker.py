@@ -0,0 +1,289 @@
+
+import re
+import logging
+import traceback
+import collections
+
+from bibed.foundations import Anything
+from bibed.bibtex import (
+    read_file,
+    parse_text,
+    parse_file,
+    serialize,
+)
+from bibed.backup import BibedBackupStore
+
+
+LOGGER = logging.getLogger(__name__)
+
+# HEADS UP: this module runs in the worker process, started with the
+#           `spawn` method. It must not import GTK, directly or not,
+#           nor `bibed.constants` before `background_process_run()`
+#           initialized translations.
+
+DaemonTasks = Anything()
+DaemonTasks.PARSE      = 'parse'
+DaemonTasks.SERIALIZE  = 'serialize'
+DaemonTasks.BACKUP     = 'backup'
+DaemonTasks.DEDUPE     = 'dedupe'
+DaemonTasks.VALIDATE   = 'validate'
+DaemonTasks.INDEX      = 'index'
+DaemonTasks.VOCABULARY = 'vocabulary'
+
+DaemonReplies = Anything()
+DaemonReplies.PROGRESS = 'progress'
+DaemonReplies.RESULT   = 'result'
+DaemonReplies.ERROR    = 'error'
+
+# From GUI to worker. `args` must be picklable.
+DaemonRequest = collections.namedtuple(
+    'DaemonRequest', ('request_id', 'task', 'args'))
+
+# From worker to GUI. `payload` is a `(value, total)` tuple for progress,
+# the task result, or an `(error type, message, traceback)` tuple.
+DaemonReply = collections.namedtuple(
+    'DaemonReply', ('request_id', 'kind', 'payload'))
+
+# Problems reported by `validate()`.
+PROBLEM_DUPLICATE_KEY = 'duplicate_key'
+PROBLEM_MISSING_TYPE = 'missing_type'
+PROBLEM_MISSING_TITLE = 'missing_title'
+PROBLEM_MISSING_AUTHOR = 'missing_author'
+PROBLEM_INVALID_YEAR = 'invalid_year'
+
+NOT_WORDS_RE = re.compile(r'\W+')
+
+
+def no_progress(value, total=None):
+    pass
+
+
+# ———————————————————————————————————————————————————————————————— Tasks
+# Each task gets its arguments and a `progress(value, total)` callable.
+
+
+def parse(filename, progress=no_progress):
+    ''' Parse `filename` into a `BibtexParserDatabase`, with the
+        :class:`~bibed.system.FileState` of what was read as its
+        `file_state` attribute, pickled along. '''
+
+    text, file_state = read_file(filename)
+
+    bibdb = parse_text(text)
+    bibdb.file_state = file_state
+
+    return bibdb
+
+
+def serialize_task(bibdb, progress=no_progress):
+
+    return serialize(bibdb)
+
+
+def backup(filename, backup_count=None, progress=no_progress):
+    ''' Snapshot `filename`. Chunks hashing and compression are CPU
+        bound; the backup folder lock is held across processes. '''
+
+    return BibedBackupStore(filename).backup(backup_count)
+
+
+def dedupe_key(text):
+    ''' Lower `text` and strip its punctuation and LaTeX braces. '''
+
+    return ' '.join(NOT_WORDS_RE.split(text.lower())).strip()
+
+
+def dedupe(filenames, progress=no_progress):
+    ''' Find probable duplicate entries across `filenames`.
+
+        :returns: a dict with `keys`, `dois` and `titles` items, each a
+            list of groups of `(filename, key)` sharing the same BibTeX
+            key, DOI, or title and year.
+    '''
+
+    by_key = collections.defaultdict(list)
+    by_doi = collections.defaultdict(list)
+    by_title = collections.defaultdict(list)
+
+    total = len(filenames)
+
+    for index, filename in enumerate(filenames):
+        for btp_entry in parse_file(filename).entries:
+            key = btp_entry['ID']
+            location = (filename, key)
+
+            by_key[key].append(location)
+
+            doi = btp_entry.get('doi', '').strip().lower()
+
+            if doi:
+                by_doi[doi].append(location)
+
+            title = dedupe_key(btp_entry.get('title', ''))
+
+            if title:
+                by_title[(title, btp_entry.get('year', ''))].append(location)
+
+        progress(index + 1, total)
+
+    return {
+        name: [group for group in groups.values() if len(group) > 1]
+        for name, groups in (
+            ('keys', by_key),
+            ('dois', by_doi),
+            ('titles', by_title),
+        )
+    }
+
+
+def validate(filename, progress=no_progress):
+    ''' Check entries of `filename`.
+
+        :returns: a list of `(key, problem)` tuples, problems being
+            one of the `PROBLEM_*` constants of this module.
+    '''
+
+    problems = []
+    seen = set()
+
+    entries = parse_file(filename).entries
+    total = len(entries)
+
+    for index, btp_entry in enumerate(entries):
+        key = btp_entry['ID']
+
+        if key in seen:
+            problems.append((key, PROBLEM_DUPLICATE_KEY))
+
+        seen.add(key)
+
+        if not btp_entry.get('ENTRYTYPE', None):
+            problems.append((key, PROBLEM_MISSING_TYPE))
+
+        if not btp_entry.get('title', None):
+            problems.append((key, PROBLEM_MISSING_TITLE))
+
+        if not (btp_entry.get('author', None)
+                or btp_entry.get('editor', None)):
+            problems.append((key, PROBLEM_MISSING_AUTHOR))
+
+        year = btp_entry.get('year', None)
+
+        if year is not None and not year.strip().isdigit():
+            problems.append((key, PROBLEM_INVALID_YEAR))
+
+        if index % 100 == 0:
+            progress(index, total)
+
+    return problems
+
+
+def index(documents, progress=no_progress):
+    ''' Build a :class:`~bibed.index.BibedSearchIndex`.
+
+        :param documents: an iterable of `(dbid, key, values)` tuples,
+            `values` coming from :func:`~bibed.index.indexed_values`.
+        :returns: the index, to be merged into the data store one with
+            :meth:`~bibed.index.BibedSearchIndex.merge`.
+    '''
+
+    # Imports bibed.constants, see module header.
+    from bibed.index import BibedSearchIndex
+
+    search_index = BibedSearchIndex()
+
+    documents = list(documents)
+    total = len(documents)
+
+    for count, (dbid, key, values) in enumerate(documents):
+        search_index.add(dbid, key, values)
+
+        if count % 500 == 0:
+            progress(count, total)
+
+    LOGGER.debug('Index built with {} documents, {} words.'.format(
+                 len(search_index), len(search_index.words)))
+
+    return search_index
+
+
+def vocabulary(values, progress=no_progress):
+    ''' Build a :class:`~bibed.vocabulary.VocabularySearchIndex`
+        of `values`, for completion. '''
+
+    # Imports bibed.constants, see module header.
+    from bibed.vocabulary import VocabularySearchIndex
+
+    return VocabularySearchIndex(values)
+
+
+TASKS = {
+    DaemonTasks.PARSE: parse,
+    DaemonTasks.SERIALIZE: serialize_task,
+    DaemonTasks.BACKUP: backup,
+    DaemonTasks.DEDUPE: dedupe,
+    DaemonTasks.VALIDATE: validate,
+    DaemonTasks.INDEX: index,
+    DaemonTasks.VOCABULARY: vocabulary,
+}
+
+
+# ——————————————————————————————————————————————————————————————— Process
+
+
+def background_process_run(queue_recv, queue_send):
+    ''' HEADS UP: queues are renamed from a daemon perspective. '''
+
+    # Spawned processes start from scratch.
+    from bibed.locale import init as locale_init
+    locale_init()
+
+    background_app = BibedBackgroundProcess(queue_recv, queue_send)
+
+    background_app.run()
+
+
+class BibedBackgroundProcess:
+    ''' Run :data:`TASKS` received on `queue_in`, one at a time, and
+        put their progress and outcome on `queue_out`. `None` stops. '''
+
+    def __init__(self, queue_in, queue_out):
+
+        self.queue_in = queue_in
+        self.queue_out = queue_out
+
+    def run(self):
+
+        LOGGER.info('Background process started.')
+
+        request = self.queue_in.get()
+
+        while request is not None:
+            self.process_request(request)
+            request = self.queue_in.get()
+
+        # Be sure the master process can stop.
+        self.queue_out.put(None)
+
+        LOGGER.info('Background process stopped.')
+
+    def process_request(self, request):
+
+        def progress(value, total=None):
+            self.queue_out.put(DaemonReply(
+                request.request_id, DaemonReplies.PROGRESS, (value, total)))
+
+        try:
+            result = TASKS[request.task](*request.args, progress=progress)
+
+        except Exception as exception:
+            self.queue_out.put(DaemonReply(
+                request.request_id, DaemonReplies.ERROR, (
+                    exception.__class__.__name__,
+                    str(exception),
+                    traceback.format_exc(),
+                )))
+
+        else:
+            self.queue_out.put(DaemonReply(
+                request.request_id, DaemonReplies.RESULT, result))
@@ -6,6 +6,7 @@ from yaml.representer import Representer
 
 # from bibed.ltrace import lprint, lprint_caller_name
 from bibed.decorators import run_at_most_every  # only_one_when_idle
+from bibed.scheduler import LANE_IO
 from bibed.foundations import AttributeDict
 from bibed.system import touch_file
 
@@ -60,7 +61,7 @@ class AttributeDictFromYaml(AttributeDict):
         if self.auto_save:
             self.save()
 
-    @run_at_most_every(1000)  # once a second.
+    @run_at_most_every(1000, max_latency=5000, lane=LANE_IO)
     def save(self):
 
         # assert lprint_caller_name(levels=4)
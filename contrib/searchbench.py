@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+'''
+    Search benchmark: builds a synthetic search index and times
+    query compilation and execution for representative queries.
+
+    Usage: python3 contrib/searchbench.py [entries_count]
+'''
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bibed import locale  # NOQA
+
+locale.init()
+
+from bibed.constants import BibAttrs  # NOQA
+from bibed.index import BibedSearchIndex  # NOQA
+from bibed.query import BibedQueryPlan  # NOQA
+
+
+ENTRIES_COUNT = 20000
+RUNS = 20
+
+WORDS = (
+    'history', 'memory', 'city', 'music', 'politics', 'religion', 'war',
+    'economy', 'science', 'language', 'culture', 'society', 'philosophy',
+    'migration', 'identity', 'landscape', 'archive', 'theory', 'gender',
+    'education', 'medicine', 'literature', 'empire', 'nation', 'border',
+)
+AUTHORS = (
+    'Dupont', 'Martin', 'Bernard', 'Smith', 'Johnson', 'Müller', 'Rossi',
+    'García', 'Nakamura', 'Kowalski', 'Haddad', 'Okafor', 'Lindqvist',
+)
+TYPES = ('article', 'book', 'inbook', 'incollection', 'thesis', 'online')
+
+QUERIES = (
+    'history',
+    'hist',
+    'a:martin',
+    'a:martin y:2010..2015',
+    'memory city -war',
+    '"city music"',
+    '(history | memory) p:book',
+    't:/^the .*y$/',
+    'y:2001..2005 | k:key1234',
+    'y:>2015',
+    'p:article y:>=2000',
+    '(p:book | p:thesis) y:<1980',
+    'history p:article y:2010..2015',
+)
+
+
+def make_row(number):
+
+    row = [None] * BibAttrs.values_count
+
+    row[BibAttrs.KEY] = 'key{}'.format(number)
+    row[BibAttrs.TYPE] = random.choice(TYPES)
+    row[BibAttrs.AUTHOR] = ', '.join(random.sample(AUTHORS, 2))
+    row[BibAttrs.TITLE] = 'The {}'.format(' '.join(random.sample(WORDS, 4)))
+    row[BibAttrs.IN_OR_BY] = ' '.join(random.sample(WORDS, 2)).title()
+    row[BibAttrs.YEAR] = random.randint(1950, 2019)
+    row[BibAttrs.ABSTRACT] = ' '.join(random.choices(WORDS, k=40))
+    row[BibAttrs.KEYWORDS] = ', '.join(random.sample(WORDS, 3))
+
+    return row
+
+
+def timed(func, *args):
+
+    start = time.perf_counter()
+
+    for run in range(RUNS):
+        result = func(*args)
+
+    return result, (time.perf_counter() - start) / RUNS
+
+
+def main():
+
+    entries_count = int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES_COUNT
+
+    random.seed(42)
+    index = BibedSearchIndex()
+
+    start = time.perf_counter()
+
+    for number in range(entries_count):
+        index.add(number % 4, 'key{}'.format(number), make_row(number))
+
+    print('Indexed {} entries in {:.3f}s ({} words).'.format(
+          entries_count, time.perf_counter() - start, len(index.words)))
+
+    dbids = (0, 1, 2)
+
+    for query in QUERIES:
+        plan, compile_time = timed(BibedQueryPlan, query)
+
+        # Run once without words cache, to see the cold time.
+        index.words_cache = {}
+        cold_start = time.perf_counter()
+        result = plan.execute(index, dbids)
+        cold_time = time.perf_counter() - cold_start
+
+        result, execute_time = timed(plan.execute, index, dbids)
+
+        print('{:<32} {:>7} results, compile {:8.3f}ms, '
+              'execute {:8.3f}ms (cold {:8.3f}ms)'.format(
+                  query, len(result), compile_time * 1000,
+                  execute_time * 1000, cold_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+'''
+    Data store rows benchmark: compares append time and memory of
+    a Gtk.ListStore holding all `BibAttrs` values (as before search-only
+    and completion-only columns were moved out of GTK), with the slim
+    store actually used by `BibedDataStore`.
+
+    Usage: python3 contrib/storebench.py [entries_count]
+
+    Each variant runs in its own process, for RSS figures to be clean.
+'''
+
+import os
+import sys
+import time
+import random
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bibed import locale  # NOQA
+
+locale.init()
+
+from bibed.constants import BibAttrs  # NOQA
+
+ENTRIES_COUNT = 20000
+
+WORDS = (
+    'history', 'memory', 'city', 'music', 'politics', 'religion', 'war',
+    'economy', 'science', 'language', 'culture', 'society', 'philosophy',
+)
+
+
+def text(words_count):
+
+    return ' '.join(random.choices(WORDS, k=words_count))
+
+
+def make_values(number):
+    ''' All values, with realistic lengths for a humanities library. '''
+
+    values = []
+
+    for column, column_type in enumerate(
+            BibAttrs.as_store_args
+            + [str] * (BibAttrs.values_count - len(BibAttrs.as_store_args))):
+
+        if column_type is int:
+            values.append(random.randint(1950, 2019))
+
+        elif column == BibAttrs.ABSTRACT:
+            values.append(text(150))
+
+        elif column in (BibAttrs.COMMENT, BibAttrs.KEYWORDS):
+            values.append(text(20))
+
+        else:
+            values.append(text(4))
+
+    return values
+
+
+def max_rss_kb():
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(variant, entries_count):
+
+    from bibed.gtk import Gtk
+
+    random.seed(42)
+    rows = [make_values(number) for number in range(entries_count)]
+
+    if variant == 'full':
+        column_types = (
+            BibAttrs.as_store_args
+            + [str] * (BibAttrs.values_count - len(BibAttrs.as_store_args))
+        )
+
+    else:
+        column_types = BibAttrs.as_store_args
+
+    columns_count = len(column_types)
+    store = Gtk.ListStore(*column_types)
+
+    rss_before = max_rss_kb()
+    time_start = time.perf_counter()
+
+    for values in rows:
+        store.append(values[:columns_count])
+
+    duration = time.perf_counter() - time_start
+
+    print('{:<5} {:>3} columns: append {:7.3f}s, RSS +{:>8} KiB'.format(
+          variant, columns_count, duration, max_rss_kb() - rss_before))
+
+
+def main():
+
+    if len(sys.argv) > 2:
+        run(sys.argv[2], int(sys.argv[1]))
+        return
+
+    entries_count = sys.argv[1] if len(sys.argv) > 1 else str(ENTRIES_COUNT)
+
+    for variant in ('full', 'slim'):
+        subprocess.run([sys.executable, __file__, entries_count, variant])
+
+
+if __name__ == '__main__':
+    main()